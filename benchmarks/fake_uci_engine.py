@@ -0,0 +1,101 @@
+"""
+Minimal UCI engine for benchmarks, so EngineManager can be measured without Stockfish.
+It "searches" by sleeping a fixed time per depth and reports deterministic scores.
+
+Usage: python benchmarks/fake_uci_engine.py [milliseconds per depth]
+"""
+import sys
+import threading
+
+import chess
+
+DEPTH_TIME = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.002
+MAX_DEPTH = 99
+
+
+class FakeEngine:
+
+    def __init__(self) -> None:
+        self.board = chess.Board()
+        self.multipv = 1
+        self.stop_event = threading.Event()
+        self.search_thread = None
+
+    def send(self, line: str) -> None:
+        sys.stdout.write(line + '\n')
+        sys.stdout.flush()
+
+    def search(self, board: chess.Board, max_depth: int, search_moves: list[chess.Move] | None) -> None:
+        moves = search_moves or list(board.legal_moves)
+        nodes = 0
+        for depth in range(1, max_depth + 1):
+            if self.stop_event.wait(DEPTH_TIME):
+                break
+            nodes += 1000 * depth
+            for index, move in enumerate(moves[:self.multipv]):
+                score = 10 * (depth % 7) - 5 * index - move.to_square % 3
+                elapsed = max(1, int(depth * DEPTH_TIME * 1000))
+                self.send(f"info depth {depth} seldepth {depth} multipv {index + 1} score cp {score} "
+                          f"nodes {nodes} nps {nodes * 1000 // elapsed} time {elapsed} pv {move.uci()}")
+        self.send(f"bestmove {moves[0].uci() if moves else '0000'}")
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.search_thread is not None:
+            self.search_thread.join()
+            self.search_thread = None
+
+    def handle(self, tokens: list[str]) -> bool:
+        command = tokens[0]
+        if command == "uci":
+            self.send("id name FakeEngine")
+            self.send("option name Threads type spin default 1 min 1 max 512")
+            self.send("option name Hash type spin default 16 min 1 max 33554432")
+            self.send("option name MultiPV type spin default 1 min 1 max 500")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption" and "MultiPV" in tokens:
+            self.multipv = int(tokens[-1])
+        elif command == "ucinewgame":
+            self.board = chess.Board()
+        elif command == "position":
+            self.set_position(tokens[1:])
+        elif command == "go":
+            self.stop()
+            max_depth = int(tokens[tokens.index("depth") + 1]) if "depth" in tokens else MAX_DEPTH
+            search_moves = None
+            if "searchmoves" in tokens:
+                search_moves = [chess.Move.from_uci(uci) for uci in tokens[tokens.index("searchmoves") + 1:]
+                                if len(uci) in (4, 5) and uci[0] in "abcdefgh"]
+            self.stop_event.clear()
+            self.search_thread = threading.Thread(target=self.search,
+                                                  args=(self.board.copy(), max_depth, search_moves))
+            self.search_thread.start()
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+        return True
+
+    def set_position(self, tokens: list[str]) -> None:
+        moves_index = tokens.index("moves") if "moves" in tokens else len(tokens)
+        if tokens[0] == "startpos":
+            self.board = chess.Board()
+        else:
+            self.board = chess.Board(" ".join(tokens[1:moves_index]))
+        for uci in tokens[moves_index + 1:]:
+            self.board.push_uci(uci)
+
+
+def main() -> None:
+    engine = FakeEngine()
+    for line in sys.stdin:
+        tokens = line.split()
+        if tokens and not engine.handle(tokens):
+            break
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+Headless benchmarks for rendering and analysis.
+
+Runs scripted games through App, Board.draw, Statistics and pygame_gui under SDL_VIDEODRIVER=dummy,
+and measures EngineManager latency against benchmarks/fake_uci_engine.py (no Stockfish needed).
+The report is written as JSON, so the files of two commits can be compared:
+
+    python -m benchmarks.run --out bench_output.json
+    python -m benchmarks.run --baseline bench_output.json
+"""
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import chess
+import pygame
+import pygame_gui
+
+import scripts.settings as s
+from scripts.timing import summarize
+from scripts.UI.sprites import SpriteAtlas
+
+FAKE_ENGINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_uci_engine.py')
+
+
+def fake_engine_command(depth_ms: float) -> list[str]:
+    return [sys.executable, FAKE_ENGINE, str(depth_ms)]
+
+
+def scripted_games(count: int, plies: int, seed: int) -> list[list[chess.Move]]:
+    """Random but reproducible games from the starting position"""
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        board = chess.Board()
+        moves = []
+        while len(moves) < plies and not board.is_game_over():
+            move = rng.choice(list(board.legal_moves))
+            board.push(move)
+            moves.append(move)
+        games.append(moves)
+    return games
+
+
+def add_piece_sprites(atlas) -> None:
+    """The piece images, or plain placeholders when img/ is not there (CI checkouts)"""
+    paths = {image_name.split('.')[0]: f'img/Pieces/{image_name}' for image_name in s.IMAGES['img/Pieces']}
+    if all(os.path.exists(path) for path in paths.values()):
+        atlas.add_files('Pieces', paths)
+        return
+    sprites = {}
+    for name in paths:
+        sprites[name] = pygame.Surface((45, 45), pygame.SRCALPHA)
+        color = s.COLORS['white_piece'] if name.isupper() else s.COLORS['black_piece']
+        pygame.draw.circle(sprites[name], color, (22, 22), 18)
+    atlas.add_surfaces('Pieces', sprites)
+
+
+class LatencyProbe:
+    """Measures the time from submit to the first score and to a given depth of one position"""
+
+    def __init__(self, engine, depth: int) -> None:
+        self.depth = depth
+        self.first_score = None
+        self.reached_depth = None
+        self.done = threading.Event()
+        self.start = time.perf_counter()
+        self.unsubscribe = engine.subscribe(self.on_result)
+
+    def on_result(self, board, result) -> None:
+        if self.first_score is None:
+            self.first_score = time.perf_counter() - self.start
+        if self.reached_depth is None and result.depth >= self.depth:
+            self.reached_depth = time.perf_counter() - self.start
+            self.done.set()
+
+    def wait(self, timeout: float = 10.0) -> None:
+        self.done.wait(timeout)
+        self.unsubscribe()
+
+
+def bench_engine(games, depth: int, depth_ms: float) -> dict:
+    from scripts.analysis import EngineManager
+
+    engine = EngineManager(fake_engine_command(depth_ms), cache=None, target_depth=depth, max_depth=depth)
+    first_scores = []
+    depth_times = []
+    for moves in games:
+        board = chess.Board()
+        engine.new_game()
+        for move in moves:
+            board.push(move)
+            probe = LatencyProbe(engine, depth)
+            engine.submit(board)
+            probe.wait()
+            if probe.first_score is not None:
+                first_scores.append(probe.first_score)
+            if probe.reached_depth is not None:
+                depth_times.append(probe.reached_depth)
+    engine.quit()
+    return {
+        "depth": depth,
+        "positions": sum(len(moves) for moves in games),
+        "first_score_ms": summarize(first_scores, 1000),
+        "time_to_depth_ms": summarize(depth_times, 1000),
+        "engine_cpu_seconds": engine.total_cpu_seconds,
+    }
+
+
+def bench_components(screen, sprites, games, frames_per_ply: int, engine) -> dict:
+    from scripts.game.board import Board
+    from scripts.game.session import GameSession
+    from scripts.game.statistics import Statistics
+
+    ui_manager = pygame_gui.UIManager(s.SIZE)
+    board = Board(720, (0, 0), sprites)
+    statistics = Statistics((730, 10), (1080-720-20, 720), sprites, ui_manager)
+
+    board_times, statistics_times, ui_times = [], [], []
+    for moves in games:
+        session = GameSession()
+        board.set_session(session)
+        for move in moves:
+            engine.submit(session.board)
+            for frame in range(frames_per_ply):
+                # Half of the frames drag the piece of the next move across the board
+                dragging = frame >= frames_per_ply // 2
+                board.active_square_index = (chess.square_file(move.from_square), chess.square_rank(move.from_square)) \
+                    if dragging else None
+                mouse_pos = (frame * 720 // frames_per_ply, 360)
+
+                start = time.perf_counter()
+                board.draw(screen, mouse_pos)
+                board.pop_dirty_rects()
+                board_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                statistics.update(board, engine)
+                statistics.draw(screen)
+                statistics_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                ui_manager.update(0.016)
+                ui_manager.draw_ui(screen)
+                ui_times.append(time.perf_counter() - start)
+            board.active_square_index = None
+            session.push(move)
+
+    return {
+        "board_draw_ms": summarize(board_times, 1000),
+        "statistics_ms": summarize(statistics_times, 1000),
+        "ui_draw_ms": summarize(ui_times, 1000),
+    }
+
+
+def bench_app(games, frames_per_ply: int) -> dict:
+    from scripts.app import App
+    from scripts.game.session import GameSession
+
+    class BenchmarkApp(App):
+        def load_group_images(self, group_name: str) -> None:
+            add_piece_sprites(self.sprites)
+
+    app = BenchmarkApp()
+    frame_times = []
+    for moves in games:
+        session = GameSession()
+        app.board.set_session(session)
+        for move in moves:
+            for _ in range(frames_per_ply):
+                start = time.perf_counter()
+                app.update()
+                frame_times.append(time.perf_counter() - start)
+            session.push(move)
+    app.engine.quit()
+    return {"frame_ms": summarize(frame_times, 1000), "frames": len(frame_times)}
+
+
+def bench_broadcast(moves: list[chess.Move], counts: list[int], ticks_per_ply: int = 20) -> dict:
+    """Fan-out of one game to many local spectators; one in a hundred never reads and gets skipped ahead"""
+    import tracemalloc
+    from scripts.game.session import GameSession
+    from scripts.network.broadcast import BroadcastChannel
+    from scripts.network.protocol import encode
+
+    results = {}
+    for count in counts:
+        session = GameSession()
+        channel = BroadcastChannel(lambda: {"fen": session.board.fen(), "ply": session.ply,
+                                            "white_graveyard": session.white_graveyard,
+                                            "black_graveyard": session.black_graveyard})
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        subscribers = [channel.subscribe() for _ in range(count)]
+        memory = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        now = 0.0  # Simulated clock, ticks come every 10 ms
+        for move in moves:
+            session.push(move)
+            channel.publish_move(encode({"type": "delta", "ply": session.ply, "move": move.uci()}))
+            for tick in range(ticks_per_ply):
+                now += 0.01
+                channel.publish_eval({"type": "eval", "ply": session.ply, "score": "0.3", "depth": tick + 1}, now)
+            for i, subscriber in enumerate(subscribers):
+                if i % 100:
+                    subscriber.pop_all()
+        stats = channel.stats()
+        results[str(count)] = {
+            "bytes_per_subscriber": memory / count,
+            "messages": stats["messages"],
+            "coalesced_evals": stats["coalesced_evals"],
+            "skipped": stats["skipped"],
+            "fan_out_ms": stats["fan_out_ms"],
+        }
+    return results
+
+
+def bench_grid(screen, sprites, games: list[list[chess.Move]], boards: int, frames: int) -> dict:
+    """Grid of boards where every board makes a move every frame, the worst case for the render budget"""
+    from scripts.game.board_grid import BoardGrid
+    from scripts.game.session import GameSession
+
+    class Game:
+        def __init__(self, game_id):
+            self.game_id, self.session, self.score = game_id, GameSession(), None
+
+    watched = [Game(i + 1) for i in range(boards)]
+    grid = BoardGrid(720, (0, 0), sprites)
+    grid.set_games(watched)
+    grid.draw(screen, (0, 0))  # First render of every tile is not part of the measurement
+
+    draw_times = []  # Moves are applied outside of the measurement, like the network feed does before drawing
+    for frame in range(frames):
+        for i, game in enumerate(watched):
+            moves = games[i % len(games)]
+            if game.session.ply >= len(moves):
+                game.session = GameSession()
+            game.session.push(moves[game.session.ply])
+        start = time.perf_counter()
+        screen.fill(s.COLORS['background'])
+        grid.draw(screen, (0, 0))
+        pygame.display.update(grid.pop_dirty_rects())
+        draw_times.append(time.perf_counter() - start)
+    return {"boards": boards, "renders_per_frame": grid.renders_per_frame, "renders": grid.renders,
+            "draw_ms": summarize(draw_times, 1000)}
+
+
+def bench_tree(screen, nodes: int, seed: int, frames: int = 50) -> dict:
+    """Variation tree of random lines, panned at several zoom levels; every frame is a full render"""
+    from scripts.camera import Camera
+    from scripts.game.move_tree import MoveTree, SOURCE_ENGINE
+    from scripts.game.tree_explorer import TreeExplorer
+
+    rng = random.Random(seed)
+    tree = MoveTree()
+    while len(tree) < nodes:  # Mostly the first legal move, so lines share long prefixes like engine PVs do
+        board = chess.Board()
+        moves = []
+        for _ in range(rng.randint(5, 40)):
+            legal = list(board.legal_moves)
+            if not legal:
+                break
+            move = legal[0] if rng.random() < 0.7 else rng.choice(legal)
+            board.push(move)
+            moves.append(move)
+        tree.add_line(moves, SOURCE_ENGINE)
+
+    start = time.perf_counter()
+    tree.layout()
+    layout_ms = (time.perf_counter() - start) * 1000
+
+    camera = Camera(0, 0, 16, (720, 720))
+    explorer = TreeExplorer(720, (0, 0), camera, tree)
+    zoom_levels = {}
+    for distance in (16, 40, 512, 8192):
+        explorer.center_on(0)
+        camera.distance = distance
+        draw_times = []
+        visible = []
+        for frame in range(frames):
+            camera.y += distance / 100  # Panning down, a new render every frame
+            start = time.perf_counter()
+            explorer.draw(screen, (0, 0))
+            draw_times.append(time.perf_counter() - start)
+            visible.append(explorer.visible)
+        zoom_levels[str(distance)] = {"visible": max(visible), "draw_ms": summarize(draw_times, 1000)}
+    return {"nodes": len(tree), "layout_ms": layout_ms, "zoom": zoom_levels}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict | None = None, prefix: str = '') -> None:
+    """Prints p50/p99 of every timing, next to the baseline ones if there is a baseline"""
+    for key, value in report.items():
+        if not isinstance(value, dict):
+            continue
+        old = baseline.get(key) if baseline is not None else None
+        if "p50" not in value:
+            if baseline is None or old is not None:
+                compare(value, old, prefix + key + '.')
+        elif old is None:
+            print(f"{prefix + key:40} p50 {value['p50']:8.3f}   p99 {value['p99']:8.3f}")
+        else:
+            print(f"{prefix + key:40} p50 {old['p50']:8.3f} -> {value['p50']:8.3f}   "
+                  f"p99 {old['p99']:8.3f} -> {value['p99']:8.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless frame-time and engine-latency benchmarks")
+    parser.add_argument('--games', type=int, default=3)
+    parser.add_argument('--plies', type=int, default=40)
+    parser.add_argument('--frames', type=int, default=10, help="Frames drawn per ply")
+    parser.add_argument('--depth', type=int, default=10, help="Depth for the time-to-depth measurement")
+    parser.add_argument('--depth-ms', type=float, default=2.0, help="Search time of the fake engine per depth")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[1000, 10000],
+                        help="Spectator counts for the broadcast fan-out")
+    parser.add_argument('--tree-nodes', type=int, default=30000, help="Nodes of the variation tree")
+    parser.add_argument('--out', default='bench_output.json')
+    parser.add_argument('--baseline', help="Earlier report to compare with")
+    args = parser.parse_args()
+
+    # Every engine in this process is the fake one, and nothing is read from or written to the disk cache
+    s.ENGINE_PATH = fake_engine_command(args.depth_ms)
+    s.EVAL_CACHE_PATH = None
+    s.SCHEDULING = 'continuous'
+    s.FPS = 0
+    s.SPRITE_CACHE_DIR = None
+    s.ARCHIVE_DIR = None
+
+    games = scripted_games(args.games, args.plies, args.seed)
+
+    pygame.init()
+    screen = pygame.display.set_mode(s.SIZE)
+    sprites = SpriteAtlas(None)
+    add_piece_sprites(sprites)
+
+    from scripts.analysis import EngineManager
+    engine = EngineManager(s.ENGINE_PATH)
+    components = bench_components(screen, sprites, games, args.frames, engine)
+    engine.quit()
+
+    report = {
+        "commit": git_commit(),
+        "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "arguments": vars(args),
+        "components": components,
+        "app": bench_app(games, args.frames),
+        "engine": bench_engine(games, args.depth, args.depth_ms),
+        "broadcast": bench_broadcast(games[0], args.subscribers),
+        "grid": bench_grid(screen, sprites, games, 64, 200),
+        "tree": bench_tree(screen, args.tree_nodes, args.seed),
+    }
+
+    with open(args.out, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            compare(report, json.load(file))
+    else:
+        compare(report)
+
+
+if __name__ == "__main__":
+    main()
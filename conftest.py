@@ -0,0 +1 @@
+# Lets pytest import the scripts package when it is run from the repository root
@@ -1,10 +1,28 @@
 # Python version: 3.11.2
 
+import argparse
 import sys
+from scripts.timing import StartupReport
+
+startup = StartupReport()
 from scripts.app import App
+import scripts.settings as s
+startup.mark('imports')
 
 if __name__ == "__main__":
-    app = App()
+    parser = argparse.ArgumentParser(description=s.NAME)
+    parser.add_argument('--host', nargs='?', type=int, const=s.NETWORK_PORT, metavar='PORT',
+                        help="Host a game as White for a second player")
+    parser.add_argument('--join', metavar='HOST:PORT', help="Join a hosted game as Black")
+    parser.add_argument('--game', type=int, default=1, help="Game id to join on the server")
+    parser.add_argument('--watch', metavar='HOST:PORT', help="Watch the games of a server in a grid")
+    parser.add_argument('--watch-games', type=int, default=16, help="Games 1..N shown in the grid (4-64)")
+    args = parser.parse_args()
+    if not 4 <= args.watch_games <= 64:
+        parser.error("--watch-games must be between 4 and 64")
+
+    app = App(startup, host_port=args.host, join_address=args.join, join_game=args.game,
+              watch_address=args.watch, watch_games=args.watch_games)
 
     while True:
-        app.update()
\ No newline at end of file
+        app.update()
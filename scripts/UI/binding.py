@@ -0,0 +1,30 @@
+_UNSET = object()
+
+
+# Class Binding - connects a model value with a widget. apply(value) runs only when the value
+# changes, so widgets are not re-rendered or rebuilt every frame for the same value.
+class Binding:
+
+    def __init__(self, apply) -> None:
+        self.apply = apply
+        self.value = _UNSET
+
+        self.applied = 0
+        self.skipped = 0
+
+    def set(self, value) -> bool:
+        """:return: True if the value changed and the widget was updated"""
+        if self.value is not _UNSET and value == self.value:
+            self.skipped += 1
+            return False
+        self.value = value
+        self.apply(value)
+        self.applied += 1
+        return True
+
+    def invalidate(self) -> None:
+        """The next set applies the value even if it is the same"""
+        self.value = _UNSET
+
+    def stats(self) -> dict:
+        return {"applied": self.applied, "skipped": self.skipped}
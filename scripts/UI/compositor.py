@@ -0,0 +1,88 @@
+import heapq
+import itertools
+
+import pygame
+
+
+# Class Overlay - one pre-rendered layer over the scene. It is placed at a fixed position, or next to
+# the mouse when it has an offset instead.
+class Overlay:
+
+    __slots__ = ('surface', 'position', 'mouse_offset', 'expires_at')
+
+    def __init__(self, surface: pygame.Surface, position=None, mouse_offset=None, expires_at=None) -> None:
+        self.surface = surface
+        self.position = position
+        self.mouse_offset = mouse_offset
+        self.expires_at = expires_at  # None shows it until it is hidden
+
+    def get_rect(self, mouse_pos) -> pygame.Rect:
+        if self.mouse_offset is not None:
+            position = (mouse_pos[0] + self.mouse_offset[0], mouse_pos[1] + self.mouse_offset[1])
+        else:
+            position = self.position
+        return self.surface.get_rect(topleft=position)
+
+
+# Class Compositor - overlays such as notifications, the promotion picker and the end-of-game banner.
+# Every overlay is rendered once to its own surface by its owner, so a frame costs one blit per active
+# overlay. Timed overlays wait in a heap ordered by expiry: a frame looks only at the earliest one, and
+# entries of overlays that were hidden or shown again meanwhile are skipped when they come up.
+class Compositor:
+
+    def __init__(self) -> None:
+        self.overlays = {}  # key -> Overlay, drawn in the order they were shown
+        self.timers = []  # Heap of (expires_at, sequence, key)
+        self.sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.overlays)
+
+    def show(self, key, surface: pygame.Surface, position=None, mouse_offset=None,
+             duration: float | None = None, now: float | None = None) -> None:
+        """
+        Shows the surface on top of the other overlays, in place of an overlay with the same key
+        :param duration: Seconds until it is hidden, None keeps it until hide()
+        """
+        expires_at = None
+        if duration is not None:
+            expires_at = (get_time() if now is None else now) + duration
+            heapq.heappush(self.timers, (expires_at, next(self.sequence), key))
+        self.overlays.pop(key, None)
+        self.overlays[key] = Overlay(surface, position, mouse_offset, expires_at)
+
+    def hide(self, key) -> None:
+        self.overlays.pop(key, None)
+
+    def is_shown(self, key) -> bool:
+        return key in self.overlays
+
+    def expire(self, now: float | None = None) -> bool:
+        """Hides the overlays whose time is over, True if any was hidden"""
+        now = get_time() if now is None else now
+        expired = False
+        while self.timers and self.timers[0][0] <= now:
+            expires_at, _, key = heapq.heappop(self.timers)
+            overlay = self.overlays.get(key)
+            if overlay is not None and overlay.expires_at == expires_at:
+                del self.overlays[key]
+                expired = True
+        return expired
+
+    def next_expiry(self) -> float | None:
+        """Time the next overlay may be hidden, e.g. to know how long the app can sleep"""
+        return self.timers[0][0] if self.timers else None
+
+    def draw(self, screen, mouse_pos) -> list[pygame.Rect]:
+        """:return: Areas of the screen covered by the overlays"""
+        rects = []
+        for overlay in self.overlays.values():
+            rect = overlay.get_rect(mouse_pos)
+            screen.blit(overlay.surface, rect)
+            rects.append(rect)
+        return rects
+
+
+def get_time() -> float:
+    """Seconds on the pygame clock, the time base of every timed overlay"""
+    return pygame.time.get_ticks() / 1000.0
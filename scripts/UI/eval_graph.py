@@ -0,0 +1,113 @@
+import pygame
+
+from scripts.settings import COLORS
+from scripts.game.eval_history import EvalHistory
+
+
+# Class EvalGraph - evaluation over the plies of a game, rendered into a cached surface.
+# Only the part from the first changed ply on is redrawn; the whole surface only when the game
+# outgrows the x scale (it doubles). Long games are downsampled to the min and max of every column.
+class EvalGraph:
+
+    def __init__(self, position: tuple[int, int], size: tuple[int, int], history: EvalHistory,
+                 min_plies: int = 40, max_score: int = 1000) -> None:
+        self.rect = pygame.Rect(position, size)
+        self.history = history
+        self.max_score = max_score  # Centipawns at the top and bottom edge
+        self.min_plies = min_plies
+        self.capacity = min_plies  # Plies the x axis spans
+
+        self.surface = pygame.Surface(size)
+        self.drawn_plies = 0
+
+        self.full_redraws = 0
+        self.partial_redraws = 0
+
+        self._render_from(0)
+
+    def x_of(self, ply: int) -> float:
+        return ply * (self.rect.width - 1) / self.capacity
+
+    def y_of(self, score: int) -> int:
+        score = max(-self.max_score, min(self.max_score, score))
+        half = self.rect.height / 2 - 2
+        return round(self.rect.height / 2 - score * half / self.max_score)
+
+    def refresh(self) -> bool:
+        """Brings the surface up to date with the history, returns True if anything was redrawn"""
+        plies = len(self.history)
+        changed_from = self.history.pop_changed_from()
+        if changed_from is None:
+            return False
+
+        capacity = self.min_plies
+        while capacity < plies - 1:
+            capacity *= 2
+        if capacity != self.capacity:
+            self.capacity = capacity
+            changed_from = 0
+
+        if changed_from == 0:
+            self.full_redraws += 1
+        else:
+            self.partial_redraws += 1
+        self._render_from(min(changed_from, self.drawn_plies))
+        self.drawn_plies = plies
+        return True
+
+    def _render_from(self, ply: int) -> None:
+        width, height = self.rect.size
+        x_start = int(self.x_of(max(0, ply - 1)))
+        self.surface.fill(COLORS['black_piece'], (x_start, 0, width - x_start, height))
+        pygame.draw.line(self.surface, COLORS['dark_square'], (x_start, height // 2), (width - 1, height // 2))
+
+        first = max(0, ply - 2)
+        if self.capacity <= width:
+            self._draw_lines(first)
+        else:
+            self._draw_columns(first)
+
+    def _draw_lines(self, first: int) -> None:
+        previous = None
+        for ply in range(first, len(self.history)):
+            score = self.history.score_at(ply)
+            if score is None:
+                previous = None
+                continue
+            point = (round(self.x_of(ply)), self.y_of(score))
+            if previous is not None:
+                pygame.draw.line(self.surface, COLORS['white_piece'], previous, point, 2)
+            previous = point
+
+    def _draw_columns(self, first: int) -> None:
+        """Several plies per pixel column: a vertical line from their min to max, joined to the previous column"""
+        columns = {}  # x -> [first score, min, max, last score]
+        for ply in range(first, len(self.history)):
+            score = self.history.score_at(ply)
+            if score is None:
+                continue
+            column = columns.get(int(self.x_of(ply)))
+            if column is None:
+                columns[int(self.x_of(ply))] = [score, score, score, score]
+            else:
+                column[1], column[2], column[3] = min(column[1], score), max(column[2], score), score
+
+        previous = None
+        for x, (first_score, low, high, last_score) in columns.items():
+            if previous is not None:
+                pygame.draw.line(self.surface, COLORS['white_piece'], previous, (x, self.y_of(first_score)))
+            pygame.draw.line(self.surface, COLORS['white_piece'], (x, self.y_of(high)), (x, self.y_of(low)))
+            previous = (x, self.y_of(last_score))
+
+    def ply_at(self, mouse_pos) -> int | None:
+        """Ply of the point under the mouse, None outside the graph or before any evaluation"""
+        if not self.rect.collidepoint(mouse_pos) or len(self.history) == 0:
+            return None
+        ply = round((mouse_pos[0] - self.rect.x) * self.capacity / (self.rect.width - 1))
+        return min(ply, len(self.history) - 1)
+
+    def draw(self, screen, selected_ply: int | None = None) -> None:
+        screen.blit(self.surface, self.rect)
+        if selected_ply is not None:
+            x = self.rect.x + round(self.x_of(selected_ply))
+            pygame.draw.line(screen, COLORS['check_highlight'], (x, self.rect.top), (x, self.rect.bottom - 1), 2)
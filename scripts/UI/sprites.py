@@ -0,0 +1,81 @@
+import hashlib
+import os
+
+import pygame
+
+
+# Class SpriteAtlas - every sprite group is rasterized once per target size and shared by all consumers.
+# Rasterized atlases are stored on disk as one PNG strip, keyed by a hash of the source files and the size,
+# so the SVGs are decoded only the first time a size is needed.
+class SpriteAtlas:
+
+    def __init__(self, cache_dir: str | None = 'cache/sprites') -> None:
+        self.cache_dir = cache_dir
+        self.sources = {}  # group -> {name: path}
+        self.source_surfaces = {}  # group -> {name: surface}, for groups without files
+        self.source_hashes = {}  # group -> hash of the source files
+        self.atlases = {}  # (group, size) -> {name: surface}
+
+        self.disk_hits = 0
+        self.rasterized = 0
+
+    def add_files(self, group: str, paths: dict[str, str]) -> None:
+        """Registers the image files of a group, nothing is decoded yet"""
+        self.sources[group] = dict(sorted(paths.items()))
+        digest = hashlib.sha1()
+        for name, path in self.sources[group].items():
+            digest.update(name.encode())
+            with open(path, 'rb') as file:
+                digest.update(file.read())
+        self.source_hashes[group] = digest.hexdigest()[:16]
+
+    def add_surfaces(self, group: str, surfaces: dict[str, pygame.Surface]) -> None:
+        """Registers already loaded images, these are scaled but not cached on disk"""
+        self.source_surfaces[group] = dict(sorted(surfaces.items()))
+
+    def get(self, group: str, size: int) -> dict[str, pygame.Surface]:
+        """Sprites of the group as size x size surfaces. Do not draw on them, they are shared."""
+        key = (group, size)
+        if key not in self.atlases:
+            self.atlases[key] = self._load(group, size)
+        return self.atlases[key]
+
+    def _load(self, group: str, size: int) -> dict[str, pygame.Surface]:
+        if group in self.source_surfaces:
+            self.rasterized += 1
+            return {name: pygame.transform.smoothscale(surface.convert_alpha(), (size, size))
+                    for name, surface in self.source_surfaces[group].items()}
+
+        names = list(self.sources[group])
+        cache_path = self._cache_path(group, size)
+        if cache_path is not None and os.path.exists(cache_path):
+            strip = pygame.image.load(cache_path)
+            self.disk_hits += 1
+        else:
+            strip = pygame.Surface((size * len(names), size), pygame.SRCALPHA)
+            for i, name in enumerate(names):
+                strip.blit(self._rasterize(self.sources[group][name], size), (i * size, 0))
+            self.rasterized += 1
+            if cache_path is not None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                pygame.image.save(strip, cache_path)
+
+        if pygame.display.get_surface() is not None:
+            strip = strip.convert_alpha()
+        return {name: strip.subsurface((i * size, 0, size, size)) for i, name in enumerate(names)}
+
+    def _cache_path(self, group: str, size: int) -> str | None:
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, f"{group}_{size}_{self.source_hashes[group]}.png")
+
+    @staticmethod
+    def _rasterize(path: str, size: int) -> pygame.Surface:
+        # pygame-ce renders SVGs directly at the target size, which is sharper than scaling afterwards
+        load_sized_svg = getattr(pygame.image, 'load_sized_svg', None)
+        if load_sized_svg is not None and path.endswith('.svg'):
+            image = load_sized_svg(path, (size, size))
+            if image.get_size() == (size, size):
+                return image
+            return pygame.transform.smoothscale(image, (size, size))
+        return pygame.transform.smoothscale(pygame.image.load(path), (size, size))
@@ -1,28 +1,92 @@
 import pygame
+from collections import OrderedDict
+
+
+# Class TextSurfaceCache - keeps rendered text surfaces, so the same string is rendered only once.
+# The least recently used surfaces are dropped when the cache takes more than max_bytes.
+class TextSurfaceCache:
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.surfaces = OrderedDict()  # (text, font key, color, antialias) -> surface
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, font, font_key, text, color, antialias) -> pygame.Surface:
+        key = (text, font_key, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        self.bytes += self._surface_bytes(surface)
+        while self.bytes > self.max_bytes and len(self.surfaces) > 1:
+            _, evicted = self.surfaces.popitem(last=False)
+            self.bytes -= self._surface_bytes(evicted)
+            self.evictions += 1
+        return surface
+
+    def clear(self) -> None:
+        self.surfaces.clear()
+        self.bytes = 0
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "surfaces": len(self.surfaces),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,  # Every miss is one font.render call
+            "hit_rate": self.hit_rate(),
+            "evictions": self.evictions,
+        }
+
+    @staticmethod
+    def _surface_bytes(surface: pygame.Surface) -> int:
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
 
 
 # Class Text - represents text in the model (this class optimizes the use of fonts and a text surface
 # because pygame.font.Font is very slow)
 class Text:
-    fonts = {}  # Dictionary of fonts
+    fonts = {}  # Dictionary of fonts, key is (type_font, size_font)
+    cache = TextSurfaceCache()  # Rendered surfaces shared by all texts
 
-    def __init__(self, text, color, size_font, type_font=None) -> None:
+    def __init__(self, text, color, size_font, type_font=None, antialias=True) -> None:
         self.color = color
-        
-        if size_font in Text.fonts:
-            self.font = Text.fonts[size_font]
+        self.antialias = antialias
+        self.font_key = (type_font, size_font)
+
+        if self.font_key in Text.fonts:
+            self.font = Text.fonts[self.font_key]
         else:
             if type_font:
                 self.font = pygame.font.Font("fonts/" + type_font + ".ttf", size_font)
             else:
                 self.font = pygame.font.Font(None, size_font)
-            Text.fonts[size_font] = self.font
-        self.text_surface = self.font.render(text, True, color)
+            Text.fonts[self.font_key] = self.font
+        self.text_surface = Text.cache.render(self.font, self.font_key, text, color, antialias)
+
+    @staticmethod
+    def clear_cache() -> None:
+        Text.fonts = {}
+        Text.cache.clear()
 
     def update_text(self, text, color = None) -> None:
         if color:
             self.color = color
-        self.text_surface = self.font.render(text, True, self.color)
+        self.text_surface = Text.cache.render(self.font, self.font_key, text, self.color, self.antialias)
 
     def print(self, screen, pos, center=True) -> None:
         if center:
@@ -1,61 +1,422 @@
+import asyncio
 import chess
 import chess.engine
 import threading
 import time
+from collections import deque
+
+from scripts.eval_cache import CachedEval, EvalCache, position_key
+from scripts.probe import PositionProbe, ProbeResult
+from scripts.settings import (ANALYSIS_TARGET_DEPTH, ANALYSIS_MAX_DEPTH, ANALYSIS_MULTI_PV,
+                             ANALYSIS_WORKERS, ENGINE_OPTIONS, ANALYSIS_BUDGET_DEPTH,
+                             ANALYSIS_BUDGET_TIME, ANALYSIS_BUDGET_NODES, ANALYSIS_MORE_DEPTH,
+                             ANALYSIS_MORE_TIME)
+
+def format_score(score_obj) -> str:
+    """Formats a PovScore from White's point of view, like '+M3' or '-1.2'"""
+    white_score = score_obj.white()
+    if white_score.is_mate():
+        mate_moves = white_score.mate()
+        if mate_moves > 0:
+            return f"+M{mate_moves}"  # White is winning
+        else:
+            return f"-M{-mate_moves}" # Black is winning
+    else:
+        cp = white_score.score()
+        if cp is None: return "0.0"
+        return f"{cp / 100.0:.1f}"
+
+
+class AnalysisLine:
+    """One principal variation reported by the engine"""
+
+    __slots__ = ('score', 'depth', 'pv', 'nodes')
+
+    def __init__(self, score: chess.engine.PovScore, depth: int, pv: list[chess.Move], nodes: int = 0) -> None:
+        self.score = score
+        self.depth = depth
+        self.pv = pv
+        self.nodes = nodes
+
+    @classmethod
+    def from_info(cls, info: dict) -> 'AnalysisLine | None':
+        if "score" not in info:
+            return None
+        return cls(info["score"], info.get("depth", 0), info.get("pv", []), info.get("nodes", 0))
+
+    def to_info(self) -> dict:
+        return {"score": self.score, "depth": self.depth, "pv": self.pv, "nodes": self.nodes}
+
+    def score_str(self) -> str:
+        return format_score(self.score)
+
+    def pv_san(self, board: chess.Board, max_moves: int = 6) -> str:
+        try:
+            return board.variation_san(self.pv[:max_moves])
+        except ValueError:
+            return ""  # PV that does not fit the position (should not happen)
+
+
+class AnalysisResult:
+    """The best lines of a position aggregated over all engine workers, best first"""
+
+    def __init__(self, board: chess.Board, lines: list[AnalysisLine], depth: int, nodes: int = 0, nps: int = 0,
+                 source: str = 'engine') -> None:
+        self.board = board
+        self.lines = lines
+        self.depth = depth
+        self.nodes = nodes
+        self.nps = nps
+        self.source = source  # 'engine', 'cache', 'book' or 'tablebase'
+
+    @property
+    def best(self) -> AnalysisLine | None:
+        return self.lines[0] if self.lines else None
+
+
+class AnalysisBudget:
+    """Limits of the search of one position, None means no limit on that axis"""
+
+    def __init__(self, depth: int | None = ANALYSIS_BUDGET_DEPTH, time: float | None = ANALYSIS_BUDGET_TIME,
+                 nodes: int | None = ANALYSIS_BUDGET_NODES) -> None:
+        self.depth = depth
+        self.time = time
+        self.nodes = nodes
+
+    def is_exhausted(self, depth: int, seconds: float, nodes: int) -> bool:
+        return (self.depth is not None and depth >= self.depth) or \
+               (self.time is not None and seconds >= self.time) or \
+               (self.nodes is not None and nodes >= self.nodes)
+
+    def extended(self, depth: int = 0, time: float = 0.0, nodes: int = 0) -> 'AnalysisBudget':
+        return AnalysisBudget(
+            None if self.depth is None else self.depth + depth,
+            None if self.time is None else self.time + time,
+            None if self.nodes is None else self.nodes + nodes
+        )
+
 
 class EngineManager:
-    def __init__(self, path):
+    """
+    Runs a UCI engine on its own asyncio event loop (in a daemon thread).
+    submit() and subscribe() are thread-safe and never block the caller.
+
+    Every submitted position gets a fresh budget. The search stops when it is used up, and
+    request_more() extends it; the engine hash keeps the work already done. pause() stops
+    searching (e.g. while the window is in the background) until resume().
+    Positions found in the opening book or the tablebases of the probe are not searched at all.
+    """
+
+    def __init__(self, path, cache: EvalCache | None = None,
+                 target_depth: int = ANALYSIS_TARGET_DEPTH, max_depth: int = ANALYSIS_MAX_DEPTH,
+                 options: dict = ENGINE_OPTIONS, multipv: int = ANALYSIS_MULTI_PV, workers: int = ANALYSIS_WORKERS,
+                 budget: AnalysisBudget | None = None, probe: PositionProbe | None = None):
         self.path = path
+        self.cache = cache
+        self.target_depth = target_depth  # Cached evals this deep are not searched again, unless request_more asks
+        self.max_depth = max_depth
+        self.options = options  # UCI options like Threads and Hash, sent to every worker
+        self.multipv = multipv
+        self.workers = max(1, workers)  # With more than one, the root moves are split between engines
         self.current_score = "0.0"
         self.current_depth = 0
+        self.current_result = None
         self.board_to_analyze = None
         self.running = True
-        
-        self.thread = threading.Thread(target=self._engine_loop, daemon=True)
+
+        self.probe = probe
+        self.budget = budget if budget is not None else AnalysisBudget()
+        # Budget of budget_board, extended by request_more, and the seconds and nodes already searched
+        # on it. The three are only changed on the engine thread, so a search of an older position
+        # cannot add to the budget of a newer one.
+        self.budget_board = None
+        self.position_budget = self.budget
+        self.position_spent = (0.0, 0)
+        self.position_extended = False  # request_more was called, cached evals of target_depth do not end it
+        self.paused = False
+
+        # Engine time reported by the workers (info 'time' x Threads)
+        self.game_cpu_seconds = 0.0
+        self.total_cpu_seconds = 0.0
+
+        # Engine processes live for the whole session, see _get_protocol
+        self.transports = [None] * self.workers
+        self.protocols = [None] * self.workers
+        self.game = object()  # Changing this key makes python-chess send 'ucinewgame'
+        self.restarts = 0
+
+        # Latency from submit to the first score of that position (seconds)
+        self.requested_at = None
+        self.first_score_latency = None
+        self.latency_samples = deque(maxlen=100)
+
+        self.subscribers = []
+        self.task = None  # In-flight analysis
+        self.schedule_lock = asyncio.Lock()  # One request at a time stops the old search and starts the next
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
         self.thread.start()
+        if self.cache is not None and not self.cache.loaded:
+            # Reading a large cache file should not delay the caller; it is done before any position
+            self.loop.call_soon_threadsafe(self.cache.load)
 
-    def start_analysis(self, board):
+    def submit(self, board):
+        """Analyze this position instead of the current one (thread-safe)"""
+        self.requested_at = time.perf_counter()
         self.board_to_analyze = board.copy()
+        asyncio.run_coroutine_threadsafe(self._schedule(self.board_to_analyze), self.loop)
 
-    def _analyze_score(self, score_obj):
-        """Helper to format the score correctly"""
-        white_score = score_obj.white()
-        if white_score.is_mate():
-            mate_moves = white_score.mate()
-            if mate_moves > 0:
-                return f"+M{mate_moves}"  # White is winning
-            else:
-                return f"-M{-mate_moves}" # Black is winning
-        else:
-            cp = white_score.score()
-            if cp is None: return "0.0"
-            return f"{cp / 100.0:.1f}"
-
-    def _engine_loop(self):
-        while self.running:
-            if self.board_to_analyze is None:
-                time.sleep(0.1)
+    start_analysis = submit
+
+    def subscribe(self, callback):
+        """
+        Calls callback(board, result) from the engine thread with every new AnalysisResult.
+        :return: Function that removes the subscription
+        """
+        self.subscribers = self.subscribers + [callback]
+
+        def unsubscribe():
+            self.subscribers = [s for s in self.subscribers if s is not callback]
+        return unsubscribe
+
+    def new_game(self):
+        """Next analysis will reset the engine state with 'ucinewgame'"""
+        self.game = object()
+        self.game_cpu_seconds = 0.0
+
+    def pause(self):
+        """Stops searching until resume(), cached evaluations are still shown"""
+        self.paused = True
+        asyncio.run_coroutine_threadsafe(self._cancel(), self.loop)
+
+    def resume(self):
+        """Continues the current position with what is left of its budget"""
+        if not self.paused:
+            return
+        self.paused = False
+        asyncio.run_coroutine_threadsafe(self._schedule(self.board_to_analyze), self.loop)
+
+    def request_more(self, depth: int = ANALYSIS_MORE_DEPTH, time: float = ANALYSIS_MORE_TIME,
+                     nodes: int | None = None):
+        """Extends the budget of the current position and searches on from the reached depth"""
+        if nodes is None:
+            nodes = self.budget.nodes or 0
+        self.paused = False
+        # Also searches book positions, the book has no evaluation of its own
+        asyncio.run_coroutine_threadsafe(self._schedule(self.board_to_analyze, False, (depth, time, nodes)), self.loop)
+
+    def is_searching(self) -> bool:
+        task = self.task
+        return task is not None and not task.done()
+
+    def get_cpu_stats(self) -> dict:
+        return {"game_cpu_seconds": self.game_cpu_seconds, "total_cpu_seconds": self.total_cpu_seconds}
+
+    def average_first_score_latency(self) -> float | None:
+        if not self.latency_samples:
+            return None
+        return sum(self.latency_samples) / len(self.latency_samples)
+
+    def quit(self, timeout: float = 2.0):
+        if not self.running:
+            return
+        self.running = False
+        future = asyncio.run_coroutine_threadsafe(self._quit(), self.loop)
+        try:
+            future.result(timeout)
+        except Exception as e:
+            print(f"Engine Error: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _quit(self):
+        await self._cancel()
+        for worker, protocol in enumerate(self.protocols):
+            if protocol is None:
                 continue
+            try:
+                await asyncio.wait_for(protocol.quit(), 1.0)
+            except (asyncio.TimeoutError, chess.engine.EngineError, chess.engine.EngineTerminatedError):
+                self.transports[worker].close()
+            self.protocols[worker] = None
+
+    async def _cancel(self):
+        """Stops the search and waits until it has ended, so it never overlaps the next one"""
+        task, self.task = self.task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _schedule(self, board, use_probe: bool = True, extension: tuple | None = None):
+        """:param extension: (depth, time, nodes) added to the budget of the position"""
+        if not self.running or board is None or board is not self.board_to_analyze:
+            return  # A newer position has been submitted already
+        if board is not self.budget_board:
+            self.budget_board = board
+            self.position_budget = self.budget
+            self.position_spent = (0.0, 0)
+            self.position_extended = False
+        if extension is not None:
+            self.position_budget = self.position_budget.extended(*extension)
+            self.position_extended = True
+        async with self.schedule_lock:
+            await self._cancel()
+            if not self.running or board is not self.board_to_analyze:
+                return  # A newer position was submitted while the old search stopped
+            self._show_or_search(board, use_probe)
+
+    def _show_or_search(self, board, use_probe: bool) -> None:
+        """Shows what the probe or the cache knows, and starts a search if the budget leaves room"""
+        if use_probe and self.probe is not None:
+            probed = self.probe.probe(board)
+            if probed is not None:
+                self._show(self._probe_result(board, probed))
+                return
+
+        key = position_key(board)
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is not None:
+            line = AnalysisLine.from_info(cached.to_info())
+            self._show(AnalysisResult(board, [line], cached.depth, cached.nodes, source='cache'))
+        if self.paused:
+            return
+        budget = self.position_budget
+        seconds, nodes = self.position_spent
+        if cached is not None and cached.depth >= self.target_depth and not self.position_extended:
+            return
+        if budget.is_exhausted(cached.depth if cached else 0, seconds, nodes):
+            return
+        self.task = self.loop.create_task(self._analyze(board, key, cached.depth if cached else 0))
+
+    def _probe_result(self, board, probed: ProbeResult) -> AnalysisResult:
+        # Tablebase results are exact, deeper searches cannot change them
+        depth = self.max_depth if probed.exact else 0
+        lines = [AnalysisLine(probed.score, depth, [move]) for move in probed.moves[:self.multipv]]
+        if not lines:
+            lines = [AnalysisLine(probed.score, depth, [])]
+        return AnalysisResult(board, lines, depth, source=probed.source)
+
+    async def _get_protocol(self, worker: int):
+        """Returns the running engine of the worker, (re)starting the process if needed"""
+        protocol = self.protocols[worker]
+        if protocol is not None and protocol.returncode.done():
+            protocol = None
+            self.restarts += 1
+        if protocol is None:
+            self.transports[worker], protocol = await chess.engine.popen_uci(self.path)
+            options = {name: value for name, value in self.options.items() if name in protocol.options}
+            await protocol.configure(options)
+            self.protocols[worker] = protocol
+        return protocol
+
+    def _record_first_score(self):
+        if self.requested_at is None:
+            return
+        self.first_score_latency = time.perf_counter() - self.requested_at
+        self.latency_samples.append(self.first_score_latency)
+        self.requested_at = None
+
+    def _show(self, result: AnalysisResult):
+        self.current_result = result
+        if result.best is not None:
+            self.current_score = result.best.score_str()
+            self._record_first_score()
+        self.current_depth = result.depth
+
+        for callback in self.subscribers:
+            callback(result.board, result)
+
+    def _store(self, key, result: AnalysisResult) -> bool:
+        if self.cache is None or result.best is None:
+            return False
+        info = result.best.to_info()
+        info["depth"] = result.depth
+        entry = CachedEval.from_info(info)
+        return entry is not None and self.cache.put(key, entry)
+
+    def _split_root_moves(self, board) -> list[list[chess.Move] | None]:
+        """Deals the legal moves out to the workers, one list per worker that has something to do"""
+        if self.workers == 1:
+            return [None]
+        legal_moves = list(board.legal_moves)
+        if len(legal_moves) < 2:
+            return [None]
+        groups = [legal_moves[i::self.workers] for i in range(self.workers)]
+        return [group for group in groups if group]
+
+    def _aggregate(self, board, lines: dict, workers: dict) -> AnalysisResult:
+        """Merges the lines of all workers; the depth is the one every worker has reached"""
+        turn = board.turn
+        best_lines = sorted(lines.values(), key=lambda line: line.score.pov(turn), reverse=True)
+        return AnalysisResult(
+            board,
+            best_lines[:self.multipv],
+            depth=min(depth for depth, _, _ in workers.values()),
+            nodes=sum(nodes for _, nodes, _ in workers.values()),
+            nps=sum(nps for _, _, nps in workers.values())
+        )
+
+    async def _analyze(self, board, key, cached_depth):
+        lines = {}  # (worker, multipv) -> AnalysisLine
+        workers = {}  # worker -> (depth, nodes, nps)
+        stored = False
+        search_times = {}  # worker -> seconds reported by the engine, process startup is not part of the budget
+
+        def on_info(worker, info) -> bool:
+            """:return: True if the budget of the position is used up"""
+            nonlocal stored
+            line = AnalysisLine.from_info(info)
+            if line is None:
+                return False
+            lines[(worker, info.get("multipv", 1))] = line
+            workers[worker] = (line.depth, info.get("nodes", 0), info.get("nps", 0))
+            search_times[worker] = info.get("time", 0.0)
+
+            result = self._aggregate(board, lines, workers)
+            # Shallower lines than the cached eval would make the shown score jump back
+            if len(workers) == len(root_moves) and result.depth >= cached_depth:
+                self._show(result)
+                stored = self._store(key, result) or stored
+            spent_seconds, spent_nodes = self.position_spent  # Searches of the position that already ended
+            return len(workers) == len(root_moves) and self.position_budget.is_exhausted(
+                max(result.depth, cached_depth), spent_seconds + max(search_times.values()), spent_nodes + result.nodes)
+
+        root_moves = self._split_root_moves(board)
+        try:
+            await asyncio.gather(*[
+                self._worker_search(worker, board, moves, on_info) for worker, moves in enumerate(root_moves)
+            ])
+        finally:
+            # Also runs when a new position or pause() cancels the search
+            if board is self.budget_board:
+                spent_seconds, spent_nodes = self.position_spent
+                nodes = sum(nodes for _, nodes, _ in workers.values())
+                self.position_spent = (spent_seconds + max(search_times.values(), default=0.0), spent_nodes + nodes)
+            if stored:
+                self.cache.persist(key)
 
+    async def _worker_search(self, worker, board, root_moves, on_info):
+        multipv = self.multipv if root_moves is None else min(self.multipv, len(root_moves))
+        threads = self.options.get("Threads", 1)
+        while True:
+            engine_time = 0.0  # Seconds reported by this search
             try:
-                # Use a context manager for the engine
-                with chess.engine.SimpleEngine.popen_uci(self.path) as engine:
-                    current_pos = self.board_to_analyze
-                    with engine.analysis(current_pos) as analysis:
-                        for info in analysis:
-                            if self.board_to_analyze != current_pos or not self.running:
-                                break
-                            
-                            if "score" in info:
-                                self.current_score = self._analyze_score(info["score"])
-                                
-                            if "depth" in info:
-                                self.current_depth = info["depth"]
-                                if self.current_depth >= 244:
-                                    break
-                            
-                            # Allow other threads to breathe
-                            time.sleep(0.05) 
-            except Exception as e:
+                protocol = await self._get_protocol(worker)
+                with await protocol.analysis(board, multipv=multipv, game=self.game, root_moves=root_moves) as analysis:
+                    async for info in analysis:
+                        engine_time = info.get("time", engine_time)
+                        if on_info(worker, info) or info.get("depth", 0) >= self.max_depth:
+                            break
+                return
+            except chess.engine.EngineTerminatedError as e:
+                # The process died, start a fresh one and search this position again
+                print(f"Engine terminated: {e}")
+                self.protocols[worker] = None
+                self.restarts += 1
+                await asyncio.sleep(1)
+            except (chess.engine.EngineError, OSError) as e:
                 print(f"Engine Error: {e}")
-                time.sleep(1)
\ No newline at end of file
+                return
+            finally:
+                self.game_cpu_seconds += engine_time * threads
+                self.total_cpu_seconds += engine_time * threads
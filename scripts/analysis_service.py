@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+import chess
+import chess.engine
+
+from scripts.analysis import AnalysisLine, AnalysisResult
+from scripts.engine_pool import EnginePool
+from scripts.eval_cache import CachedEval, EvalCache, position_key
+from scripts.settings import ENGINE_PATH, ENGINE_OPTIONS, ANALYSIS_SERVICE_ENGINES, ANALYSIS_SERVICE_DEPTH
+from scripts.timing import summarize
+
+# Lower runs first
+PRIORITY_FOCUSED = 0  # The board the user looks at
+PRIORITY_LIVE = 1  # Games in progress, e.g. watched server games
+PRIORITY_BACKGROUND = 2  # Everything else, e.g. thumbnails of other boards
+
+
+class AnalysisJob:
+    """Search of one position, shared by every owner that asked for it"""
+
+    __slots__ = ('key', 'board', 'priority', 'waiters', 'queued_at', 'task')
+
+    def __init__(self, key: int, board: chess.Board, priority: int) -> None:
+        self.key = key
+        self.board = board
+        self.priority = priority
+        self.waiters = {}  # owner -> callback(board, AnalysisResult)
+        self.queued_at = time.perf_counter()
+        self.task = None  # Set while an engine searches it
+
+
+class AnalysisService:
+    """
+    One engine pool for many boards. Each owner (a board, a server game) has at most one
+    request: a new position replaces the previous one, which is dropped if nobody else waits for it.
+    Requests for the same position (Zobrist key) share one search, and the queue hands the
+    engines the most important position first.
+    Like EngineManager it runs in its own asyncio thread; callbacks are called from that thread.
+    """
+
+    def __init__(self, path=ENGINE_PATH, engines: int = ANALYSIS_SERVICE_ENGINES, depth: int = ANALYSIS_SERVICE_DEPTH,
+                 options: dict = ENGINE_OPTIONS, cache: EvalCache | None = None) -> None:
+        self.pool = EnginePool(path, engines, options)
+        self.limit = chess.engine.Limit(depth=depth)
+        self.depth = depth
+        self.cache = cache
+
+        self.jobs = {}  # position key -> AnalysisJob, queued or searching
+        self.owners = {}  # owner -> position key of its request
+        self.queue = []  # Heap of (priority, sequence, job), entries of finished or reprioritized jobs are skipped
+        self.sequence = itertools.count()
+        self.ready = asyncio.Event()  # Set when the queue may have work
+        self.running = True
+
+        self.requests = 0
+        self.coalesced = 0  # Requests that joined a queued or running search
+        self.cache_hits = 0
+        self.searches = 0
+        self.stale_dropped = 0  # Positions nobody waited for anymore, dropped from the queue or cancelled
+        self.wait_samples = deque(maxlen=1000)  # Seconds from queueing to the start of the search
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.workers = asyncio.run_coroutine_threadsafe(self._start(), self.loop)
+        self.workers.add_done_callback(self._on_started)
+
+    @staticmethod
+    def _on_started(future) -> None:
+        """Reports a pool that could not start, e.g. a wrong engine path, when it happens instead of at close()"""
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Engine Error: {future.exception()}")
+
+    async def _start(self) -> list[asyncio.Task]:
+        await self.pool.start()
+        return [asyncio.create_task(self._worker()) for _ in range(self.pool.size)]
+
+    def request(self, owner, board: chess.Board, priority: int = PRIORITY_BACKGROUND, callback=None) -> None:
+        """Analyze the position for the owner instead of its previous one (thread-safe)"""
+        self.loop.call_soon_threadsafe(self._request, owner, board.copy(), priority, callback)
+
+    def cancel(self, owner) -> None:
+        """The owner does not need its position anymore, e.g. the board was closed (thread-safe)"""
+        self.loop.call_soon_threadsafe(self._leave, owner)
+
+    def _request(self, owner, board: chess.Board, priority: int, callback) -> None:
+        self.requests += 1
+        key = position_key(board)
+        if self.owners.get(owner) != key:
+            self._leave(owner)
+
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is not None and cached.depth >= self.depth:
+            self.cache_hits += 1
+            if callback is not None:
+                callback(board, self._result(board, cached.to_info(), 'cache'))
+            return
+
+        job = self.jobs.get(key)
+        if job is None:
+            job = self.jobs[key] = AnalysisJob(key, board, priority)
+            self._push(job)
+        else:
+            if owner not in job.waiters:  # Not the same owner asking for its position again
+                self.coalesced += 1
+            if priority < job.priority:
+                job.priority = priority
+                if job.task is None:
+                    self._push(job)  # The old entry is skipped, see _next_job
+        job.waiters[owner] = callback
+        self.owners[owner] = key
+
+    def _leave(self, owner) -> None:
+        key = self.owners.pop(owner, None)
+        job = self.jobs.get(key)
+        if job is None:
+            return
+        job.waiters.pop(owner, None)
+        if not job.waiters:
+            self.stale_dropped += 1
+            del self.jobs[key]
+            if job.task is not None:
+                job.task.cancel()
+
+    def _push(self, job: AnalysisJob) -> None:
+        heapq.heappush(self.queue, (job.priority, next(self.sequence), job))
+        self.ready.set()
+
+    async def _next_job(self) -> AnalysisJob:
+        while True:
+            while self.queue:
+                priority, _, job = heapq.heappop(self.queue)
+                if self.jobs.get(job.key) is job and job.task is None and job.priority == priority:
+                    return job
+            self.ready.clear()
+            await self.ready.wait()
+
+    async def _worker(self) -> None:
+        while self.running:
+            job = await self._next_job()
+            self.wait_samples.append(time.perf_counter() - job.queued_at)
+            job.task = asyncio.create_task(self.pool.analyse(job.board, self.limit))
+            # Waiting through asyncio.wait keeps the worker alive when the search is cancelled
+            await asyncio.wait([job.task])
+            if self.jobs.get(job.key) is job:
+                del self.jobs[job.key]
+            if job.task.cancelled():
+                continue
+            try:
+                info = job.task.result()
+            except (chess.engine.EngineError, OSError) as e:
+                print(f"Engine Error: {e}")
+                continue
+            self.searches += 1
+            result = self._result(job.board, info, 'engine')
+            if self.cache is not None and "score" in info:
+                entry = CachedEval.from_info(info)
+                if entry is not None and self.cache.put(job.key, entry):
+                    self.cache.persist(job.key)
+            for owner, callback in job.waiters.items():
+                if self.owners.get(owner) == job.key:
+                    del self.owners[owner]
+                if callback is not None:
+                    callback(job.board, result)
+
+    @staticmethod
+    def _result(board: chess.Board, info: dict, source: str) -> AnalysisResult:
+        line = AnalysisLine.from_info(info)
+        lines = [line] if line is not None else []
+        return AnalysisResult(board, lines, info.get("depth", 0), info.get("nodes", 0), info.get("nps", 0), source)
+
+    def queue_depth(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.task is None)
+
+    def stats(self) -> dict:
+        return {
+            "engines": self.pool.size,
+            "queue_depth": self.queue_depth(),
+            "searching": len(self.jobs) - self.queue_depth(),
+            "requests": self.requests,
+            "searches": self.searches,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "dedup_rate": self.coalesced / self.requests if self.requests else 0.0,
+            "stale_dropped": self.stale_dropped,
+            "wait_ms": summarize(list(self.wait_samples), 1000),
+        }
+
+    def close(self, timeout: float = 2.0) -> None:
+        if not self.running:
+            return
+        self.running = False
+        future = asyncio.run_coroutine_threadsafe(self._close(), self.loop)
+        try:
+            future.result(timeout)
+        except Exception as e:
+            print(f"Engine Error: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _close(self) -> None:
+        if self.workers.done() and self.workers.exception() is None:
+            for worker in self.workers.result():
+                worker.cancel()
+        for job in self.jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+        await self.pool.close()
@@ -1,3 +1,6 @@
+import threading
+
+import chess
 import pygame
 import pygame_gui
 
@@ -5,22 +8,55 @@ import scripts.settings as s
 from scripts.camera import Camera
 from scripts.field import Field
 from scripts.UI.text import Text
+from scripts.UI.sprites import SpriteAtlas
 
 from scripts.game.board import Board
 from scripts.game.statistics import Statistics
+from scripts.game.archive import GameArchive
+from scripts.game.replay import ReplayViewer
 from scripts.analysis import EngineManager
+from scripts.eval_cache import EvalCache, position_key
+from scripts.probe import PositionProbe
+from scripts.network.client import GameClient
+from scripts.network.play import NetworkPlay
+from scripts.network.spectate import SpectatorFeed
+from scripts.game.board_grid import BoardGrid
+from scripts.game.session import GameSession
+from scripts.game.move_tree import MoveTree, SOURCE_PLAYED, SOURCE_ENGINE
+from scripts.game.tree_explorer import TreeExplorer
 from scripts.notification import Notification
+from scripts.UI.compositor import get_time
+from scripts.profiler import FrameProfiler
+from scripts.timing import StartupReport
+
+ENGINE_INFO_EVENT = pygame.event.custom_type()  # Posted by the engine thread when there is a new eval
+NETWORK_EVENT = pygame.event.custom_type()  # Posted by the network thread when a message arrived
+
+# Blocks of App.update and the subsystems inside them, in the order of the profiler overlay
+PROFILER_SECTIONS = [
+    'input', 'physics', 'rendering', 'update',
+    'ui_manager.update', 'board.update', 'statistics.update', 'engine.read', 'notifications.expire',
+    'board.draw', 'statistics.draw', 'notifications.draw', 'ui_manager.draw',
+]
 
 class App:
 
-    def __init__(self) -> None:
+    def __init__(self, startup: StartupReport | None = None, host_port: int | None = None,
+                 join_address: str | None = None, join_game: int = 1, watch_address: str | None = None,
+                 watch_games: int = 16) -> None:
+        self.startup = startup if startup is not None else StartupReport()
+
         # Initialize pygame and settings
         pygame.init()
+        self.startup.mark('pygame.init')
 
         self.size = self.width, self.height = s.SIZE
         self.name = s.NAME
         self.colors = s.COLORS
         self.fps = s.FPS
+        self.scheduling = s.SCHEDULING
+        self.active_fps = s.ACTIVE_FPS
+        self.idle_timeout = s.IDLE_TIMEOUT
 
         # Set pygame window
         pygame.display.set_caption(self.name)
@@ -28,6 +64,17 @@ class App:
         # Set pygame clock
         self.screen = pygame.display.set_mode(self.size)
         self.clock = pygame.time.Clock()
+        self.startup.mark('window')
+
+        # Only changed areas are pushed to the display, see Rendering Block
+        self.full_redraw = True
+        self.needs_redraw = True
+        self.last_notification_rects = []
+        self.fps_rect = pygame.Rect(self.width - 160, self.height - 14, 160, 14)  # FPS and network RTT
+
+        # F3 - overlay, F4 - start/stop cProfile capture, F5 - export frame times
+        self.profiler = FrameProfiler(PROFILER_SECTIONS, s.PROFILER_CAPACITY)
+        self.last_profiler_rect = None
 
         # Set input variables
         self.dt = 0
@@ -35,34 +82,238 @@ class App:
         self.keys = []
 
         # Set model variables
-        self.camera = Camera(x=0, y=0, distance=10, resolution=self.size)
         # This line takes data from save file
         self.field = Field()
-        # sprites
-        self.sprites = {}
+        # sprites, rasterized once per size and shared by every consumer
+        self.sprites = SpriteAtlas(s.SPRITE_CACHE_DIR)
         self.load_group_images('Pieces')
 
+        # Game attributes
+        self.current_move = 0 # check to update analysis
+        self.current_session = None  # A new game has to be analyzed as well
+
+        self.board = Board(720, (0, 0), self.sprites)
+        self.startup.mark('assets and board')
+
+        # Every game played on the board is recorded, F6 - replay viewer
+        self.archive = None
+        if s.ARCHIVE_DIR is not None:
+            self.archive = GameArchive(s.ARCHIVE_DIR, s.ARCHIVE_KEYFRAME_INTERVAL)
+            self.board.set_archive(self.archive)
+        self.replay = None  # ReplayViewer, created when it is opened the first time
+        self.replaying = False
+
+        # Moves played on the board and the engine's lines, F9 - variation tree/board
+        self.tree = MoveTree(self.board.get_board().root().fen())
+        # Over the board area, see TreeExplorer
+        self.camera = Camera(x=-1, y=-8, distance=16, resolution=(self.board.board_size, self.board.board_size))
+        self.explorer = TreeExplorer(self.board.board_size, self.board.position, self.camera, self.tree)
+        self.showing_tree = False
+        self.tree_result = None  # Engine result whose lines are in the tree
+        self.analysis_moves = []  # Move stack of the board last submitted to the engine, the root of its PVs
+        self.analysis_key = None
+
+        # The board is shown before the rest is set up
+        self.draw_first_frame()
+        self.startup.mark('first frame')
+
         # UI attributes
         self.ui_manager = pygame_gui.UIManager(self.size)
+        self.statistics = Statistics((730, 10), (1080-720-20, 720), self.sprites, self.ui_manager)
+        self.startup.mark('ui')
 
-        # Game attributes
-        self.current_move = 0 # check to update analysis
+        # The evaluation cache is read from disk in the engine thread
+        self.engine = EngineManager(s.ENGINE_PATH, cache=EvalCache(s.EVAL_CACHE_PATH, s.EVAL_CACHE_SIZE, load=False),
+                                    probe=PositionProbe(s.BOOK_PATH, s.SYZYGY_PATH))
+        # One pending wake-up event is enough, however many info lines the engine sends meanwhile
+        self.engine_info_pending = threading.Event()
+        self.engine.subscribe(self.on_engine_info)
+        self.start_analysis()
+        self.startup.mark('engine')
 
-        self.board = Board(720, (0, 0), self.sprites['Pieces'].copy())
-        self.statistics = Statistics((730, 10), (1080-720-20, 720), self.sprites['Pieces'].copy(), self.ui_manager)
-        
-        self.engine = EngineManager(s.ENGINE_PATH)
-        self.engine.start_analysis(board = self.board.get_board())
+        # Two players on two Apps: the host plays White and runs the server, the other one joins as Black
+        self.network = None
+        self.network_pending = threading.Event()
+        if host_port is not None or join_address is not None:
+            self.start_network(host_port, join_address, join_game)
+            self.startup.mark('network')
+
+        # Games of a server shown side by side in place of the board, F8 - grid/board
+        self.feed = None
+        self.grid = None
+        self.showing_grid = False
+        if watch_address is not None:
+            self.start_watching(watch_address, watch_games)
+            self.startup.mark('grid')
+        print(self.startup.format())
+
+    def draw_first_frame(self) -> None:
+        self.screen.fill(self.colors['background'])
+        self.board.draw(self.screen, self.mouse_pos)
+        self.board.pop_dirty_rects()
+        pygame.display.update()
+
+    def on_engine_info(self, board, result) -> None:
+        """Called from the engine thread"""
+        if not self.engine_info_pending.is_set():
+            self.engine_info_pending.set()
+            pygame.event.post(pygame.event.Event(ENGINE_INFO_EVENT))
+
+    def start_network(self, host_port: int | None, join_address: str | None, join_game: int) -> None:
+        if host_port is not None:
+            client = GameClient('127.0.0.1', host_port, on_message=self.on_network_message)
+            server = client.host_server('0.0.0.0', host_port)
+            print(f"Hosting a game on port {server.port}")
+            self.network = NetworkPlay(self.board, client, chess.WHITE, share_evals=True)
+        else:
+            host, _, port = join_address.rpartition(':')
+            client = GameClient(host or '127.0.0.1', int(port or s.NETWORK_PORT), on_message=self.on_network_message)
+            self.network = NetworkPlay(self.board, client, chess.BLACK, join_game)
+
+    def start_watching(self, watch_address: str, watch_games: int) -> None:
+        host, _, port = watch_address.rpartition(':')
+        client = GameClient(host or '127.0.0.1', int(port or s.NETWORK_PORT), on_message=self.on_network_message)
+        self.feed = SpectatorFeed(client, range(1, watch_games + 1))
+        self.grid = BoardGrid(self.board.board_size, self.board.position, self.sprites)
+        self.grid.set_games(self.feed.games.values())
+        self.showing_grid = True
+
+    def toggle_grid(self) -> None:
+        if self.grid is None:
+            return
+        self.showing_grid = not self.showing_grid
+        self.replaying = False
+        self.showing_tree = False
+        self.board.invalidate()
+        self.grid.layout()
+
+    def toggle_tree(self) -> None:
+        self.showing_tree = not self.showing_tree
+        self.showing_grid = False
+        self.replaying = False
+        self.board.invalidate()
+        if self.showing_tree:
+            self.explorer.center_on(self.explorer.current)
+            self.explorer.rendered_state = None
+
+    def update_tree(self, new_session: bool) -> None:
+        """Adds the moves of the board to the variation tree, a game from another start position gets a new tree"""
+        board = self.board.get_board()
+        if new_session:
+            fen = board.root().fen()
+            if fen != self.tree.fen:
+                self.tree = MoveTree(fen)
+                self.explorer.set_tree(self.tree)
+        self.explorer.set_current(self.tree.add_line(board.move_stack, SOURCE_PLAYED))
+
+    def start_analysis(self) -> None:
+        board = self.board.get_board()
+        # The engine's copy of the board belongs to its thread, the tree takes the moves from this one
+        self.analysis_moves = list(board.move_stack)
+        self.analysis_key = position_key(board)
+        self.engine.start_analysis(board = board)
+
+    def add_engine_lines(self) -> None:
+        result = self.engine.current_result
+        if result is None or result is self.tree_result:
+            return
+        self.tree_result = result
+        if position_key(result.board) != self.analysis_key:
+            return  # Lines of a position submitted before
+        for line in result.lines:
+            self.tree.add_line(self.analysis_moves + line.pv[:s.TREE_PV_PLIES], SOURCE_ENGINE)
+
+    def open_tree_node(self, node: int) -> None:
+        """Continues the game from the position of the node"""
+        if self.network is not None:
+            Notification("Not in a network game", 2.0)
+            return
+        session = GameSession(self.tree.fen)
+        for move in self.tree.line_to(node):
+            session.push(move)
+        self.board.set_session(session)
+        self.toggle_tree()
+
+    def get_network_client(self) -> GameClient | None:
+        if self.network is not None:
+            return self.network.client
+        return self.feed.client if self.feed is not None else None
+
+    def on_network_message(self, message: dict) -> None:
+        """Called from the network thread"""
+        if not self.network_pending.is_set():
+            self.network_pending.set()
+            pygame.event.post(pygame.event.Event(NETWORK_EVENT))
+
+    def is_active(self) -> bool:
+        """Something moves on the screen without any input (dragged piece, scrubbing, pending renders)"""
+        if self.replaying and self.replay.is_scrubbing:
+            return True
+        if self.showing_grid and self.grid.has_pending():
+            return True  # Boards over the render budget of the last frame
+        if self.showing_tree and (self.explorer.panning or self.explorer.has_pending()):
+            return True
+        return self.board.active_square_index is not None
+
+    def get_events(self) -> list:
+        """
+        In 'idle' scheduling this blocks until there is an event or the idle timeout passes,
+        instead of spinning through empty frames
+        """
+        if self.scheduling != 'idle' or self.needs_redraw or self.is_active():
+            return pygame.event.get()
+
+        # Wakes up in time to hide the next notification
+        timeout = self.idle_timeout
+        next_expiry = Notification.COMPOSITOR.next_expiry()
+        if next_expiry is not None:
+            timeout = max(1, min(timeout, int((next_expiry - get_time()) * 1000) + 1))  # 0 would wait forever
+        event = pygame.event.wait(timeout)
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event] + pygame.event.get()
+
+    def tick(self) -> int:
+        if self.scheduling != 'idle':
+            return self.clock.tick(self.fps)
+        if self.is_active():
+            return self.clock.tick(self.active_fps)
+        return self.clock.tick()
+
+    def toggle_replay(self) -> None:
+        self.showing_grid = False
+        self.showing_tree = False
+        if self.replaying:
+            self.replaying = False
+            self.board.invalidate()
+            return
+        if self.archive is None:
+            return
+        if self.replay is None:
+            self.replay = ReplayViewer(self.board.board_size, self.board.position, self.sprites, self.archive)
+        if self.replay.open_latest():
+            self.replaying = True
+        else:
+            Notification("No games recorded yet", 2.0)
+
+    def show_ply(self, ply: int) -> None:
+        """Shows a position of the current game in the replay viewer, F6 goes back to the game"""
+        if self.archive is None or self.board.archive_game is None:
+            return
+        if self.replay is None:
+            self.replay = ReplayViewer(self.board.board_size, self.board.position, self.sprites, self.archive)
+        ply = max(0, ply - self.board.session.start_ply)  # The archive starts where the session started
+        if self.replay.game != self.board.archive_game or not self.replaying:
+            self.replay.open(self.board.archive_game, ply)
+        else:
+            self.replay.seek(ply)
+        self.replaying = True
 
     def load_group_images(self, group_name: str) -> None:
-        self.sprites = {}
+        paths = {}
         for image_name in s.IMAGES[f'img/{group_name}']:
-            image_path = f'img/{group_name}/{image_name}'
-            image = pygame.image.load(image_path).convert_alpha()
-            if group_name not in self.sprites:
-                self.sprites[group_name] = {}
-            self.sprites[group_name][image_name.split('.')[0]] = image
-        print(f'Loaded image: {self.sprites}')
+            paths[image_name.split('.')[0]] = f'img/{group_name}/{image_name}'
+        self.sprites.add_files(group_name, paths)
     
     def update(self) -> None:
         """
@@ -71,16 +322,63 @@ class App:
         """
 
         # -*-*- Input Block -*-*-
+        events = self.get_events()
+        if events:
+            self.needs_redraw = True
+        block_start = self.profiler.begin_frame()  # Idle waiting is not part of the frame
+
         self.mouse_pos = pygame.mouse.get_pos()  # Get mouse position
 
-        for event in pygame.event.get():  # Get all events
+        for event in events:  # Get all events
             self.ui_manager.process_events(event)
 
+            if event.type == ENGINE_INFO_EVENT:
+                self.engine_info_pending.clear()
+            if event.type == NETWORK_EVENT:
+                self.network_pending.clear()
+
+            if event.type in (pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED):
+                self.full_redraw = True
+
+            # The engine only searches while somebody can see it
+            if s.ANALYSIS_BACKGROUND == 'pause':
+                if event.type in (pygame.WINDOWFOCUSLOST, pygame.WINDOWMINIMIZED):
+                    self.engine.pause()
+                elif event.type in (pygame.WINDOWFOCUSGAINED, pygame.WINDOWRESTORED):
+                    self.engine.resume()
+
             if event.type == pygame.QUIT:  # If you want to close the program...
+                self.engine.quit()
+                print(f"Engine CPU time: {self.engine.game_cpu_seconds:.1f} s this game, "
+                      f"{self.engine.total_cpu_seconds:.1f} s in total")
+                if self.engine.probe.is_enabled():
+                    print(f"Book and tablebase probes: {self.engine.probe.stats()}")
+                if self.network is not None:
+                    print(f"Network: {self.network.get_stats()}")
+                    self.network.close()
+                if self.feed is not None:
+                    print(f"Grid: {self.grid.renders} board renders, {self.feed.resyncs} resyncs")
+                    self.feed.close()
+                print(f"Variation tree: {len(self.tree)} nodes, {self.explorer.renders} renders")
+                if self.archive is not None:
+                    self.archive.close()  # Writes the unfinished game
                 close()
-                Text.fonts = {}  # Clear fonts
+                Text.clear_cache()  # Clear fonts and rendered texts
 
-            if event.type == pygame.MOUSEBUTTONDOWN:  # If mouse button down...
+            if self.replaying:
+                self.replay.handle_event(event)
+            if self.showing_tree:
+                node = self.explorer.handle_event(event)
+                if node is not None:
+                    self.open_tree_node(node)
+
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.showing_grid:
+                if self.grid.handle_click(event.pos):
+                    self.feed.focus(self.grid.zoomed.game.game_id if self.grid.zoomed is not None else None)
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and \
+                    self.statistics.get_graph_ply(event.pos) is not None:
+                self.show_ply(self.statistics.get_graph_ply(event.pos))
+            elif event.type == pygame.MOUSEBUTTONDOWN and not self.replaying and not self.showing_tree: # If mouse button down...
                 if event.button == 1:
                     self.board.click(self.mouse_pos)
                 elif event.button == 3:
@@ -89,40 +387,129 @@ class App:
             if event.type == pygame.KEYDOWN:  # If key button down...
                 if event.key == pygame.K_SPACE:
                     pass
+                elif event.key == pygame.K_F3:
+                    self.profiler.toggle_overlay()
+                    self.full_redraw = True
+                elif event.key == pygame.K_F4:
+                    path = self.profiler.toggle_capture(s.PROFILE_DIR)
+                    if path is not None:
+                        Notification("Profile saved", 2.0)
+                elif event.key == pygame.K_F5:
+                    self.profiler.export(f"{s.PROFILE_DIR}/frames_{pygame.time.get_ticks()}.csv")
+                    Notification("Frames exported", 2.0)
+                elif event.key == pygame.K_F6:
+                    self.toggle_replay()
+                elif event.key == pygame.K_F7:
+                    self.engine.request_more()
+                    Notification("Analyzing deeper", 1.0)
+                elif event.key == pygame.K_F8:
+                    self.toggle_grid()
+                elif event.key == pygame.K_F9:
+                    self.toggle_tree()
+        block_start = self.profiler.lap('input', block_start)
 
         # -*-*- Physics Block -*-*-
+        lap = block_start
         self.ui_manager.update(self.dt/1000) # Needs time in seconds
+        lap = self.profiler.lap('ui_manager.update', lap)
 
-        self.board.update(self.dt, self.mouse_pos)
+        if self.network is not None and self.network.update():
+            self.needs_redraw = True  # Opponent's move, rollback or resync
+        if self.feed is not None and self.feed.update():
+            self.needs_redraw = True
+        if self.showing_tree:
+            self.explorer.update(self.dt)
+        elif not self.replaying and not self.showing_grid:
+            self.board.update(self.dt, self.mouse_pos)
+        lap = self.profiler.lap('board.update', lap)
         self.statistics.update(self.board, self.engine)
-        if self.current_move != self.board.counting_moves:
+        if self.network is not None:
+            self.network.share_eval(self.engine.current_result)
+        lap = self.profiler.lap('statistics.update', lap)
+        if self.current_move != self.board.counting_moves or self.current_session is not self.board.session:
             self.current_move = self.board.counting_moves
-            self.engine.start_analysis(board = self.board.get_board())
+            new_session = self.current_session is not self.board.session
+            if new_session:
+                if self.current_session is not None:
+                    print(f"Engine CPU time of the game: {self.engine.game_cpu_seconds:.1f} s")
+                    self.engine.new_game()
+                self.current_session = self.board.session
+            self.start_analysis()
+            self.update_tree(new_session)
+        self.add_engine_lines()
+        lap = self.profiler.lap('engine.read', lap)
+        if self.replaying and self.replay.game == self.board.archive_game:
+            self.statistics.selected_ply = self.board.session.start_ply + self.replay.ply
+        else:
+            self.statistics.selected_ply = None
         
-        for notification in Notification.INSTANCES:
-            notification.update(self.dt)
+        if Notification.COMPOSITOR.expire() or self.is_active():
+            self.needs_redraw = True
+        self.profiler.lap('notifications.expire', lap)
+        block_start = self.profiler.lap('physics', block_start)
         # -*-*-               -*-*-
 
+        if self.scheduling == 'idle' and not self.needs_redraw and not self.full_redraw:
+            self.dt = self.tick()
+            return
+        self.needs_redraw = False
+
         # -*-*- Rendering Block -*-*-
+        lap = block_start
         self.screen.fill(self.colors['background'])  # Fill background
 
-        self.board.draw(self.screen, self.mouse_pos)
+        if self.showing_grid:
+            board_view = self.grid
+        elif self.showing_tree:
+            board_view = self.explorer
+        else:
+            board_view = self.replay if self.replaying else self.board
+        board_view.draw(self.screen, self.mouse_pos)
+        lap = self.profiler.lap('board.draw', lap)
         self.statistics.draw(self.screen)
+        lap = self.profiler.lap('statistics.draw', lap)
 
-        for notification in Notification.INSTANCES:
-            notification.draw(self.screen, self.mouse_pos)
+        notification_rects = Notification.COMPOSITOR.draw(self.screen, self.mouse_pos)
+        lap = self.profiler.lap('notifications.draw', lap)
 
         self.ui_manager.draw_ui(self.screen)
+        self.profiler.lap('ui_manager.draw', lap)
+
+        dirty_rects = board_view.pop_dirty_rects()
+        dirty_rects.append(self.statistics.get_rect())
+        dirty_rects += self.last_notification_rects + notification_rects
+        dirty_rects += [element.rect for element in self.ui_manager.get_root_container().elements]
+        dirty_rects.append(self.fps_rect)
+        self.last_notification_rects = notification_rects
 
         Text("FPS: " + str(int(self.clock.get_fps())), (0, 0, 0), 20).print(self.screen,
                                                                             (self.width - 60, self.height - 14),
                                                                             False)  # FPS counter
+        client = self.get_network_client()
+        if client is not None:
+            rtt = client.get_rtt_ms()
+            rtt_text = "offline" if not client.connected else \
+                "RTT: --" if rtt is None else f"RTT: {rtt:.0f} ms"
+            Text(rtt_text, (0, 0, 0), 20).print(self.screen, (self.width - 160, self.height - 14), False)
+
+        profiler_rect = self.profiler.draw_overlay(self.screen)
+        for rect in (profiler_rect, self.last_profiler_rect):
+            if rect is not None:
+                dirty_rects.append(rect)
+        self.last_profiler_rect = profiler_rect
+        block_start = self.profiler.lap('rendering', block_start)
         # -*-*-                 -*-*-
 
         # -*-*- Update Block -*-*-
-        pygame.display.update()
+        if self.full_redraw:
+            pygame.display.update()
+            self.full_redraw = False
+        else:
+            pygame.display.update(dirty_rects)
+        self.profiler.lap('update', block_start)  # The block is only the display update
+        self.profiler.end_frame()
 
-        self.dt = self.clock.tick(self.fps)
+        self.dt = self.tick()
         # -*-*-              -*-*-
 
 
@@ -0,0 +1,275 @@
+"""
+Evaluates every position of PGN files offline, with the engine settings the UI uses.
+
+    python -m scripts.bulk_analysis games.pgn --out annotated.pgn --json evals.jsonl --depth 20 --workers 4
+
+Games are streamed, so the input can be larger than memory. Positions repeated within and across
+games are searched once (Zobrist key), and every evaluation lands in the same EvalCache file as
+the UI's. A checkpoint records how far the input was read and written; --resume continues from it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+import chess
+import chess.engine
+import chess.pgn
+
+import scripts.settings as s
+from scripts.engine_pool import EnginePool
+from scripts.eval_cache import EvalCache, CachedEval, position_key
+
+
+class BulkAnalyzer:
+    """Evaluates positions through the pool, at most once per position however often it occurs"""
+
+    def __init__(self, pool: EnginePool, cache: EvalCache, depth: int | None = None, nodes: int | None = None) -> None:
+        self.pool = pool
+        self.cache = cache
+        self.depth = depth
+        self.nodes = nodes
+        self.limit = chess.engine.Limit(depth=depth, nodes=nodes)
+
+        self.pending = {}  # position key -> Future of a running search
+        self.unsaved_keys = []  # Searched since the last checkpoint
+
+        self.positions = 0
+        self.searched = 0
+        self.cache_hits = 0
+        self.deduplicated = 0
+
+    def is_enough(self, entry: CachedEval) -> bool:
+        """True if a cached evaluation satisfies the budget of this run"""
+        if self.depth is not None and entry.depth < self.depth:
+            return False
+        if self.nodes is not None and self.depth is None and entry.nodes < self.nodes:
+            return False
+        return True
+
+    async def evaluate(self, board: chess.Board) -> CachedEval:
+        self.positions += 1
+        key = position_key(board)
+        cached = self.cache.get(key)
+        if cached is not None and self.is_enough(cached):
+            self.cache_hits += 1
+            return cached
+        if key in self.pending:
+            self.deduplicated += 1
+            return await asyncio.shield(self.pending[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        try:
+            info = await self.pool.analyse(board, self.limit)
+            entry = CachedEval.from_info(info) or CachedEval(None, None, info.get("depth", 0), [])
+            self.searched += 1
+            if self.cache.put(key, entry):
+                self.unsaved_keys.append(key)
+            future.set_result(entry)
+            return entry
+        except BaseException as error:
+            future.set_exception(error)
+            future.exception()  # Waiters get it, nobody has to retrieve it
+            raise
+        finally:
+            del self.pending[key]
+
+    async def analyze_game(self, game: chess.pgn.Game) -> list[CachedEval]:
+        """Evaluations of the starting position and of the position after every mainline move"""
+        board = game.board()
+        boards = [board.copy(stack=False)]
+        for move in game.mainline_moves():
+            board.push(move)
+            boards.append(board.copy(stack=False))
+        return await asyncio.gather(*(self.evaluate(position) for position in boards))
+
+    def save(self) -> None:
+        self.cache.persist_many(self.unsaved_keys)
+        self.unsaved_keys = []
+
+
+def annotate(game: chess.pgn.Game, evals: list[CachedEval]) -> dict:
+    """Adds [%eval] comments to the mainline and returns the JSON record of the game"""
+    for node, entry in zip(game.mainline(), evals[1:]):
+        if entry.depth:
+            node.set_eval(entry.to_info()["score"], entry.depth)
+    return {
+        "headers": dict(game.headers),
+        "moves": [move.uci() for move in game.mainline_moves()],
+        "evals": [{"cp": entry.cp, "mate": entry.mate, "depth": entry.depth, "pv": entry.pv[:1]}
+                  for entry in evals],
+    }
+
+
+class Checkpoint:
+    """Input offset after the last written game and the sizes of the outputs at that point"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.offset = 0
+        self.games = 0
+        self.outputs = {}  # path -> size
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as file:
+            data = json.load(file)
+        self.offset, self.games, self.outputs = data["offset"], data["games"], data["outputs"]
+        return True
+
+    def save(self, offset: int, games: int, outputs: list) -> None:
+        self.offset, self.games = offset, games
+        self.outputs = {}
+        for output in outputs:
+            output.flush()
+            self.outputs[output.name] = output.tell()
+        # Written next to the checkpoint and renamed, so a crash never leaves half a file
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({"offset": offset, "games": games, "outputs": self.outputs}, file)
+        os.replace(temporary, self.path)
+
+
+def open_outputs(paths: list[str], checkpoint: Checkpoint | None) -> list:
+    """Opens the outputs for appending, cut back to the checkpoint when resuming"""
+    outputs = []
+    for path in paths:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if checkpoint is None:
+            outputs.append(open(path, 'w'))
+            continue
+        output = open(path, 'a+')
+        output.truncate(checkpoint.outputs.get(path, 0))
+        output.seek(0, os.SEEK_END)
+        outputs.append(output)
+    return outputs
+
+
+class Progress:
+
+    def __init__(self, analyzer: BulkAnalyzer, interval: float) -> None:
+        self.analyzer = analyzer
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.games = 0
+
+    def line(self) -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        analyzer = self.analyzer
+        return (f"{self.games} games  {analyzer.positions} positions  {analyzer.positions / elapsed:.1f} positions/s  "
+                f"searched {analyzer.searched} ({analyzer.searched / elapsed:.1f}/s)  "
+                f"cached {analyzer.cache_hits}  deduplicated {analyzer.deduplicated}")
+
+    def update(self, games: int) -> None:
+        self.games = games
+        now = time.perf_counter()
+        if now - self.last >= self.interval:
+            self.last = now
+            print(self.line(), flush=True)
+
+
+async def run(args) -> None:
+    checkpoint = Checkpoint(args.checkpoint)
+    resumed = args.resume and checkpoint.load()
+    if resumed:
+        print(f"Resuming after {checkpoint.games} games")
+
+    pool = EnginePool(args.engine, args.workers, s.ENGINE_OPTIONS)
+    await pool.start()
+    cache = EvalCache(args.cache, args.cache_size)
+    analyzer = BulkAnalyzer(pool, cache, args.depth, args.nodes)
+    progress = Progress(analyzer, args.progress)
+
+    paths = [path for path in (args.out, args.json) if path is not None]
+    outputs = open_outputs(paths, checkpoint if resumed else None)
+    pgn_output = outputs[0] if args.out is not None else None
+    json_output = outputs[-1] if args.json is not None else None
+
+    games = checkpoint.games if resumed else 0
+    last_checkpoint = time.perf_counter()
+    in_flight = deque()  # (game, input offset after it, task), written in input order
+
+    async def write_next() -> None:
+        nonlocal games, last_checkpoint
+        game, offset, task = in_flight.popleft()
+        record = annotate(game, await task)
+        if pgn_output is not None:
+            print(game, file=pgn_output, end="\n\n")
+        if json_output is not None:
+            json_output.write(json.dumps(record) + "\n")
+        games += 1
+        progress.update(games)
+        if time.perf_counter() - last_checkpoint >= args.checkpoint_every:
+            analyzer.save()
+            checkpoint.save(offset, games, outputs)
+            last_checkpoint = time.perf_counter()
+
+    try:
+        with open(args.pgn, encoding='utf-8-sig', errors='replace') as pgn:
+            if resumed:
+                pgn.seek(checkpoint.offset)
+            while args.max_games is None or games + len(in_flight) < args.max_games:
+                game = chess.pgn.read_game(pgn)
+                if game is None:
+                    break
+                in_flight.append((game, pgn.tell(), asyncio.create_task(analyzer.analyze_game(game))))
+                # A bounded window of games keeps the engines busy without holding the file in memory
+                while in_flight and (len(in_flight) >= args.window or in_flight[0][2].done()):
+                    await write_next()
+            while in_flight:
+                await write_next()
+            analyzer.save()
+            checkpoint.save(pgn.tell(), games, outputs)
+    finally:
+        for output in outputs:
+            output.close()
+        await pool.close()
+
+    print(progress.line())
+    print(f"Engine searches {pool.searches}, restarts {pool.restarts}, cache {cache.stats()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Evaluate every position of a PGN file")
+    parser.add_argument('pgn')
+    parser.add_argument('--out', help="Annotated PGN with [%%eval] comments")
+    parser.add_argument('--json', help="One JSON line per game with the evaluation of every ply")
+    parser.add_argument('--depth', type=int, help=f"Depth per position (default {s.ANALYSIS_TARGET_DEPTH} "
+                                                  f"unless --nodes is given)")
+    parser.add_argument('--nodes', type=int, help="Node budget per position")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Engine processes")
+    parser.add_argument('--engine', nargs='+', default=s.ENGINE_PATH, help="Engine command")
+    parser.add_argument('--cache', default=s.EVAL_CACHE_PATH, help="Evaluation cache shared with the UI")
+    parser.add_argument('--cache-size', type=int, default=1_000_000, help="Positions kept in memory")
+    parser.add_argument('--window', type=int, help="Games analyzed at once (default 8 per worker)")
+    parser.add_argument('--max-games', type=int)
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: next to the first output)")
+    parser.add_argument('--checkpoint-every', type=float, default=30.0, help="Seconds between checkpoints")
+    parser.add_argument('--resume', action='store_true', help="Continue from the checkpoint")
+    parser.add_argument('--progress', type=float, default=2.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    if args.out is None and args.json is None:
+        parser.error("nothing to write, give --out and/or --json")
+    if args.depth is None and args.nodes is None:
+        args.depth = s.ANALYSIS_TARGET_DEPTH
+    if args.window is None:
+        args.window = 8 * args.workers
+    if args.checkpoint is None:
+        args.checkpoint = (args.out or args.json) + '.checkpoint.json'
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("Interrupted, continue with --resume")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import numpy as np
 import pygame
 
 from scripts.UI.text import Text
@@ -35,6 +36,29 @@ class Camera:
 
         return global_x, global_y
 
+    def get_local_points(self, global_xs, global_ys) -> tuple:
+        """
+        This function convert many global points to local coordinates at once
+        :param global_xs: X coordinates in global coordinates (array-like)
+        :param global_ys: Y coordinates in global coordinates (array-like)
+        :return: Local coordinates (xs, ys) as NumPy arrays
+        """
+        scale = self.resolution[0] / self.distance
+        local_xs = (np.asarray(global_xs, dtype=float) - self.x) * scale
+        local_ys = (np.asarray(global_ys, dtype=float) - self.y) * scale
+
+        return local_xs, local_ys
+
+    def get_visible_area(self, margin=0) -> tuple:
+        """
+        This function return the part of the global coordinates shown on the screen
+        :param margin: Extra space around the screen in global coordinates
+        :return: Global bounds (left, top, right, bottom)
+        """
+        right, bottom = self.get_global_point(*self.resolution)
+
+        return self.x - margin, self.y - margin, right + margin, bottom + margin
+
     def get_local_radius(self, r) -> float:
         """
         This function convert global radius to local radius
@@ -105,6 +129,29 @@ class Camera:
         """
         self.distance -= self.distance * speed_scale * dt / 1000
 
+    def zoom_at(self, local_x, local_y, factor) -> None:
+        """
+        This function change scale and keep the point under the cursor in its place
+        :param local_x: X coordinate of the fixed point in local coordinates
+        :param local_y: Y coordinate of the fixed point in local coordinates
+        :param factor: New distance divided by the old one (below 1 zooms in)
+        :return: None
+        """
+        global_x, global_y = self.get_global_point(local_x, local_y)
+        self.distance *= factor
+        self.x = global_x - local_x / self.resolution[0] * self.distance
+        self.y = global_y - local_y / self.resolution[0] * self.distance
+
+    def drag(self, local_dx, local_dy) -> None:
+        """
+        This function move camera so the map follows the mouse
+        :param local_dx: Mouse movement along X in local coordinates
+        :param local_dy: Mouse movement along Y in local coordinates
+        :return: None
+        """
+        self.x -= local_dx / self.resolution[0] * self.distance
+        self.y -= local_dy / self.resolution[0] * self.distance
+
     # This function draw map scale on the screen (the part of UI)
     def draw_map_scale(self, screen, min_pixels_scale=50, max_pixels_scale=200,
                        first_digital=(1, 2, 5), offset=(60, 10), stick_width=5) -> None:
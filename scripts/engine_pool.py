@@ -0,0 +1,73 @@
+import asyncio
+
+import chess
+import chess.engine
+
+from scripts.settings import ENGINE_OPTIONS
+
+
+class EnginePool:
+    """
+    Fixed set of persistent UCI engine processes for one asyncio loop.
+    Each analyse() call borrows an idle engine, so at most `size` searches run at once;
+    an engine that died is restarted on its next use.
+    """
+
+    def __init__(self, path, size: int = 1, options: dict = ENGINE_OPTIONS) -> None:
+        self.path = path
+        self.size = size
+        self.options = options
+        self.idle = None  # asyncio.Queue of worker indexes, created inside the loop
+        self.protocols = [None] * size
+        self.transports = [None] * size
+
+        self.searches = 0
+        self.restarts = 0
+
+    async def start(self) -> None:
+        self.idle = asyncio.Queue()
+        for worker in range(self.size):
+            await self._get_protocol(worker)
+            self.idle.put_nowait(worker)
+
+    async def _get_protocol(self, worker: int):
+        protocol = self.protocols[worker]
+        if protocol is not None and protocol.returncode.done():
+            protocol = None
+            self.restarts += 1
+        if protocol is None:
+            self.transports[worker], protocol = await chess.engine.popen_uci(self.path)
+            options = {name: value for name, value in self.options.items() if name in protocol.options}
+            await protocol.configure(options)
+            self.protocols[worker] = protocol
+        return protocol
+
+    async def analyse(self, board: chess.Board, limit: chess.engine.Limit, game: object = None,
+                      retries: int = 1) -> dict:
+        """Searches the position with the first idle engine, returns the python-chess info dict"""
+        worker = await self.idle.get()
+        try:
+            for attempt in range(retries + 1):
+                protocol = await self._get_protocol(worker)
+                try:
+                    info = await protocol.analyse(board, limit, game=game)
+                    self.searches += 1
+                    return info
+                except chess.engine.EngineTerminatedError:
+                    if attempt == retries:
+                        raise
+        finally:
+            self.idle.put_nowait(worker)
+
+    async def close(self) -> None:
+        for protocol in self.protocols:
+            if protocol is not None and not protocol.returncode.done():
+                try:
+                    await asyncio.wait_for(protocol.quit(), 2.0)
+                except (asyncio.TimeoutError, chess.engine.EngineError):
+                    pass
+        for transport in self.transports:
+            if transport is not None:
+                transport.close()
+        self.protocols = [None] * self.size
+        self.transports = [None] * self.size
@@ -0,0 +1,146 @@
+import json
+import os
+from collections import OrderedDict
+
+import chess
+import chess.engine
+import chess.polyglot
+
+
+def position_key(board: chess.Board) -> int:
+    return chess.polyglot.zobrist_hash(board)
+
+
+class CachedEval:
+    """Best known evaluation of one position (score is from White's point of view)"""
+
+    __slots__ = ('cp', 'mate', 'depth', 'pv', 'nodes')
+
+    def __init__(self, cp: int | None, mate: int | None, depth: int, pv: list[str], nodes: int = 0) -> None:
+        self.cp = cp
+        self.mate = mate
+        self.depth = depth
+        self.pv = pv  # Moves in UCI notation
+        self.nodes = nodes
+
+    @classmethod
+    def from_info(cls, info: dict) -> 'CachedEval | None':
+        if "score" not in info or "depth" not in info:
+            return None
+        white_score = info["score"].white()
+        return cls(
+            cp=white_score.score(),
+            mate=white_score.mate(),
+            depth=info["depth"],
+            pv=[move.uci() for move in info.get("pv", [])],
+            nodes=info.get("nodes", 0)
+        )
+
+    def to_info(self) -> dict:
+        """Builds a python-chess like info dictionary, so cached and searched evals look the same"""
+        if self.mate is not None:
+            score = chess.engine.Mate(self.mate)
+        else:
+            score = chess.engine.Cp(self.cp or 0)
+        return {
+            "score": chess.engine.PovScore(score, chess.WHITE),
+            "depth": self.depth,
+            "pv": [chess.Move.from_uci(move) for move in self.pv],
+            "nodes": self.nodes,
+        }
+
+    def to_json(self, key: int) -> str:
+        return json.dumps({"key": key, "cp": self.cp, "mate": self.mate, "depth": self.depth,
+                           "pv": self.pv, "nodes": self.nodes})
+
+
+class EvalCache:
+    """
+    Evaluations keyed by the Zobrist hash of the position.
+    Keeps at most max_entries in memory (least recently used are evicted) and
+    appends finished evaluations to a JSON lines file that is loaded at startup.
+    """
+
+    def __init__(self, path: str | None = None, max_entries: int = 100_000, load: bool = True) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.appended = 0
+
+        self.loaded = False
+        if load:
+            self.load()
+
+    def load(self) -> None:
+        self.loaded = True
+        if self.path is None or not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as file:
+            for line in file:
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Half written line after a crash
+                entry = CachedEval(data["cp"], data["mate"], data["depth"], data["pv"], data["nodes"])
+                self.put(data["key"], entry)
+
+    def get(self, key: int) -> CachedEval | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: int, entry: CachedEval) -> bool:
+        """Stores entry in memory, unless a deeper one is already known"""
+        current = self.entries.get(key)
+        if current is not None and current.depth > entry.depth:
+            return False
+        self._insert(key, entry)
+        return True
+
+    def persist(self, key: int) -> None:
+        """Appends the in-memory entry of the position to the file"""
+        self.persist_many([key])
+
+    def persist_many(self, keys) -> None:
+        """Like persist, but opens the file once for all positions"""
+        if self.path is None:
+            return
+        lines = [self.entries[key].to_json(key) + '\n' for key in keys if key in self.entries]
+        if not lines:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a') as file:
+            file.writelines(lines)
+        self.appended += len(lines)
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+            "evictions": self.evictions,
+            "appended": self.appended,
+        }
+
+    def _insert(self, key: int, entry: CachedEval) -> None:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
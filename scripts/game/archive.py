@@ -0,0 +1,259 @@
+import mmap
+import os
+import struct
+from array import array
+
+import chess
+
+from scripts.game.session import EndResultState
+
+# A move in 16 bits: from square (6), to square (6), promotion piece type - 1 (3, 0 = none)
+PROMOTION_SHIFT = 12
+
+# Position snapshot: occupied squares, a 4-bit piece code per occupied square (ascending squares),
+# turn and castling flags, en passant square (64 = none), halfmove clock, fullmove number
+KEYFRAME = struct.Struct('<Q16sBBHH')
+MOVE = struct.Struct('<H')
+# Start of index.bin: magic, format version, keyframe interval
+HEADER = struct.Struct('<4sHH')
+MAGIC = b'CHGA'
+VERSION = 1
+# Per game: first move and first keyframe (in records), plies, result, winner (-1 = none)
+INDEX = struct.Struct('<QQIBb')
+
+NO_EP_SQUARE = 64
+CASTLING_SQUARES = (chess.H1, chess.A1, chess.H8, chess.A8)
+
+
+def encode_move(move: chess.Move) -> int:
+    promotion = move.promotion - 1 if move.promotion is not None else 0
+    return move.from_square | (move.to_square << 6) | (promotion << PROMOTION_SHIFT)
+
+
+def decode_move(code: int) -> chess.Move:
+    promotion = code >> PROMOTION_SHIFT
+    return chess.Move(code & 63, (code >> 6) & 63, promotion=promotion + 1 if promotion else None)
+
+
+def encode_position(board: chess.Board) -> bytes:
+    """30 bytes, standard castling only (chess960 rook files are not kept)"""
+    pieces = bytearray(16)
+    for i, square in enumerate(chess.scan_forward(board.occupied)):
+        piece_type = board.piece_type_at(square)
+        code = piece_type | (8 if board.occupied_co[chess.WHITE] & chess.BB_SQUARES[square] else 0)
+        pieces[i // 2] |= code << (4 * (i % 2))
+
+    flags = int(board.turn)
+    for bit, square in enumerate(CASTLING_SQUARES):
+        if board.castling_rights & chess.BB_SQUARES[square]:
+            flags |= 2 << bit
+    ep_square = board.ep_square if board.ep_square is not None else NO_EP_SQUARE
+    return KEYFRAME.pack(board.occupied, bytes(pieces), flags, ep_square,
+                         min(board.halfmove_clock, 0xFFFF), min(board.fullmove_number, 0xFFFF))
+
+
+def decode_position(data, offset: int = 0) -> chess.Board:
+    occupied, pieces, flags, ep_square, halfmove_clock, fullmove_number = KEYFRAME.unpack_from(data, offset)
+    board = chess.Board(None)
+    for i, square in enumerate(chess.scan_forward(occupied)):
+        code = (pieces[i // 2] >> (4 * (i % 2))) & 15
+        board.set_piece_at(square, chess.Piece(code & 7, bool(code & 8)))
+
+    board.turn = bool(flags & 1)
+    castling_rights = chess.BB_EMPTY
+    for bit, square in enumerate(CASTLING_SQUARES):
+        if flags & (2 << bit):
+            castling_rights |= chess.BB_SQUARES[square]
+    board.castling_rights = castling_rights
+    board.ep_square = ep_square if ep_square != NO_EP_SQUARE else None
+    board.halfmove_clock = halfmove_clock
+    board.fullmove_number = fullmove_number
+    return board
+
+
+class GameArchive:
+    """
+    Append-only archive of finished games in three files of a directory:
+    moves.bin (2 bytes per ply), keyframes.bin (a position every keyframe_interval plies, from ply 0)
+    and index.bin (one record per game). Files are read through mmap, so opening is instant and
+    a seek costs an index lookup, one keyframe decode and at most keyframe_interval - 1 pushes.
+
+    The moves and keyframes of the live game are appended to their files as they are played, and its
+    index record is written by end_game(). Until then it is readable as game len(archive).
+    """
+
+    def __init__(self, directory: str, keyframe_interval: int = 32) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.paths = {name: os.path.join(directory, f"{name}.bin") for name in ('index', 'moves', 'keyframes')}
+        for path in self.paths.values():
+            open(path, 'ab').close()
+
+        self._maps = {}  # name -> mmap
+        self._appends = {}  # name -> unbuffered file the live game is appended to
+
+        # The interval of an existing archive wins over the argument
+        if os.path.getsize(self.paths['index']) < HEADER.size:
+            self._write('index', 0, HEADER.pack(MAGIC, VERSION, keyframe_interval))
+        magic, version, self.keyframe_interval = HEADER.unpack_from(self._map('index'), 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.paths['index']} is not a version {VERSION} game archive")
+
+        # Data without an index record (interrupted write) is overwritten by the next game
+        self.games = (os.path.getsize(self.paths['index']) - HEADER.size) // INDEX.size
+        self.moves_count = 0
+        self.keyframes_count = 0
+        if self.games:
+            moves_offset, keyframes_offset, plies, _, _ = self._read_index(self.games - 1)
+            self.moves_count = moves_offset + plies
+            self.keyframes_count = keyframes_offset + plies // self.keyframe_interval + 1
+
+        # Copies of the live game's data, so reading it does not map the files again after every move
+        self.live_moves = None  # array('H') while a game is being recorded
+        self.live_keyframes = None  # list of encoded positions
+
+    def __len__(self) -> int:
+        return self.games
+
+    # -*-*- Recording -*-*-
+    def begin_game(self, board: chess.Board) -> int:
+        """Starts recording from the position of the board, returns the id of the game"""
+        self.end_game()
+        self.live_moves = array('H')
+        self.live_keyframes = []
+        self._append_keyframe(encode_position(board))
+        return self.games
+
+    def append_move(self, move: chess.Move, board: chess.Board) -> None:
+        """Records a move, board is the position after it"""
+        if self.live_moves is None:
+            return
+        code = encode_move(move)
+        self._append('moves', (self.moves_count + len(self.live_moves)) * MOVE.size, MOVE.pack(code))
+        self.live_moves.append(code)
+        if len(self.live_moves) % self.keyframe_interval == 0:
+            self._append_keyframe(encode_position(board))
+
+    def pop_move(self) -> None:
+        """Takes back the last move, its data is overwritten by the next one"""
+        if not self.live_moves:
+            return
+        if len(self.live_moves) % self.keyframe_interval == 0:
+            self.live_keyframes.pop()
+        self.live_moves.pop()
+
+    def _append_keyframe(self, keyframe: bytes) -> None:
+        self._append('keyframes', (self.keyframes_count + len(self.live_keyframes)) * KEYFRAME.size, keyframe)
+        self.live_keyframes.append(keyframe)
+
+    def end_game(self, result: EndResultState = EndResultState.ONGOING,
+                 winner: chess.Color | None = None) -> int | None:
+        """
+        Writes the index record of the live game, games without moves are dropped.
+        Returns the id of the written game.
+        """
+        if self.live_moves is None:
+            return None
+        moves, keyframes = self.live_moves, self.live_keyframes
+        self.live_moves = self.live_keyframes = None
+        if not moves:
+            return None
+
+        # The data is already on disk and the index record comes last, so a crash never indexes missing data
+        winner_code = -1 if winner is None else int(winner)
+        self._write('index', HEADER.size + self.games * INDEX.size,
+                    INDEX.pack(self.moves_count, self.keyframes_count, len(moves), result.value, winner_code))
+
+        self.moves_count += len(moves)
+        self.keyframes_count += len(keyframes)
+        self.games += 1
+        # Mapped again on the next read, so the mappings cover the new game
+        self._unmap('moves')
+        self._unmap('keyframes')
+        return self.games - 1
+
+    def _write(self, name: str, offset: int, data: bytes) -> None:
+        self._unmap(name)
+        with open(self.paths[name], 'r+b') as file:
+            file.seek(offset)
+            file.write(data)
+            file.truncate()
+
+    def _append(self, name: str, offset: int, data: bytes) -> None:
+        """
+        Writes data of the live game after the indexed data. Mappings stay valid, they are only read
+        up to the end of the indexed data.
+        """
+        file = self._appends.get(name)
+        if file is None:
+            file = self._appends[name] = open(self.paths[name], 'r+b', buffering=0)
+        file.seek(offset)
+        file.write(data)
+
+    def close(self) -> None:
+        self.end_game()
+        for name in list(self._maps):
+            self._unmap(name)
+        for file in self._appends.values():
+            file.close()
+        self._appends.clear()
+
+    # -*-*- Reading -*-*-
+    def _map(self, name: str):
+        """Read-only mmap of a file, this object is the only writer and unmaps it on every write"""
+        mapped = self._maps.get(name)
+        if mapped is None:
+            with open(self.paths[name], 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    return b''
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[name] = mapped
+        return mapped
+
+    def _unmap(self, name: str) -> None:
+        mapped = self._maps.pop(name, None)
+        if mapped is not None:
+            mapped.close()
+
+    def _read_index(self, game: int) -> tuple[int, int, int, int, int]:
+        if not 0 <= game < self.games:
+            raise IndexError(f"No game {game} in the archive")
+        return INDEX.unpack_from(self._map('index'), HEADER.size + game * INDEX.size)
+
+    def is_live(self, game: int) -> bool:
+        return game == self.games and self.live_moves is not None
+
+    def get_plies(self, game: int) -> int:
+        if self.is_live(game):
+            return len(self.live_moves)
+        return self._read_index(game)[2]
+
+    def get_result(self, game: int) -> tuple[EndResultState, chess.Color | None]:
+        if self.is_live(game):
+            return EndResultState.ONGOING, None
+        _, _, _, result, winner = self._read_index(game)
+        return EndResultState(result), None if winner < 0 else bool(winner)
+
+    def get_moves(self, game: int, start: int = 0, stop: int | None = None) -> list[chess.Move]:
+        if self.is_live(game):
+            return [decode_move(code) for code in self.live_moves[start:stop]]
+        moves_offset, _, plies, _, _ = self._read_index(game)
+        stop = plies if stop is None else min(stop, plies)
+        if stop <= start:
+            return []
+        codes = struct.unpack_from(f'<{stop - start}H', self._map('moves'), (moves_offset + start) * 2)
+        return [decode_move(code) for code in codes]
+
+    def board_at(self, game: int, ply: int) -> chess.Board:
+        """Position after ply moves of the game, from the nearest keyframe before it"""
+        plies = self.get_plies(game)
+        ply = max(0, min(ply, plies))
+        keyframe = ply // self.keyframe_interval
+        if self.is_live(game):
+            board = decode_position(self.live_keyframes[keyframe])
+        else:
+            _, keyframes_offset, _, _, _ = self._read_index(game)
+            board = decode_position(self._map('keyframes'), (keyframes_offset + keyframe) * KEYFRAME.size)
+        for move in self.get_moves(game, keyframe * self.keyframe_interval, ply):
+            board.push(move)
+        return board
@@ -5,53 +5,161 @@ from enum import Enum
 from scripts.settings import COLORS
 from scripts.UI.text import Text
 from scripts.notification import Notification
+from scripts.UI.compositor import Compositor
+from scripts.UI.sprites import SpriteAtlas
+from scripts.game.session import GameSession, EndResultState
+from scripts.game.archive import GameArchive
 
 class PromotionStateUI(Enum):
     NOT_PROMOTING = 0
     PROMOTING = 1
     PROMOTED = 2
 
-class EndResultState(Enum):
-    ONGOING = 0
-    CHECKMATE = 1
-    STALEMATE = 2
-    INSUFFICIENT_MATERIAL = 3
-    FIFTY_MOVE_RULE = 4
-    THREEFOLD_REPETITION = 5
-
 class Board:
 
-    def __init__(self, size: int, position: pygame.Vector2, images) -> None:
+    def __init__(self, size: int, position: pygame.Vector2, sprites: SpriteAtlas) -> None:
         self.board_size = size
         self.square_size = size // 8
         self.position = position
+        self.colors = COLORS
+
+        # Squares and coordinates never change during a game, see render_background
+        self.background = None
+        self.dirty_rects = []
+        self._last_frame_state = None
+        self._last_dragged_rect = None
 
-        self.images = images
+        self.sprites = sprites
+        self.images = {}
         self.current_square_position = None
 
         self.is_clicked = False
         self.active_square_index = None
-        self.counting_moves = 0
-        self.color_in_check = None
-        self.result = EndResultState.ONGOING
-        self.winner_color = None
-
-        self.white_graveyard = []
-        self.black_graveyard = []
 
         self.promotion_state = PromotionStateUI.NOT_PROMOTING
         self.move_under_promotion = None
         self.promoted_piece = None
 
-        self._cBoard = chess.Board()
-        self._cBoard.set_fen('7k/5Q2/6K1/8/8/8/8/8 w - - 0 1') # Checkmate or stalemate
-        #self._cBoard.set_fen('8/8/8/8/8/2k5/2p5/2K5 w - - 0 1') # Insufficient material
+        # Promotion picker and end-of-game banner, rendered when they appear, see update_overlays
+        self.overlays = Compositor()
+        self._overlay_state = None
+
+        # Rules and game state live in the session, the board only draws it and handles the mouse
+        self.session = GameSession('7k/5Q2/6K1/8/8/8/8/8 w - - 0 1') # Checkmate or stalemate
+        #self.session = GameSession('8/8/8/8/8/2k5/2p5/2K5 w - - 0 1') # Insufficient material
+        self._cBoard = self.session.board
+        self.archive = None  # Records the moves made on this board, see set_archive
+        self.archive_game = None  # Id of the current game in the archive
+        self.player_color = None  # Side the mouse may move, None lets one player move both
+        self.move_listeners = []  # Called with every move made with the mouse, e.g. to send it
+        self.confirm_moves = False  # Games ended by a mouse move wait for archive_result(), e.g. until a server accepts it
 
         self.transform_sprite_sizes(size=self.square_size)
+        self.render_background()
+
+    def set_session(self, session: GameSession) -> None:
+        """Shows another game on this board"""
+        self.session = session
+        self._cBoard = session.board
+        self.active_square_index = None
+        self.promotion_state = PromotionStateUI.NOT_PROMOTING
+        self.move_under_promotion = None
+        self.promoted_piece = None
+        self.invalidate()
+        if self.archive is not None:
+            self.begin_archive_game()
+
+    def set_archive(self, archive: GameArchive) -> None:
+        """Records the current and every following game of this board"""
+        self.archive = archive
+        self.begin_archive_game()
+
+    def begin_archive_game(self) -> None:
+        """
+        Records the session from its start position with the moves it already has, e.g. a line opened
+        in the variation tree, so archive plies and session plies count from the same position
+        """
+        board = self._cBoard.root()
+        self.archive_game = self.archive.begin_game(board)
+        for move in self._cBoard.move_stack:
+            board.push(move)
+            self.archive.append_move(move, board)
+
+    @property
+    def counting_moves(self) -> int:
+        return self.session.counting_moves
+
+    @property
+    def color_in_check(self) -> chess.Color | None:
+        return self.session.color_in_check
+
+    @property
+    def result(self) -> EndResultState:
+        return self.session.result
+
+    @property
+    def winner_color(self) -> chess.Color | None:
+        return self.session.winner_color
+
+    @property
+    def white_graveyard(self) -> list[str]:
+        return self.session.white_graveyard
+
+    @property
+    def black_graveyard(self) -> list[str]:
+        return self.session.black_graveyard
+
+    def resize(self, size: int) -> None:
+        self.board_size = size
+        self.square_size = size // 8
+        self.transform_sprite_sizes(size=self.square_size)
+        self.render_background()
+
+    def set_theme(self, colors: dict) -> None:
+        self.colors = colors
+        self.render_background()
+
+    def render_background(self) -> None:
+        """Pre-renders squares and coordinates, call it after a resize or theme change"""
+        self.background = pygame.Surface((self.square_size * 8, self.square_size * 8))
+        for x in range(8):
+            for y in range(8):
+                start_pos = (x*self.square_size, y*self.square_size)
+                if (x+y) % 2 == 0:
+                    pygame.draw.rect(self.background, self.colors['light_square'], (*start_pos, self.square_size, self.square_size))
+                else:
+                    pygame.draw.rect(self.background, self.colors['dark_square'], (*start_pos, self.square_size, self.square_size))
+
+        # add letters and numbers around the board
+        for i in range(8):
+            file = chess.FILE_NAMES[i].upper()
+            rank = chess.RANK_NAMES[i]
+            square_color = self.colors['dark_square'] if (i % 2 != 0) else self.colors['light_square']
+            Text(text=file, color=square_color, size_font=25).print(self.background,
+                                                             (i*self.square_size + self.square_size - 10,
+                                                              8*self.square_size - 10),
+                                                             center=True)
+            Text(text=rank, color=square_color, size_font=25).print(self.background,
+                                                             (10, (7 - i)*self.square_size + 10),
+                                                             center=True)
+        self._overlay_state = None  # The overlays use the same colors and sizes
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Marks the whole board as changed for the next frame"""
+        self._last_frame_state = None
+
+    def get_rect(self) -> pygame.Rect:
+        return pygame.Rect(*self.position, self.square_size * 8, self.square_size * 8)
+
+    def pop_dirty_rects(self) -> list[pygame.Rect]:
+        """Returns the screen areas changed by the last draw calls"""
+        dirty_rects = self.dirty_rects
+        self.dirty_rects = []
+        return dirty_rects
 
     def transform_sprite_sizes(self, size: int) -> None:
-        for key in self.images:
-            self.images[key] = pygame.transform.scale(self.images[key], (size, size))
+        self.images = self.sprites.get('Pieces', size)
 
     def update(self, dt: float, mouse_pos: pygame.Vector2) -> None:
         square_index = self.find_square_position_by_mouse_position(mouse_pos)
@@ -68,11 +176,14 @@ class Board:
             if self.promotion_state == PromotionStateUI.PROMOTED:
                 self.make_move_with_promotion(
                     chess.Move(
-                        self.move_under_promotion,
+                        self.move_under_promotion.from_square,
+                        self.move_under_promotion.to_square,
                         promotion=self.promoted_piece
                     )
                 )
                 self.end_move()
+                self.click_is_handled()
+                return
             
             if self.active_square_index is None:
                 self.active_square_index = square_index
@@ -84,14 +195,9 @@ class Board:
                 # --- Promotion handling ---
                 self.check_and_handle_promotion(move)
 
-                if self.is_move_legal(move):
-                    self.update_graveyard(move)
-                    self.make_move(move)
-                else:
-                    self.show_notification_for_incorrect_moves(move)
-                
-                self.control_check()
-                self.control_result()
+                if self.promotion_state == PromotionStateUI.NOT_PROMOTING:
+                    if not self.make_move(move):
+                        self.show_notification_for_incorrect_moves(move)
                 self.end_move()
 
             self.click_is_handled()
@@ -103,159 +209,180 @@ class Board:
         self.active_square_index = None
 
     def is_move_legal(self, move: chess.Move) -> bool:
-        return move in self._cBoard.legal_moves
-
-    def make_move(self, move: chess.Move) -> None:
-        self._cBoard.push(move)
-        self.counting_moves += 1
+        return self.session.is_move_legal(move)
+
+    def make_move(self, move: chess.Move) -> bool:
+        if self.player_color is not None and self._cBoard.turn != self.player_color:
+            return False
+        if self.player_color is not None and self.session.is_over():
+            return False  # A seated game ends at its result, a server refuses further moves
+        if not self.apply_move(move, confirmed=not self.confirm_moves):
+            return False
+        for listener in self.move_listeners:
+            listener(move)
+        return True
+
+    def apply_move(self, move: chess.Move, confirmed: bool = True) -> bool:
+        """
+        Plays a move that did not come from the mouse, e.g. the opponent's over the network.
+        An unconfirmed move may still be taken back, so a game it ends is not archived yet.
+        """
+        if not self.session.push(move):
+            return False
+        if self.archive is not None:
+            self.archive.append_move(move, self._cBoard)
+            if confirmed:
+                self.archive_result()
+        self.invalidate()
+        return True
+
+    def archive_result(self) -> None:
+        """Writes the game to the archive if it is over"""
+        if self.archive is not None and self.session.is_over() and self.archive.is_live(self.archive_game):
+            self.archive.end_game(self.result, self.winner_color)
+
+    def undo_move(self) -> chess.Move | None:
+        """Takes back the last move, e.g. one the server rejected"""
+        move = self.session.pop()
+        if move is not None:
+            if self.archive is not None:
+                self.archive.pop_move()
+            self.invalidate()
+        return move
 
     def make_move_with_promotion(self, move: chess.Move) -> None:
-        move = chess.Move(*self.move_under_promotion, promotion=self.promoted_piece)
-        if move in self._cBoard.legal_moves:
-            self._cBoard.push(move)
-            self.counting_moves += 1
+        self.make_move(move)
 
         self.move_under_promotion = None
         self.promoted_piece = None
         self.promotion_state = PromotionStateUI.NOT_PROMOTING
 
     def check_and_handle_promotion(self, move: chess.Move) -> None:
-        piece = self._cBoard.piece_at(move.from_square)
-        rank_index = chess.square_rank(move.to_square)
-        if piece is not None and piece.piece_type == chess.PAWN:
-            if (piece.color == chess.WHITE and rank_index == 7) or \
-                (piece.color == chess.BLACK and rank_index == 0):
-                self.promotion_state = PromotionStateUI.PROMOTING
-                self.move_under_promotion = move
-
-    def control_check(self) -> None:
-        if self._cBoard.is_check():
-            self.color_in_check = self._cBoard.turn
-        else:
-            self.color_in_check = None
-
-    def control_result(self) -> None:
-        if self._cBoard.is_checkmate():
-            self.result = EndResultState.CHECKMATE
-            self.winner_color = not self._cBoard.turn
-        elif self._cBoard.is_stalemate():
-            self.result = EndResultState.STALEMATE
-        elif self._cBoard.is_insufficient_material():
-            self.result = EndResultState.INSUFFICIENT_MATERIAL
-        elif self._cBoard.can_claim_fifty_moves():
-            self.result = EndResultState.FIFTY_MOVE_RULE
-        elif self._cBoard.can_claim_threefold_repetition():
-            self.result = EndResultState.THREEFOLD_REPETITION
+        if self.session.needs_promotion(move):
+            self.promotion_state = PromotionStateUI.PROMOTING
+            self.move_under_promotion = move
 
     def show_notification_for_incorrect_moves(self, move: chess.Move) -> None:
-        piece = self._cBoard.piece_at(move.from_square)
-        if (piece is not None) and (piece.color != self._cBoard.turn):
-            Notification("Not your turn!", 2.0)
+        if self.player_color is not None and self._cBoard.turn != self.player_color:
+            message = "Wait for your opponent!"
         else:
-            if move.from_square != move.to_square:
-                if move in self._cBoard.pseudo_legal_moves:
-                    if self._cBoard.is_check():
-                        Notification("Must escape Check!", 2.0)
-                    else:
-                        Notification("Piece is Pinned!", 2.0)
-                else:
-                    Notification("Incorrect Move!", 2.0)
-
-    def update_graveyard(self, maked_move: chess.Move) -> None:
-        if self._cBoard.is_capture(maked_move):
-            captured_piece = self._cBoard.piece_at(maked_move.to_square)
-            if captured_piece is not None:
-                if captured_piece.color == chess.WHITE:
-                    self.white_graveyard.append(captured_piece.symbol())
-                else:
-                    self.black_graveyard.append(captured_piece.symbol())
+            message = self.session.explain_illegal_move(move)
+        if message is not None:
+            Notification(message, 2.0)
 
     def draw(self, screen, mouse_pos, debug = False):
-        for x in range(8):
-            for y in range(8):
-                start_pos = (self.position[0] + x*self.square_size, self.position[1] + y*self.square_size)
-                if (x+y) % 2 == 0:                    
-                    pygame.draw.rect(screen, COLORS['light_square'], (*start_pos, self.square_size, self.square_size))
-                else:
-                    pygame.draw.rect(screen, COLORS['dark_square'], (*start_pos, self.square_size, self.square_size))
-        
+        screen.blit(self.background, self.position)
+
         # Check color highlight
         if self.color_in_check is not None:
             king_square = self._cBoard.king(self.color_in_check)
             if king_square is not None:
                 x = chess.square_file(king_square)
                 y = 7 - chess.square_rank(king_square)
-                pygame.draw.rect(screen, COLORS['check_highlight'], (
+                pygame.draw.rect(screen, self.colors['check_highlight'], (
                     self.position[0] + x*self.square_size,
                     self.position[1] + y*self.square_size,
                     self.square_size,
                     self.square_size)
                 )
 
-        # add letters and numbers around the board
-        for i in range(8):
-            file = chess.FILE_NAMES[i].upper()
-            rank = chess.RANK_NAMES[i]
-            square_color = COLORS['dark_square'] if (i % 2 != 0) else COLORS['light_square']
-            Text(text=file, color=square_color, size_font=25).print(screen,
-                                                             (self.position[0] + i*self.square_size + self.square_size - 10,
-                                                              self.position[1] + 8*self.square_size - 10),
-                                                             center=True)
-            Text(text=rank, color=square_color, size_font=25).print(screen,
-                                                             (self.position[0] + 10,
-                                                              self.position[1] + (7 - i)*self.square_size + 10),
-                                                             center=True)
-        pieces = self._cBoard.piece_map()
+        self.draw_legal_destinations(screen)
 
-        
+        pieces = self._cBoard.piece_map()
 
+        dragged_rect = None
         for square, piece in pieces.items():
             x = chess.square_file(square)
             y = 7 - chess.square_rank(square)
 
             if self.active_square_index is not None and (x, 7 - y) == self.active_square_index:
                 start_pos = (mouse_pos[0] - self.square_size // 2, mouse_pos[1] - self.square_size // 2)
+                dragged_rect = pygame.Rect(*start_pos, self.square_size, self.square_size)
             else:
                 start_pos = (self.position[0] + x*self.square_size, self.position[1] + y*self.square_size)
             
             screen.blit(self.images[piece.symbol()], start_pos)
 
+        self.update_overlays()
+        self.overlays.draw(screen, mouse_pos)
+
+        self.collect_dirty_rects(dragged_rect)
+
+    def update_overlays(self) -> None:
+        """Renders the promotion picker and the end-of-game banner again only when they change"""
+        overlay_state = (self.promotion_state, self._cBoard.turn, self.result, self.winner_color, self.square_size)
+        if overlay_state == self._overlay_state:
+            return
+        self._overlay_state = overlay_state
         if self.promotion_state == PromotionStateUI.PROMOTING:
-            self.draw_promotion_UI(screen)
+            self.overlays.show('promotion', self.render_promotion_UI(), self.get_promotion_rect().topleft)
+        else:
+            self.overlays.hide('promotion')
         if self.result != EndResultState.ONGOING:
-            self.draw_end_result_UI(screen, self.result)
+            banner = self.render_end_result_UI(self.result)
+            self.overlays.show('end_result', banner, banner.get_rect(center=self.get_rect().center).topleft)
+        else:
+            self.overlays.hide('end_result')
 
-    def draw_promotion_UI(self, screen) -> None:
-        is_white = self._cBoard.turn == chess.WHITE
-        pieces = ['q', 'r', 'b', 'n'] if not is_white else ['Q', 'R', 'B', 'N']
+    def draw_legal_destinations(self, screen) -> None:
+        if self.active_square_index is None:
+            return
+        from_square = chess.square(*self.active_square_index)
+        for to_square in self.session.legal_destinations(from_square):
+            x = chess.square_file(to_square)
+            y = 7 - chess.square_rank(to_square)
+            pygame.draw.circle(screen, self.colors['move_highlight'], (
+                self.position[0] + x*self.square_size + self.square_size // 2,
+                self.position[1] + y*self.square_size + self.square_size // 2),
+                self.square_size // 6
+            )
 
+    def collect_dirty_rects(self, dragged_rect: pygame.Rect | None) -> None:
+        # Anything but the dragged piece changes the whole board (moves, check, overlays)
+        frame_state = (self.counting_moves, len(self._cBoard.move_stack), self.color_in_check,
+                       self.active_square_index, self.promotion_state, self.result)
+        if frame_state != self._last_frame_state:
+            self._last_frame_state = frame_state
+            self.dirty_rects.append(self.get_rect())
+        if dragged_rect != self._last_dragged_rect:
+            for rect in (self._last_dragged_rect, dragged_rect):
+                if rect is not None:
+                    self.dirty_rects.append(rect)
+            self._last_dragged_rect = dragged_rect
+
+    def get_promotion_rect(self) -> pygame.Rect:
+        """Screen area of the promotion picker, border included"""
         width_size = self.square_size * 4 + 25
         height_size = self.square_size + 10
-        start_pos = (self.position[0] + (self.board_size - width_size) // 2,
-                     self.position[1] + (self.board_size - height_size) // 2)
-        
-        pygame.draw.rect(screen, COLORS['dark_square'], (
-            start_pos[0]-2, start_pos[1]-2, width_size+4, height_size+4)
-        )
-        pygame.draw.rect(screen, COLORS['light_square'], (*start_pos, width_size, height_size))
-        
-        for i, piece in enumerate(pieces):
-            piece_pos = (start_pos[0] + i * self.square_size + i * 5 + 5,
-                         start_pos[1] + 5)
-            pygame.draw.rect(screen, COLORS['dark_square'], (
-                piece_pos[0], piece_pos[1], self.square_size, self.square_size)
-            )
-            screen.blit(self.images[piece], piece_pos)
+        return pygame.Rect(self.position[0] + (self.board_size - width_size) // 2 - 2,
+                           self.position[1] + (self.board_size - height_size) // 2 - 2,
+                           width_size + 4, height_size + 4)
+
+    def get_promotion_piece_rects(self) -> list[pygame.Rect]:
+        """Queen, rook, bishop and knight buttons of the promotion picker, relative to its surface"""
+        return [pygame.Rect(2 + i * self.square_size + i * 5 + 5, 2 + 5, self.square_size, self.square_size)
+                for i in range(4)]
+
+    def render_promotion_UI(self) -> pygame.Surface:
+        is_white = self._cBoard.turn == chess.WHITE
+        pieces = ['q', 'r', 'b', 'n'] if not is_white else ['Q', 'R', 'B', 'N']
+
+        rect = self.get_promotion_rect()
+        surface = pygame.Surface(rect.size)
+        surface.fill(self.colors['dark_square'])
+        pygame.draw.rect(surface, self.colors['light_square'], (2, 2, rect.width - 4, rect.height - 4))
 
-    def draw_end_result_UI(self, screen, end_result: EndResultState) -> None:
+        for piece, piece_rect in zip(pieces, self.get_promotion_piece_rects()):
+            pygame.draw.rect(surface, self.colors['dark_square'], piece_rect)
+            surface.blit(self.images[piece], piece_rect)
+        return surface
+
+    def render_end_result_UI(self, end_result: EndResultState) -> pygame.Surface:
         width_size = self.square_size * 6
         height_size = self.square_size
-        start_pos = (self.position[0] + (self.board_size - width_size) // 2,
-                     self.position[1] + (self.board_size - height_size) // 2)
-        pygame.draw.rect(screen, COLORS['dark_square'], (
-            start_pos[0]-2, start_pos[1]-2, width_size+4, height_size+4)
-        )
-        pygame.draw.rect(screen, COLORS['light_square'], (*start_pos, width_size, height_size))
+        surface = pygame.Surface((width_size + 4, height_size + 4))
+        surface.fill(self.colors['dark_square'])
+        pygame.draw.rect(surface, self.colors['light_square'], (2, 2, width_size, height_size))
 
         message = ""
         if end_result == EndResultState.CHECKMATE:
@@ -269,10 +396,10 @@ class Board:
             message = "Draw by fifty-move rule."
         elif end_result == EndResultState.THREEFOLD_REPETITION:
             message = "Draw by threefold repetition."
-        Text(text=message, color=(0,0,0), size_font=30).print(screen,
-                                                             (start_pos[0] + width_size // 2,
-                                                              start_pos[1] + height_size // 2),
+        Text(text=message, color=(0,0,0), size_font=30).print(surface,
+                                                             (2 + width_size // 2, 2 + height_size // 2),
                                                              center=True)
+        return surface
 
     def click(self, mouse_pos: pygame.Vector2) -> None:
         self.is_clicked = True
@@ -282,24 +409,12 @@ class Board:
 
     def handle_promotion_click(self, mouse_pos: pygame.Vector2) -> None:
         if self.promotion_state == PromotionStateUI.PROMOTING:
-            width_size = self.square_size * 4 + 25
-            height_size = self.square_size + 10
-            start_pos = (self.position[0] + (self.board_size - width_size) // 2,
-                         self.position[1] + (self.board_size - height_size) // 2)
-            
-            for i in range(4):
-                piece_pos = (start_pos[0] + i * self.square_size + i * 5 + 5,
-                             start_pos[1] + 5)
-                rect = pygame.Rect(piece_pos[0], piece_pos[1], self.square_size, self.square_size)
-                if rect.collidepoint(mouse_pos):
-                    if i == 0:
-                        self.promoted_piece = chess.QUEEN 
-                    elif i == 1:
-                        self.promoted_piece = chess.ROOK
-                    elif i == 2:
-                        self.promoted_piece = chess.BISHOP
-                    elif i == 3:
-                        self.promoted_piece = chess.KNIGHT
+            picker = self.get_promotion_rect()
+            local_pos = (mouse_pos[0] - picker.x, mouse_pos[1] - picker.y)
+            pieces = [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT]
+            for piece, rect in zip(pieces, self.get_promotion_piece_rects()):
+                if rect.collidepoint(local_pos):
+                    self.promoted_piece = piece
                     self.promotion_state = PromotionStateUI.PROMOTED
                     break
 
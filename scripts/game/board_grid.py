@@ -0,0 +1,173 @@
+import math
+
+import chess
+import pygame
+
+from scripts.settings import COLORS, GRID_RENDERS_PER_FRAME
+from scripts.UI.text import Text
+from scripts.UI.sprites import SpriteAtlas
+
+LABEL_HEIGHT = 14  # Game id, ply and score under every board
+
+
+# Class GridTile - one game of the grid and its rendered surface.
+# game is any object with session, score and game_id attributes, e.g. a WatchedGame of a SpectatorFeed.
+class GridTile:
+
+    def __init__(self, game) -> None:
+        self.game = game
+        self.surface = None
+        self.rendered_state = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+
+    def state(self) -> tuple:
+        """Everything the tile shows; the surface is rendered again only when this changes"""
+        session = self.game.session
+        if session is None:
+            return (None, self.rect.size)
+        return (id(session), session.position_key, session.ply, session.color_in_check, session.result,
+                self.game.score, self.rect.size)
+
+
+# Class BoardGrid - many games at once, e.g. for tournament monitoring. Every tile is drawn from its own
+# cached surface and rendered again only when its game changes, at most renders_per_frame tiles per frame
+# so a burst of moves does not stall a frame. Squares are pre-rendered once per tile size and the pieces
+# come from the shared SpriteAtlas. Clicking a tile shows it alone, clicking again goes back to the grid.
+class BoardGrid:
+
+    def __init__(self, size: int, position: pygame.Vector2, sprites: SpriteAtlas,
+                 renders_per_frame: int = GRID_RENDERS_PER_FRAME) -> None:
+        self.size = size
+        self.position = position
+        self.sprites = sprites
+        self.colors = COLORS
+        self.renders_per_frame = renders_per_frame
+
+        self.tiles = []
+        self.zoomed = None  # Tile shown alone
+        self.backgrounds = {}  # board size -> pre-rendered squares
+        self.dirty_rects = []
+        self.layout_changed = True
+        self.render_cursor = 0  # Tile checked first in the next frame, so every tile gets its turn
+
+        self.renders = 0
+
+    def set_games(self, games) -> None:
+        self.tiles = [GridTile(game) for game in games]
+        self.zoomed = None
+        self.layout()
+
+    def layout(self) -> None:
+        """Square-ish grid of equal tiles, or the zoomed tile over the whole area"""
+        if self.zoomed is not None:
+            for tile in self.tiles:
+                tile.rect = pygame.Rect(0, 0, 0, 0)
+            self.zoomed.rect = pygame.Rect(*self.position, self.size, self.size)
+        elif self.tiles:
+            columns = math.ceil(math.sqrt(len(self.tiles)))
+            rows = math.ceil(len(self.tiles) / columns)
+            cell = self.size // max(columns, rows)
+            board_size = ((cell - 4 - LABEL_HEIGHT) // 8) * 8
+            for i, tile in enumerate(self.tiles):
+                x = self.position[0] + (i % columns) * cell + 2
+                y = self.position[1] + (i // columns) * cell + 2
+                tile.rect = pygame.Rect(x, y, board_size, board_size + LABEL_HEIGHT)
+        self.layout_changed = True
+
+    def get_background(self, board_size: int) -> pygame.Surface:
+        if board_size not in self.backgrounds:
+            square = board_size // 8
+            background = pygame.Surface((board_size, board_size))
+            for x in range(8):
+                for y in range(8):
+                    color = self.colors['light_square'] if (x + y) % 2 == 0 else self.colors['dark_square']
+                    pygame.draw.rect(background, color, (x * square, y * square, square, square))
+            self.backgrounds[board_size] = background
+        return self.backgrounds[board_size]
+
+    def render_tile(self, tile: GridTile) -> None:
+        width, height = tile.rect.size
+        board_size = (min(width, height - LABEL_HEIGHT) // 8) * 8
+        square = board_size // 8
+        surface = pygame.Surface((width, height))
+        surface.fill(self.colors['background'])
+        surface.blit(self.get_background(board_size), (0, 0))
+
+        session = tile.game.session
+        if session is not None:
+            board = session.board
+            if session.color_in_check is not None:
+                king_square = board.king(session.color_in_check)
+                if king_square is not None:
+                    pygame.draw.rect(surface, self.colors['check_highlight'], (
+                        chess.square_file(king_square) * square, (7 - chess.square_rank(king_square)) * square,
+                        square, square))
+            images = self.sprites.get('Pieces', square)
+            surface.blits([
+                (images[piece.symbol()], (chess.square_file(sq) * square, (7 - chess.square_rank(sq)) * square))
+                for sq, piece in board.piece_map().items()
+            ])
+
+        label = f"#{tile.game.game_id}"
+        if session is None:
+            label += "  waiting"
+        else:
+            label += f"  ply {session.ply}"
+            if session.is_over():
+                label += f"  {session.result.name.lower().replace('_', ' ')}"
+            elif tile.game.score is not None:
+                label += f"  {tile.game.score}"
+        Text(label, self.colors['white_piece'], 16).print(surface, (2, board_size + 1), False)
+
+        tile.surface = surface
+        tile.rendered_state = tile.state()
+        self.renders += 1
+
+    def visible_tiles(self) -> list[GridTile]:
+        return [self.zoomed] if self.zoomed is not None else self.tiles
+
+    def update(self) -> None:
+        """Renders the tiles whose game changed, within the per-frame budget"""
+        tiles = self.visible_tiles()
+        start = self.render_cursor % len(tiles) if tiles else 0
+        budget = self.renders_per_frame
+        for i in range(start, start + len(tiles)):
+            tile = tiles[i % len(tiles)]
+            if tile.surface is not None and tile.rendered_state == tile.state():
+                continue
+            if tile.surface is not None and budget <= 0:
+                continue  # Shown in a later frame; tiles without any surface are always rendered
+            self.render_tile(tile)
+            self.dirty_rects.append(tile.rect.copy())
+            budget -= 1
+            self.render_cursor = i + 1
+
+    def has_pending(self) -> bool:
+        """True if some changed tile waits for its render"""
+        return any(tile.rendered_state != tile.state() for tile in self.visible_tiles())
+
+    def handle_click(self, mouse_pos) -> bool:
+        if self.zoomed is not None:
+            self.zoomed = None
+        else:
+            self.zoomed = next((tile for tile in self.tiles if tile.rect.collidepoint(mouse_pos)), None)
+            if self.zoomed is None:
+                return False
+        self.layout()
+        return True
+
+    def get_rect(self) -> pygame.Rect:
+        return pygame.Rect(*self.position, self.size, self.size)
+
+    def draw(self, screen, mouse_pos) -> None:
+        self.update()
+        for tile in self.visible_tiles():
+            screen.blit(tile.surface, tile.rect)
+        if self.layout_changed:
+            self.layout_changed = False
+            self.dirty_rects.append(self.get_rect())
+
+    def pop_dirty_rects(self) -> list[pygame.Rect]:
+        dirty_rects = self.dirty_rects
+        self.dirty_rects = []
+        return dirty_rects
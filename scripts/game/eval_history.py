@@ -0,0 +1,81 @@
+from array import array
+
+import chess
+import chess.engine
+
+from scripts.game.archive import encode_move, decode_move
+
+MATE_SCORE = 10_000  # Centipawns stored for a mate, minus the distance to it
+
+
+class EvalHistory:
+    """
+    Deepest known evaluation of every ply of one game, in flat arrays:
+    score in centipawns from White's point of view, depth (0 = not evaluated yet)
+    and the best move in the 16-bit encoding of the game archive (0 = none).
+    """
+
+    def __init__(self) -> None:
+        self.scores = array('i')
+        self.depths = array('H')
+        self.best_moves = array('H')
+        self._changed_from = None  # Lowest ply changed since pop_changed_from
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def set(self, ply: int, score: chess.engine.PovScore, depth: int, best_move: chess.Move | None) -> bool:
+        """Stores the evaluation of the ply unless a deeper one is known, returns True if it changed"""
+        if ply >= len(self):
+            missing = ply + 1 - len(self)
+            self.scores.extend([0] * missing)
+            self.depths.extend([0] * missing)
+            self.best_moves.extend([0] * missing)
+            self._mark(len(self) - missing)
+        elif depth < self.depths[ply]:
+            return False
+
+        value = score.white().score(mate_score=MATE_SCORE)
+        depth = max(depth, 1)  # Positions without legal moves are reported at depth 0
+        move_code = encode_move(best_move) if best_move is not None else 0
+        if (self.scores[ply], self.depths[ply], self.best_moves[ply]) == (value, depth, move_code):
+            return False
+        self.scores[ply] = value
+        self.depths[ply] = depth
+        self.best_moves[ply] = move_code
+        self._mark(ply)
+        return True
+
+    def get(self, ply: int) -> tuple[int, int, chess.Move | None] | None:
+        """(score, depth, best move) of the ply, None if it was not evaluated"""
+        if ply >= len(self) or self.depths[ply] == 0:
+            return None
+        move_code = self.best_moves[ply]
+        return self.scores[ply], self.depths[ply], decode_move(move_code) if move_code else None
+
+    def score_at(self, ply: int) -> int | None:
+        if self.depths[ply] == 0:
+            return None
+        return self.scores[ply]
+
+    def truncate(self, plies: int) -> None:
+        """Forgets the plies from plies on, after a takeback"""
+        if plies >= len(self):
+            return
+        del self.scores[plies:]
+        del self.depths[plies:]
+        del self.best_moves[plies:]
+        self._mark(plies)
+
+    def clear(self) -> None:
+        self.truncate(0)
+
+    def _mark(self, ply: int) -> None:
+        if self._changed_from is None or ply < self._changed_from:
+            self._changed_from = ply
+
+    def pop_changed_from(self) -> int | None:
+        """Lowest ply changed since the last call, None if nothing changed"""
+        changed_from = self._changed_from
+        self._changed_from = None
+        return changed_from
@@ -0,0 +1,163 @@
+import chess
+import numpy as np
+
+SOURCE_ROOT = 0
+SOURCE_PLAYED = 1  # Moves made on the board
+SOURCE_ENGINE = 2  # Principal variations of the engine
+
+
+class MoveTree:
+    """
+    Every line explored from one start position: the moves played on the board and the engine's PVs.
+    Nodes are rows of flat lists (parent, move, SAN, ply, source) instead of objects, so a tree of tens of
+    thousands of nodes stays small, and the layout is kept in NumPy arrays for the batched transforms
+    of the explorer.
+
+    Layout: x is the ply, y is a row. The first child stays in the row of its parent, so the line
+    explored first is a straight line, and every other child starts a new row below the subtree of
+    its older sibling. A subtree therefore covers a contiguous range of rows.
+    """
+
+    def __init__(self, fen: str = chess.STARTING_FEN) -> None:
+        self.fen = fen
+        self.start_ply = chess.Board(fen).ply()  # Plies before the start position, for move numbers
+        self.parents = [-1]
+        self.moves = [None]
+        self.sans = ['']
+        self.plies = [0]
+        self.sources = [SOURCE_ROOT]
+        self.children = [{}]  # Per node: move -> child node, in the order they were explored
+        self.version = 0  # Incremented with every new node, views compare it to know when to draw again
+
+        self.layout_version = -1
+        self.xs = np.zeros(1)
+        self.ys = np.zeros(1)
+        self.last_rows = np.zeros(1)  # Row of the last child, the vertical edge of a node ends there
+        self.played = np.zeros(1, dtype=bool)  # Node is part of a line played on the board
+        self.index = ColumnIndex()
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def add_line(self, moves, source: int = SOURCE_PLAYED) -> int:
+        """
+        Adds the moves from the start position, existing nodes are reused.
+        An engine line that later gets played keeps its node but becomes a played one.
+        Adding stops at the first illegal move, e.g. of a PV that belongs to another game.
+        :return: Node of the last added move
+        """
+        node = 0
+        board = None  # Only replayed when the line has new nodes, their SAN needs the position
+        for move in moves:
+            child = self.children[node].get(move)
+            if child is None:
+                if board is None:
+                    board = self.board_at(node)
+                if not board.is_legal(move):
+                    break
+                child = len(self.parents)
+                self.children[node][move] = child
+                self.parents.append(node)
+                self.moves.append(move)
+                self.sans.append(board.san(move))
+                self.plies.append(self.plies[node] + 1)
+                self.sources.append(source)
+                self.children.append({})
+                self.version += 1
+            elif source == SOURCE_PLAYED and self.sources[child] != SOURCE_PLAYED:
+                self.sources[child] = SOURCE_PLAYED
+                self.version += 1
+            if board is not None:
+                board.push(move)
+            node = child
+        return node
+
+    def find_line(self, moves) -> int | None:
+        """Node of the moves from the start position, None if that line was never explored"""
+        node = 0
+        for move in moves:
+            node = self.children[node].get(move)
+            if node is None:
+                return None
+        return node
+
+    def line_to(self, node: int) -> list[chess.Move]:
+        moves = []
+        while node > 0:
+            moves.append(self.moves[node])
+            node = self.parents[node]
+        moves.reverse()
+        return moves
+
+    def board_at(self, node: int) -> chess.Board:
+        board = chess.Board(self.fen)
+        for move in self.line_to(node):
+            board.push(move)
+        return board
+
+    def layout(self) -> None:
+        """Places the nodes if the tree changed since the last call, see the class docstring"""
+        if self.layout_version == self.version:
+            return
+        rows = [0] * len(self.parents)
+        row = 0
+        stack = [0]
+        while stack:  # Pre-order walk, children in the order they were explored
+            node = stack.pop()
+            rows[node] = row
+            children = self.children[node]
+            if children:
+                stack.extend(reversed(children.values()))
+            else:
+                row += 1
+        rows = np.array(rows, dtype=float)
+        last_rows = rows.copy()  # Leaves end in their own row
+        np.maximum.at(last_rows, self.parents[1:], rows[1:])
+
+        self.xs = np.array(self.plies, dtype=float)
+        self.ys = rows
+        self.last_rows = last_rows
+        self.played = np.array(self.sources) == SOURCE_PLAYED
+        self.index.build(self.plies, rows, last_rows)
+        self.layout_version = self.version
+
+
+class ColumnIndex:
+    """
+    Spatial index of the tree layout. Nodes are bucketed by column (ply) and sorted by row inside
+    a column, so the nodes of a rectangle are found with two binary searches per visible column,
+    however many nodes the tree has.
+    """
+
+    def __init__(self) -> None:
+        self.order = np.zeros(0, dtype=np.int64)  # Nodes sorted by column, then row
+        self.rows = np.zeros(0)  # Row of every node in that order
+        self.starts = np.zeros(1, dtype=np.int64)  # First position of every column in order
+        self.last_rows = np.zeros(0)
+
+    def build(self, columns, rows, last_rows) -> None:
+        columns = np.asarray(columns, dtype=np.int64)
+        rows = np.asarray(rows, dtype=float)
+        self.order = np.lexsort((rows, columns))
+        self.rows = rows[self.order]
+        self.last_rows = np.asarray(last_rows, dtype=float)[self.order]
+        self.starts = np.searchsorted(columns[self.order], np.arange(columns.max() + 2))
+
+    def query(self, left: float, top: float, right: float, bottom: float) -> np.ndarray:
+        """Nodes inside the rectangle, plus the node above it whose edge to its children crosses it"""
+        first = max(int(np.floor(left)), 0)
+        last = min(int(np.ceil(right)), len(self.starts) - 2)
+        found = []
+        for column in range(first, last + 1):
+            start, end = self.starts[column], self.starts[column + 1]
+            rows = self.rows[start:end]
+            low = int(np.searchsorted(rows, top))
+            high = int(np.searchsorted(rows, bottom, side='right'))
+            # Subtrees cover contiguous rows, so only the closest node above can reach into the rectangle
+            if low > 0 and self.last_rows[start + low - 1] >= top:
+                low -= 1
+            if high > low:
+                found.append(self.order[start + low:start + high])
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(found)
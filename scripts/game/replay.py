@@ -0,0 +1,118 @@
+import pygame
+
+from scripts.UI.text import Text
+from scripts.UI.sprites import SpriteAtlas
+from scripts.game.board import Board
+from scripts.game.session import GameSession
+from scripts.game.archive import GameArchive
+
+
+# Class ReplayViewer - shows archived games on its own Board, with a scrub bar along the bottom edge.
+# Stepping one ply forward pushes a single move, any other jump seeks through the archive keyframes.
+class ReplayViewer:
+
+    def __init__(self, size: int, position: pygame.Vector2, sprites: SpriteAtlas, archive: GameArchive) -> None:
+        self.archive = archive
+        self.board = Board(size, position, sprites)
+        self.bar_rect = pygame.Rect(position[0], position[1] + size - 18, size, 18)
+        self.colors = self.board.colors
+
+        self.game = None
+        self.ply = 0
+        self.plies = 0
+        self.is_scrubbing = False
+        self._last_bar_state = None
+
+    def open(self, game: int, ply: int | None = None) -> None:
+        """Shows the game at ply, or at its last position"""
+        self.game = game
+        self.plies = self.archive.get_plies(game)
+        self.ply = -1
+        self.seek(self.plies if ply is None else ply)
+
+    def open_latest(self) -> bool:
+        """Opens the game being recorded, or the last archived one"""
+        latest = len(self.archive) if self.archive.is_live(len(self.archive)) else len(self.archive) - 1
+        if latest < 0:
+            return False
+        self.open(latest)
+        return True
+
+    def seek(self, ply: int) -> None:
+        # The live game can grow while it is shown
+        self.plies = self.archive.get_plies(self.game)
+        ply = max(0, min(ply, self.plies))
+        if ply == self.ply:
+            return
+
+        if ply == self.ply + 1:
+            board = self.board.get_board().copy(stack=False)
+            board.push(self.archive.get_moves(self.game, self.ply, ply)[0])
+        else:
+            board = self.archive.board_at(self.game, ply)
+        self.ply = ply
+
+        session = GameSession(board.fen())
+        if ply == self.plies:
+            session.result, session.winner_color = self.archive.get_result(self.game)
+        self.board.set_session(session)
+
+    def step(self, plies: int) -> None:
+        self.seek(self.ply + plies)
+
+    def switch_game(self, offset: int) -> None:
+        last = len(self.archive) if self.archive.is_live(len(self.archive)) else len(self.archive) - 1
+        game = max(0, min(self.game + offset, last))
+        if game != self.game:
+            self.open(game, 0)
+
+    def handle_event(self, event) -> None:
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_LEFT:
+                self.step(-1)
+            elif event.key == pygame.K_RIGHT:
+                self.step(1)
+            elif event.key == pygame.K_PAGEUP:
+                self.step(-10)
+            elif event.key == pygame.K_PAGEDOWN:
+                self.step(10)
+            elif event.key == pygame.K_HOME:
+                self.seek(0)
+            elif event.key == pygame.K_END:
+                self.seek(self.plies)
+            elif event.key == pygame.K_UP:
+                self.switch_game(-1)
+            elif event.key == pygame.K_DOWN:
+                self.switch_game(1)
+        elif event.type == pygame.MOUSEWHEEL:
+            self.step(-event.y)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.bar_rect.collidepoint(event.pos):
+            self.is_scrubbing = True
+            self.scrub(event.pos)
+        elif event.type == pygame.MOUSEMOTION and self.is_scrubbing:
+            self.scrub(event.pos)
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.is_scrubbing = False
+
+    def scrub(self, mouse_pos) -> None:
+        fraction = (mouse_pos[0] - self.bar_rect.x) / self.bar_rect.width
+        self.seek(round(fraction * self.plies))
+
+    def draw(self, screen, mouse_pos) -> None:
+        self.board.draw(screen, mouse_pos)
+
+        pygame.draw.rect(screen, self.colors['dark_square'], self.bar_rect)
+        if self.plies:
+            progress = self.bar_rect.width * self.ply // self.plies
+            pygame.draw.rect(screen, self.colors['move_highlight'],
+                             (self.bar_rect.x, self.bar_rect.y, progress, self.bar_rect.height))
+        Text(f"Replay - game {self.game + 1}  ply {self.ply}/{self.plies}", (0, 0, 0), 20).print(
+            screen, (self.bar_rect.x + 5, self.bar_rect.y + 3), False)
+
+        bar_state = (self.game, self.ply, self.plies)
+        if bar_state != self._last_bar_state:
+            self._last_bar_state = bar_state
+            self.board.dirty_rects.append(self.bar_rect.copy())
+
+    def pop_dirty_rects(self) -> list[pygame.Rect]:
+        return self.board.pop_dirty_rects()
@@ -0,0 +1,286 @@
+import chess
+import chess.polyglot
+from collections import Counter
+from enum import Enum
+
+class EndResultState(Enum):
+    ONGOING = 0
+    CHECKMATE = 1
+    STALEMATE = 2
+    INSUFFICIENT_MATERIAL = 3
+    FIFTY_MOVE_RULE = 4
+    THREEFOLD_REPETITION = 5
+
+# Index of the light-squared bishops in a material signature, next to the piece types 1..6
+LIGHT_BISHOPS = 7
+
+def material_signature(board: chess.Board) -> list[list[int]]:
+    """Amount of every piece type per color, plus the bishops on light squares"""
+    material = [[0] * 8, [0] * 8]
+    for square, piece in board.piece_map().items():
+        add_material(material, piece, square, 1)
+    return material
+
+def add_material(material: list[list[int]], piece: chess.Piece, square: chess.Square, amount: int) -> None:
+    row = material[piece.color]
+    row[piece.piece_type] += amount
+    if piece.piece_type == chess.BISHOP and chess.BB_SQUARES[square] & chess.BB_LIGHT_SQUARES:
+        row[LIGHT_BISHOPS] += amount
+
+def has_insufficient_material(material: list[list[int]], color: chess.Color) -> bool:
+    """Same rules as chess.Board.has_insufficient_material, but from the signature"""
+    us, them = material[color], material[not color]
+    if us[chess.PAWN] or us[chess.ROOK] or us[chess.QUEEN]:
+        return False
+    if us[chess.KNIGHT]:
+        # A lone knight can only mate when the opponent has pieces to block their own king
+        own_pieces = us[chess.KNIGHT] + us[chess.BISHOP] + us[chess.KING]
+        return own_pieces <= 2 and not (them[chess.PAWN] or them[chess.KNIGHT] or them[chess.BISHOP] or them[chess.ROOK])
+    if us[chess.BISHOP]:
+        bishops = us[chess.BISHOP] + them[chess.BISHOP]
+        light_bishops = us[LIGHT_BISHOPS] + them[LIGHT_BISHOPS]
+        same_color = light_bishops == 0 or light_bishops == bishops
+        return same_color and not (us[chess.PAWN] or them[chess.PAWN] or us[chess.KNIGHT] or them[chess.KNIGHT])
+    return True
+
+
+class MoveIndex:
+    """Legal and pseudo-legal moves of one position, grouped by from-square and to-square"""
+
+    def __init__(self, board: chess.Board) -> None:
+        self.board = board
+        self.legal = self._group(board.generate_legal_moves())
+        self._pseudo_legal = None  # Only needed to explain illegal moves
+
+    @property
+    def pseudo_legal(self) -> dict[chess.Square, dict[chess.Square, list[chess.Move]]]:
+        if self._pseudo_legal is None:
+            self._pseudo_legal = self._group(self.board.generate_pseudo_legal_moves())
+        return self._pseudo_legal
+
+    @staticmethod
+    def _group(moves) -> dict[chess.Square, dict[chess.Square, list[chess.Move]]]:
+        grouped = {}
+        for move in moves:
+            grouped.setdefault(move.from_square, {}).setdefault(move.to_square, []).append(move)
+        return grouped
+
+    def is_legal(self, move: chess.Move) -> bool:
+        return move in self.legal.get(move.from_square, {}).get(move.to_square, ())
+
+    def is_pseudo_legal(self, move: chess.Move) -> bool:
+        return move in self.pseudo_legal.get(move.from_square, {}).get(move.to_square, ())
+
+    def has_legal_moves(self) -> bool:
+        return bool(self.legal)
+
+    def destinations(self, from_square: chess.Square):
+        """Squares the piece on from_square can legally move to"""
+        return self.legal.get(from_square, {}).keys()
+
+
+class GameSession:
+    """
+    Rules and state of one game without any rendering, so it can also run on a server.
+    Board wraps it for the pygame UI.
+
+    Game end is detected incrementally: repetitions are counted per Zobrist key and the
+    material signature is updated on every push/pop, so checking the result after a move
+    does not depend on the length of the game.
+    """
+
+    def __init__(self, fen: str | None = None, start_ply: int = 0) -> None:
+        self.board = chess.Board() if fen is None else chess.Board(fen)
+        self.start_ply = start_ply  # Plies played before the fen, e.g. when joining a game in progress
+
+        self.counting_moves = 0
+        self.color_in_check = None
+        self.result = EndResultState.ONGOING
+        self.winner_color = None
+
+        self.white_graveyard = []
+        self.black_graveyard = []
+
+        self.position_key = chess.polyglot.zobrist_hash(self.board)
+        self.repetitions = Counter([self.position_key])
+        self.material = material_signature(self.board)
+        self._undo = []  # Per ply: (position key, material before the move, graveyard of the captured piece)
+        self._move_index = None  # Built on first use for every position
+
+        self.control_check()
+        self.control_result()  # A position set up from a FEN may be over already
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'GameSession':
+        """
+        Session of a state message (see get_state), e.g. to resync with a server. The sender's result
+        wins, as a FEN alone cannot tell e.g. a threefold repetition.
+        """
+        session = cls(state["fen"], start_ply=state["ply"])
+        result = EndResultState.__members__.get(state.get("result"))
+        if result is not None:
+            session.result = result
+            session.winner_color = None
+            winner = state.get("winner")
+            if winner in chess.COLOR_NAMES:
+                session.winner_color = chess.COLOR_NAMES.index(winner) == chess.WHITE
+        return session
+
+    @property
+    def ply(self) -> int:
+        return self.start_ply + len(self.board.move_stack)
+
+    @property
+    def move_index(self) -> MoveIndex:
+        if self._move_index is None:
+            self._move_index = MoveIndex(self.board)
+        return self._move_index
+
+    def key_at(self, ply: int) -> int | None:
+        """Zobrist key of the position after ply moves of the game, None before start_ply"""
+        index = ply - self.start_ply
+        if index == len(self._undo):
+            return self.position_key
+        if 0 <= index < len(self._undo):
+            return self._undo[index][0]
+        return None
+
+    def is_move_legal(self, move: chess.Move) -> bool:
+        return self.move_index.is_legal(move)
+
+    def legal_destinations(self, from_square: chess.Square):
+        return self.move_index.destinations(from_square)
+
+    def needs_promotion(self, move: chess.Move) -> bool:
+        """True if the move is a legal pawn move to the last rank without a chosen piece"""
+        if move.promotion is not None:
+            return False
+        piece = self.board.piece_at(move.from_square)
+        if piece is None or piece.piece_type != chess.PAWN:
+            return False
+        rank_index = chess.square_rank(move.to_square)
+        if (piece.color == chess.WHITE and rank_index == 7) or \
+            (piece.color == chess.BLACK and rank_index == 0):
+            return self.is_move_legal(chess.Move(move.from_square, move.to_square, promotion=chess.QUEEN))
+        return False
+
+    def push(self, move: chess.Move) -> bool:
+        """Makes the move if it is legal and updates check, result and graveyards"""
+        if not self.is_move_legal(move):
+            return False
+        graveyard = self.update_graveyard(move)
+        material = self.update_material(move)
+        self._undo.append((self.position_key, material, graveyard))
+
+        self.board.push(move)
+        self._move_index = None
+        self.counting_moves += 1
+        self.position_key = chess.polyglot.zobrist_hash(self.board)
+        self.repetitions[self.position_key] += 1
+
+        self.control_check()
+        self.control_result()
+        return True
+
+    def pop(self) -> chess.Move | None:
+        """Takes back the last move made through push"""
+        if not self._undo:
+            return None
+        self.repetitions[self.position_key] -= 1
+        if self.repetitions[self.position_key] == 0:
+            del self.repetitions[self.position_key]
+        self.position_key, self.material, graveyard = self._undo.pop()
+        if graveyard is not None:
+            graveyard.pop()
+
+        move = self.board.pop()
+        self._move_index = None
+        self.counting_moves -= 1
+        self.result = EndResultState.ONGOING
+        self.winner_color = None
+        self.control_check()
+        self.control_result()
+        return move
+
+    def update_material(self, move: chess.Move) -> list[list[int]]:
+        """Updates the material signature for the move, returns the signature before it"""
+        before = [row[:] for row in self.material]
+        if self.board.is_en_passant(move):
+            captured_square = move.to_square + (-8 if self.board.turn == chess.WHITE else 8)
+        else:
+            captured_square = move.to_square
+        captured_piece = self.board.piece_at(captured_square)
+        if captured_piece is not None and captured_piece.color != self.board.turn:
+            add_material(self.material, captured_piece, captured_square, -1)
+        if move.promotion is not None:
+            add_material(self.material, chess.Piece(chess.PAWN, self.board.turn), move.from_square, -1)
+            add_material(self.material, chess.Piece(move.promotion, self.board.turn), move.to_square, 1)
+        return before
+
+    def push_uci(self, uci: str) -> chess.Move | None:
+        try:
+            move = chess.Move.from_uci(uci)
+        except ValueError:
+            return None
+        return move if self.push(move) else None
+
+    def explain_illegal_move(self, move: chess.Move) -> str | None:
+        """Message for the player, None if there is nothing to explain (e.g. the same square)"""
+        piece = self.board.piece_at(move.from_square)
+        if (piece is not None) and (piece.color != self.board.turn):
+            return "Not your turn!"
+        if move.from_square == move.to_square:
+            return None
+        if self.move_index.is_pseudo_legal(move):
+            if self.color_in_check is not None:
+                return "Must escape Check!"
+            return "Piece is Pinned!"
+        return "Incorrect Move!"
+
+    def update_graveyard(self, maked_move: chess.Move) -> list[str] | None:
+        """Adds the captured piece to its graveyard and returns that graveyard"""
+        if self.board.is_capture(maked_move):
+            captured_piece = self.board.piece_at(maked_move.to_square)
+            if captured_piece is not None:
+                if captured_piece.color == chess.WHITE:
+                    self.white_graveyard.append(captured_piece.symbol())
+                    return self.white_graveyard
+                else:
+                    self.black_graveyard.append(captured_piece.symbol())
+                    return self.black_graveyard
+        return None
+
+    def control_check(self) -> None:
+        if self.board.is_check():
+            self.color_in_check = self.board.turn
+        else:
+            self.color_in_check = None
+
+    def control_result(self) -> None:
+        # The index is needed for the next move anyway
+        if not self.move_index.has_legal_moves():
+            if self.color_in_check is not None:
+                self.result = EndResultState.CHECKMATE
+                self.winner_color = not self.board.turn
+            else:
+                self.result = EndResultState.STALEMATE
+        elif has_insufficient_material(self.material, chess.WHITE) and \
+                has_insufficient_material(self.material, chess.BLACK):
+            self.result = EndResultState.INSUFFICIENT_MATERIAL
+        elif self.board.halfmove_clock >= 100:
+            self.result = EndResultState.FIFTY_MOVE_RULE
+        elif self.repetitions[self.position_key] >= 3:
+            self.result = EndResultState.THREEFOLD_REPETITION
+
+    def is_over(self) -> bool:
+        return self.result != EndResultState.ONGOING
+
+    def get_state(self) -> dict:
+        """Full state, the starting point for the deltas sent after each move"""
+        return {
+            "fen": self.board.fen(),
+            "ply": self.ply,
+            "check": self.color_in_check is not None,
+            "result": self.result.name,
+            "winner": None if self.winner_color is None else chess.COLOR_NAMES[self.winner_color],
+        }
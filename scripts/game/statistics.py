@@ -3,39 +3,73 @@ import pygame, pygame_gui
 from scripts.UI.text import Text
 from scripts.game.board import Board
 from scripts.analysis import EngineManager
-from scripts.settings import COLORS
+from scripts.settings import COLORS, ANALYSIS_TARGET_DEPTH
 from scripts.UI.score_slider import ScoreSlider
+from scripts.UI.binding import Binding
+from scripts.UI.sprites import SpriteAtlas
+from scripts.UI.eval_graph import EvalGraph
+from scripts.game.eval_history import EvalHistory
+from scripts.eval_cache import position_key
 
 class Statistics:
 
     def __init__(self, position: pygame.Vector2, size: pygame.Vector2, 
-                 piece_sprite: pygame.Surface, ui_manager: pygame_gui.UIManager) -> None:
+                 sprites: SpriteAtlas, ui_manager: pygame_gui.UIManager) -> None:
         self.position = position
         self.size = size
-        self.piece_sprite = piece_sprite
+        self.sprites = sprites
+        self.piece_sprite = {}
 
         self.is_square_light = True
         self.current_square_position_str = None
         self.current_score = None
         self.current_depth = None
+        self.analysis_result = None
+        self.best_lines_text = []
+        self.graveyards_surface = None
+
+        self.square_identifier_position = (0, 0)
+        self.square_identifier_size = 60
+        self.graveyards_position = (0, 140)
+        self.graveyards_size = (self.size[0]-50, 50)
+        self.eval_graph_position = (0, 240)
+        self.eval_graph_size = (self.size[0]-20, 160)
 
         self.score_slider = ScoreSlider(
             position=(self.position[0]+70, self.position[1]),
             size=(self.size[0]-90, 60), text='-'
         )
 
+        # Evaluation of every ply of the shown game, kept while the engine moves on to the next position
+        self.history = EvalHistory()
+        self.history_session = None
+        self.selected_ply = None  # Ply marked in the graph, e.g. the one shown by the replay viewer
+        self.eval_graph = EvalGraph(
+            (self.position[0]+self.eval_graph_position[0], self.position[1]+self.eval_graph_position[1]),
+            self.eval_graph_size, self.history
+        )
+
         self.init_UI(ui_manager)
         
         self.transform_sprite_sizes(50)
 
+        # Widgets are updated only when the bound model value changes
+        self.bindings = {
+            "square": Binding(self.apply_square),
+            "score": Binding(self.apply_score),
+            "loading": Binding(self.score_slider.set_loading),
+            "best_lines": Binding(self.update_best_lines),
+            "graveyards": Binding(self.apply_graveyards),
+            "history": Binding(self.record_eval),
+        }
+
     def init_UI(self, ui_manager: pygame_gui.UIManager) -> None:
+        relative_position = (self.position[0]+self.square_identifier_position[0],
+                             self.position[1]+self.square_identifier_position[1])
         self.square_text = pygame_gui.elements.UILabel(
-            relative_rect=pygame.Rect((0, 0), (-1, -1)),
+            relative_rect=pygame.Rect(relative_position, (self.square_identifier_size, self.square_identifier_size)),
             text=f"Square: {self.current_square_position_str}",
-            manager=ui_manager,
-            anchors={
-                'center': 'center'
-            }
+            manager=ui_manager
         )
         self.score_text = pygame_gui.elements.UILabel(
             relative_rect=pygame.Rect((0, 0), (0, 0)),
@@ -49,8 +83,7 @@ class Statistics:
         )
         
     def transform_sprite_sizes(self, size: int) -> None:
-        for key in self.piece_sprite:
-            self.piece_sprite[key] = pygame.transform.scale(self.piece_sprite[key], (size, size))
+        self.piece_sprite = self.sprites.get('Pieces', size)
 
     def update(self, board: Board, engine: EngineManager) -> None:
         self.current_square_position_str = board.convert_square_to_str()
@@ -60,26 +93,90 @@ class Statistics:
         self.white_backyard = board.white_graveyard
         self.black_backyard = board.black_graveyard
 
-        score = float(self.current_score) if self.current_score[1] != 'M' else 0
-        if self.current_score[0] == '+':
-            score = 10
-        elif self.current_score[0] == '-':
-            score = -10
+        self.bindings["square"].set(self.current_square_position_str)
+        self.bindings["score"].set(self.current_score)
+        self.bindings["loading"].set(engine.is_searching() and self.current_depth < ANALYSIS_TARGET_DEPTH)
+        self.bindings["best_lines"].set(engine.current_result)
+        self.bindings["graveyards"].set((tuple(self.white_backyard), tuple(self.black_backyard)))
+
+        session = board.session
+        if session is not self.history_session:
+            self.history_session = session
+            self.history.clear()
+            self.bindings["history"].invalidate()
+        elif len(self.history) > session.ply + 1:
+            self.history.truncate(session.ply + 1)  # Moves were taken back
+        self.bindings["history"].set(engine.current_result)
+
+    def get_binding_stats(self) -> dict:
+        return {name: binding.stats() for name, binding in self.bindings.items()}
+
+    def apply_square(self, square_str: str | None) -> None:
+        self.square_text.set_text(square_str.upper() if square_str else "--")
+
+    def apply_score(self, score_str: str) -> None:
+        if score_str[1:2] == 'M':
+            score = 10 if score_str[0] == '+' else -10  # Mate fills the slider
+        else:
+            score = float(score_str)
         self.score_slider.update_score(score)
-        self.score_slider.update_text(self.current_score)
+        self.score_slider.update_text(score_str)
+
+    def record_eval(self, result) -> None:
+        """Keeps the best line of the result if it belongs to a position of the shown game"""
+        if result is None or result.best is None:
+            return
+        ply = self.history_session.start_ply + len(result.board.move_stack)
+        if self.history_session.key_at(ply) != position_key(result.board):
+            return  # Analysis of another game, or of a position that was taken back
+        best = result.best
+        self.history.set(ply, best.score, result.depth, best.pv[0] if best.pv else None)
+
+    def get_graph_ply(self, mouse_pos) -> int | None:
+        return self.eval_graph.ply_at(mouse_pos)
+
+    def apply_graveyards(self, graveyards: tuple[tuple[str], tuple[str]]) -> None:
+        """Pre-renders both graveyards, they change only on captures"""
+        white_backyard, black_backyard = graveyards
+        size = self.graveyards_size
+        self.graveyards_surface = pygame.Surface((size[0] + size[1], size[1]), pygame.SRCALPHA)
+        for i in range(len(white_backyard)):
+            self.graveyards_surface.blit(self.piece_sprite[white_backyard[i]], (i * 15, 0))
+        for i in range(len(black_backyard)):
+            self.graveyards_surface.blit(self.piece_sprite[black_backyard[i]], (size[0] - i * 15, 0))
+
+    def update_best_lines(self, result) -> None:
+        self.analysis_result = result
+        self.best_lines_text = []
+        if result is None:
+            return
+        for i, line in enumerate(result.lines):
+            if result.source == 'book':
+                score = "book"
+            elif result.source == 'tablebase':
+                score = f"{line.score_str()} TB"
+            else:
+                score = line.score_str()
+            self.best_lines_text.append(
+                Text(f"{i+1}. {score}  {line.pv_san(result.board, 4)}", COLORS['white_piece'], 24)
+            )
+
+    def get_rect(self) -> pygame.Rect:
+        return pygame.Rect(*self.position, *self.size)
 
     def draw(self, screen) -> None:
-        self.draw_square_identifier(screen, (0, 0), 60)
+        self.draw_square_identifier(screen, self.square_identifier_position, self.square_identifier_size)
         self.draw_score_information(screen)
-        self.draw_graveyards(screen, (0, 140), (self.size[0]-50, 50))
+        self.draw_graveyards(screen, self.graveyards_position, self.graveyards_size)
+        self.draw_best_lines(screen, (0, 140))
+        self.eval_graph.refresh()
+        self.eval_graph.draw(screen, self.selected_ply)
 
     def draw_square_identifier(self, screen, position: pygame.Vector2, square_size: int) -> None:
         if self.current_square_position_str:
             colors = COLORS['light_square'] if self.is_square_light else COLORS['dark_square']
-            self.square_text.set_text(self.current_square_position_str.upper())
         else:
             colors = COLORS['light_square']
-            self.square_text.set_text("--")
 
         relative_position = (self.position[0]+position[0], self.position[1]+position[1])
         pygame.draw.rect(
@@ -87,29 +184,16 @@ class Statistics:
             colors,
             pygame.Rect(*relative_position, square_size, square_size)
         )
-        self.square_text.set_relative_position(
-            (relative_position[0] + square_size // 2, relative_position[1] + square_size // 2)
-        )
-        self.square_text.rebuild()
 
     def draw_score_information(self, screen) -> None:
-        if self.current_depth >= 25:
-            self.score_slider.set_loading(False)
-        else:
-            self.score_slider.set_loading(True)
         self.score_slider.draw(screen)
 
     def draw_graveyards(self, screen, position: pygame.Vector2, size: pygame.Vector2) -> None:
         relative_position = (self.position[0]+position[0], self.position[1]+position[1])
-        
-        for i in range(len(self.white_backyard)):
-            piece_pos = (relative_position[0] + i * 15, relative_position[1] / 2)
-            screen.blit(
-                self.piece_sprite[self.white_backyard[i]], piece_pos
-            )
+        if self.graveyards_surface is not None:
+            screen.blit(self.graveyards_surface, (relative_position[0], relative_position[1] / 2))
 
-        for i in range(len(self.black_backyard)):
-            piece_pos = (relative_position[0] + size[0] - i * 15, relative_position[1] / 2)
-            screen.blit(
-                self.piece_sprite[self.black_backyard[i]], piece_pos
-            )
\ No newline at end of file
+    def draw_best_lines(self, screen, position: pygame.Vector2) -> None:
+        relative_position = (self.position[0]+position[0], self.position[1]+position[1])
+        for i, text in enumerate(self.best_lines_text):
+            text.print(screen, (relative_position[0], relative_position[1] + i * 25), False)
@@ -0,0 +1,200 @@
+import time
+
+import numpy as np
+import pygame
+
+from scripts.camera import Camera
+from scripts.game.move_tree import MoveTree
+from scripts.settings import (COLORS, TREE_ZOOM_STEP, TREE_PAN_SPEED, TREE_DETAIL_SPACING,
+                              TREE_LABEL_SPACING, TREE_LAYOUT_INTERVAL)
+from scripts.UI.text import Text
+
+CLICK_DISTANCE = 4  # Pixels the mouse may move between press and release of a click, more is a drag
+MIN_DISTANCE, MAX_DISTANCE = 2.0, 20_000.0  # Plies across the view
+
+
+# Class TreeExplorer - the MoveTree of the game, panned and zoomed through a Camera (global units are
+# plies along x and rows along y). Only the nodes the ColumnIndex finds in the visible area are drawn,
+# their positions are transformed in one batch, and the surface is rendered again only when the tree,
+# the camera or the highlighted nodes change. Zoomed out far, nodes become single pixels without edges.
+# While engine lines stream in, the tree is laid out again at most every TREE_LAYOUT_INTERVAL seconds.
+# Mouse: wheel - zoom, drag - pan, click - open the position. Keys: arrows - pan, +/- - zoom, Home - current node.
+class TreeExplorer:
+
+    def __init__(self, size: int, position: pygame.Vector2, camera: Camera, tree: MoveTree | None = None) -> None:
+        self.size = size
+        self.position = position
+        self.camera = camera
+        self.colors = COLORS
+        self.tree = tree if tree is not None else MoveTree()
+
+        self.current = 0  # Node of the position on the board
+        self.hovered = None
+        self.surface = pygame.Surface((size, size))
+        self.rendered_state = None
+        self.dirty_rects = []
+        self.last_layout = float('-inf')
+
+        self.drag_start = None  # Mouse position of a press that may become a click or a drag
+        self.dragging = False
+        self.panning = False  # Arrow or zoom keys held, the view changes every frame
+
+        self.renders = 0
+        self.visible = 0  # Nodes drawn in the last render
+
+    def set_tree(self, tree: MoveTree) -> None:
+        self.tree = tree
+        self.current = 0
+        self.hovered = None
+
+    def set_current(self, node: int) -> None:
+        self.current = node
+
+    def refresh_layout(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if force or now - self.last_layout >= TREE_LAYOUT_INTERVAL or self.tree.layout_version < 0:
+            self.tree.layout()
+            self.last_layout = now
+
+    def has_pending(self) -> bool:
+        """True if nodes wait for the next layout"""
+        return self.tree.layout_version != self.tree.version
+
+    def center_on(self, node: int) -> None:
+        """Puts the node a quarter of the width from the left edge, with room for its continuations"""
+        self.refresh_layout(force=True)
+        self.camera.x = self.tree.xs[node] - self.camera.distance / 4
+        self.camera.y = self.tree.ys[node] - self.camera.distance / 2
+
+    def get_local_mouse(self, mouse_pos) -> tuple:
+        return mouse_pos[0] - self.position[0], mouse_pos[1] - self.position[1]
+
+    def node_at(self, mouse_pos) -> int | None:
+        """Closest node within half a ply of the mouse"""
+        if not self.get_rect().collidepoint(mouse_pos):
+            return None
+        x, y = self.camera.get_global_point(*self.get_local_mouse(mouse_pos))
+        nodes = self.tree.index.query(x - 0.5, y - 0.5, x + 0.5, y + 0.5)
+        if len(nodes) == 0:
+            return None
+        distances = (self.tree.xs[nodes] - x) ** 2 + (self.tree.ys[nodes] - y) ** 2
+        closest = int(np.argmin(distances))
+        return int(nodes[closest]) if distances[closest] <= 0.25 else None
+
+    def handle_event(self, event) -> int | None:
+        """:return: Node the user clicked on"""
+        if event.type == pygame.MOUSEWHEEL:
+            # Clamped here, as clamping the distance afterwards would move the point under the mouse
+            distance = min(max(self.camera.distance * TREE_ZOOM_STEP ** -event.y, MIN_DISTANCE), MAX_DISTANCE)
+            self.camera.zoom_at(*self.get_local_mouse(pygame.mouse.get_pos()), distance / self.camera.distance)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.get_rect().collidepoint(event.pos):
+            self.drag_start = event.pos
+        elif event.type == pygame.MOUSEMOTION:
+            if self.drag_start is not None:
+                if not self.dragging:
+                    self.dragging = (abs(event.pos[0] - self.drag_start[0]) +
+                                     abs(event.pos[1] - self.drag_start[1]) > CLICK_DISTANCE)
+                if self.dragging:
+                    self.camera.drag(*event.rel)
+            self.hovered = self.node_at(event.pos)
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1 and self.drag_start is not None:
+            clicked = not self.dragging
+            self.drag_start = None
+            self.dragging = False
+            if clicked:
+                return self.node_at(event.pos)
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_HOME:
+            self.center_on(self.current)
+        return None
+
+    def update(self, dt: float) -> None:
+        keys = pygame.key.get_pressed()
+        self.panning = False
+        for key, move in ((pygame.K_LEFT, self.camera.move_left), (pygame.K_RIGHT, self.camera.move_right),
+                          (pygame.K_UP, self.camera.move_up), (pygame.K_DOWN, self.camera.move_down)):
+            if keys[key]:
+                move(TREE_PAN_SPEED, dt)
+                self.panning = True
+        if keys[pygame.K_MINUS]:
+            self.camera.scale_in(TREE_ZOOM_STEP, dt)  # A longer distance shows more of the tree
+            self.panning = True
+        if keys[pygame.K_EQUALS] or keys[pygame.K_PLUS]:
+            self.camera.scale_out(TREE_ZOOM_STEP, dt)
+            self.panning = True
+        self.camera.distance = min(max(self.camera.distance, MIN_DISTANCE), MAX_DISTANCE)
+
+    def state(self) -> tuple:
+        return (id(self.tree), self.tree.layout_version, self.camera.x, self.camera.y, self.camera.distance,
+                self.current, self.hovered)
+
+    def render(self) -> None:
+        tree = self.tree
+        self.surface.fill(self.colors['background'])
+
+        # One ply of margin keeps the edges of nodes just outside the view
+        nodes = tree.index.query(*self.camera.get_visible_area(margin=1))
+        self.visible = len(nodes)
+        xs, ys = self.camera.get_local_points(tree.xs[nodes], tree.ys[nodes])
+        spacing = self.camera.get_local_radius(1.0)  # Pixels between plies and between rows
+        played = tree.played[nodes]
+
+        if spacing < TREE_DETAIL_SPACING:
+            self.render_pixels(xs, ys, played)
+        else:
+            _, last_ys = self.camera.get_local_points(0, tree.last_rows[nodes])
+            self.render_nodes(nodes, xs, ys, last_ys, played, spacing)
+
+        self.rendered_state = self.state()
+        self.renders += 1
+
+    def render_pixels(self, xs, ys, played) -> None:
+        """Every node is one pixel, set for all nodes at once through the surface's pixel array"""
+        inside = (xs >= 0) & (xs < self.size) & (ys >= 0) & (ys < self.size)
+        xs, ys, played = xs[inside].astype(np.intp), ys[inside].astype(np.intp), played[inside]
+        pixels = pygame.surfarray.pixels2d(self.surface)
+        pixels[xs[~played], ys[~played]] = self.surface.map_rgb(self.colors['dark_square'])
+        pixels[xs[played], ys[played]] = self.surface.map_rgb(self.colors['white_piece'])
+        del pixels  # Unlocks the surface
+
+    def render_nodes(self, nodes, xs, ys, last_ys, played, spacing) -> None:
+        tree = self.tree
+        half = spacing / 2
+        radius = max(2, int(spacing / 8))
+        surface = self.surface
+        for node, x, y, last_y, is_played in zip(nodes.tolist(), xs.tolist(), ys.tolist(), last_ys.tolist(),
+                                                 played.tolist()):
+            color = self.colors['white_piece'] if is_played else self.colors['dark_square']
+            if node > 0:
+                pygame.draw.line(surface, color, (x - half, y), (x, y))
+            if tree.children[node]:
+                pygame.draw.line(surface, color, (x, y), (x + half, y))
+                if last_y > y:
+                    pygame.draw.line(surface, color, (x + half, y), (x + half, last_y))
+
+        highlights = {self.current: self.colors['check_highlight'], self.hovered: self.colors['move_highlight']}
+        for node, x, y, is_played in zip(nodes.tolist(), xs.tolist(), ys.tolist(), played.tolist()):
+            color = highlights.get(node) or (self.colors['white_piece'] if is_played else self.colors['dark_square'])
+            pygame.draw.circle(surface, color, (x, y), radius if node not in highlights else radius + 2)
+            if node > 0 and (spacing >= TREE_LABEL_SPACING or node == self.hovered):
+                Text(self.label(node), color, 18).print(surface, (x, y - radius - 8), True)
+
+    def label(self, node: int) -> str:
+        """SAN with the move number, e.g. 12. Nf3 or 12... Nf6"""
+        ply = self.tree.plies[node] - 1 + self.tree.start_ply
+        number = ply // 2 + 1
+        return f"{number}. {self.tree.sans[node]}" if ply % 2 == 0 else f"{number}... {self.tree.sans[node]}"
+
+    def draw(self, screen, mouse_pos) -> None:
+        self.refresh_layout()
+        if self.rendered_state != self.state():
+            self.render()
+            self.dirty_rects.append(self.get_rect())
+        screen.blit(self.surface, self.position)
+
+    def get_rect(self) -> pygame.Rect:
+        return pygame.Rect(*self.position, self.size, self.size)
+
+    def pop_dirty_rects(self) -> list[pygame.Rect]:
+        dirty_rects = self.dirty_rects
+        self.dirty_rects = []
+        return dirty_rects
@@ -0,0 +1,159 @@
+import time
+from collections import deque
+
+from scripts.network.protocol import encode
+from scripts.settings import BROADCAST_EVAL_RATE, BROADCAST_QUEUE_LIMIT, BROADCAST_SLOW_POLICY
+from scripts.timing import summarize
+
+
+class Subscriber:
+    """
+    One spectator of a channel. Messages are the channel's encoded bytes, shared by every subscriber.
+    A consumer that falls queue_limit messages behind is skipped ahead: its queue is replaced by the
+    latest snapshot, so memory per spectator stays bounded however slow it reads.
+    """
+
+    __slots__ = ('queue', 'queue_limit', 'on_ready', 'skipped', 'closed')
+
+    def __init__(self, queue_limit: int, on_ready=None) -> None:
+        self.queue = []  # A list is a tenth of an empty deque, and pop_all just swaps it
+        self.queue_limit = queue_limit
+        self.on_ready = on_ready  # Called when the queue stops being empty, e.g. to wake a writer task
+        self.skipped = 0  # Messages replaced by a snapshot
+        self.closed = False
+
+    def push(self, data: bytes) -> bool:
+        """Queues the message, False if the subscriber is too far behind to take it"""
+        if len(self.queue) >= self.queue_limit:
+            return False
+        self.queue.append(data)
+        if len(self.queue) == 1 and self.on_ready is not None:
+            self.on_ready()
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+        if self.on_ready is not None:
+            self.on_ready()  # The reader has to notice
+
+    def skip_to(self, snapshot: bytes) -> None:
+        self.skipped += len(self.queue)
+        self.queue = []
+        self.push(snapshot)
+
+    def pop_all(self) -> list[bytes]:
+        messages, self.queue = self.queue, []
+        return messages
+
+
+class BroadcastChannel:
+    """
+    Moves and live statistics of one game for any number of spectators.
+    Every update is encoded once and the same bytes are queued for all subscribers.
+    Eval ticks arrive much faster than anybody can watch them, so they are coalesced to eval_rate
+    per second: only the newest tick of an interval is sent, and a move drops the pending one.
+    """
+
+    def __init__(self, snapshot, eval_rate: float = BROADCAST_EVAL_RATE, queue_limit: int = BROADCAST_QUEUE_LIMIT,
+                 slow_policy: str = BROADCAST_SLOW_POLICY) -> None:
+        self.snapshot = snapshot  # Function returning the full state of the game as a message dict
+        self.eval_interval = 1.0 / eval_rate if eval_rate else 0.0
+        self.queue_limit = queue_limit
+        self.slow_policy = slow_policy  # 'skip' ahead to the latest snapshot or 'drop' the subscriber
+        self.subscribers = []
+
+        self.last_eval = None  # Newest eval message, part of every snapshot
+        self.pending_eval = None  # Encoded tick waiting for its interval
+        self.last_eval_sent = float('-inf')
+        self._snapshot_bytes = None  # Encoded once per change, see get_snapshot
+
+        self.messages = 0
+        self.bytes_sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.fan_out_times = deque(maxlen=1000)  # Seconds to queue one message for every subscriber
+
+    def __len__(self) -> int:
+        return len(self.subscribers)
+
+    def subscribe(self, on_ready=None) -> Subscriber:
+        """New subscribers start with the snapshot, then receive every update"""
+        subscriber = Subscriber(self.queue_limit, on_ready)
+        subscriber.push(self.get_snapshot())
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscriber.close()
+        self.subscribers = [s for s in self.subscribers if s is not subscriber]
+
+    def get_snapshot(self) -> bytes:
+        if self._snapshot_bytes is None:
+            self._snapshot_bytes = encode({**self.snapshot(), "type": "snapshot", "eval": self.last_eval})
+        return self._snapshot_bytes
+
+    def publish_move(self, delta: bytes) -> None:
+        """Fans out an encoded delta, the eval of the previous position is stale now"""
+        self._snapshot_bytes = None
+        if self.pending_eval is not None:
+            self.coalesced += 1
+            self.pending_eval = None
+        self.last_eval = None
+        self._fan_out(delta)
+
+    def publish_eval(self, message: dict, now: float | None = None) -> float | None:
+        """
+        Sends the tick now or keeps it as the pending one of this interval.
+        :return: Seconds until flush() has to send the pending tick, None if nothing is pending
+        """
+        now = time.perf_counter() if now is None else now
+        self.last_eval = message
+        self._snapshot_bytes = None
+        if self.pending_eval is not None:
+            self.coalesced += 1
+        self.pending_eval = encode(message)
+        return self.flush(now)
+
+    def flush(self, now: float | None = None) -> float | None:
+        """Sends the pending tick if its interval passed, see publish_eval for the return value"""
+        if self.pending_eval is None:
+            return None
+        now = time.perf_counter() if now is None else now
+        wait = self.last_eval_sent + self.eval_interval - now
+        if wait > 0:
+            return wait
+        data, self.pending_eval = self.pending_eval, None
+        self.last_eval_sent = now
+        self._fan_out(data)
+        return None
+
+    def _fan_out(self, data: bytes) -> None:
+        start = time.perf_counter()
+        slow = []
+        for subscriber in self.subscribers:
+            if not subscriber.push(data):
+                slow.append(subscriber)
+        if slow:
+            if self.slow_policy == 'drop':
+                for subscriber in slow:
+                    subscriber.close()
+                self.dropped += len(slow)
+                self.subscribers = [s for s in self.subscribers if not s.closed]
+            else:
+                snapshot = self.get_snapshot()
+                for subscriber in slow:
+                    subscriber.skip_to(snapshot)
+        self.messages += 1
+        self.bytes_sent += len(data) * len(self.subscribers)
+        self.fan_out_times.append(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "messages": self.messages,
+            "bytes_sent": self.bytes_sent,
+            "coalesced_evals": self.coalesced,
+            "skipped": sum(subscriber.skipped for subscriber in self.subscribers),
+            "dropped": self.dropped,
+            "fan_out_ms": summarize(list(self.fan_out_times), 1000),
+        }
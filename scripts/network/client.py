@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+from scripts.network.protocol import encode, decode
+from scripts.network.server import GameServer
+from scripts.settings import NETWORK_PING_INTERVAL, NETWORK_RECONNECT_DELAY
+
+
+class GameClient:
+    """
+    Connection to a GameServer for the pygame thread. Like EngineManager, it runs its own asyncio
+    loop in a daemon thread: send() is thread-safe and received messages wait in an inbox for poll().
+    A lost connection is opened again with backoff and starts with the hello message, so the
+    server puts the client back into its game.
+    """
+
+    def __init__(self, host: str, port: int, on_message=None, ping_interval: float = NETWORK_PING_INTERVAL) -> None:
+        self.host = host
+        self.port = port
+        self.on_message = on_message  # Called from the network thread with every message, pongs included
+        self.ping_interval = ping_interval
+        self.hello = []  # Messages sent first on every connection, see set_hello
+
+        self.inbox = deque()
+        self.writer = None
+        self.connected = False
+        self.connects = 0
+        self.running = True
+
+        # Round trip times of pings (seconds), smoothed like TCP does
+        self.rtt = None
+        self.rtt_samples = deque(maxlen=100)
+
+        self.server = None  # GameServer hosted on this loop, see host_server
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.task = None
+
+    def host_server(self, host: str, port: int) -> GameServer:
+        """Runs a server on the network thread for a player who hosts the game, and connects to it"""
+        self.server = GameServer(host, port)
+        asyncio.run_coroutine_threadsafe(self.server.start(), self.loop).result()
+        self.port = self.server.port  # Port 0 picks a free one
+        return self.server
+
+    def set_hello(self, *messages: dict) -> None:
+        self.hello = list(messages)
+
+    def start(self) -> None:
+        self.task = asyncio.run_coroutine_threadsafe(self._run(), self.loop)
+
+    def send(self, message: dict) -> bool:
+        """Queues the message for the server, False if there is no connection right now"""
+        if not self.connected:
+            return False
+        self.loop.call_soon_threadsafe(self._write, encode(message))
+        return True
+
+    def poll(self) -> list[dict]:
+        """Messages received since the last call, oldest first"""
+        messages = []
+        while self.inbox:
+            messages.append(self.inbox.popleft())
+        return messages
+
+    def get_rtt_ms(self) -> float | None:
+        return None if self.rtt is None else self.rtt * 1000
+
+    def close(self, timeout: float = 2.0) -> None:
+        if not self.running:
+            return
+        self.running = False
+        future = asyncio.run_coroutine_threadsafe(self._close(), self.loop)
+        try:
+            future.result(timeout)
+        except Exception as e:
+            print(f"Network Error: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.wait([asyncio.wrap_future(self.task)], timeout=1.0)
+        if self.server is not None:
+            await self.server.close()
+
+    def _write(self, data: bytes) -> None:
+        if self.writer is not None and not self.writer.is_closing():
+            self.writer.write(data)
+
+    async def _run(self) -> None:
+        delay = NETWORK_RECONNECT_DELAY
+        while self.running:
+            try:
+                reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 8 * NETWORK_RECONNECT_DELAY)
+                continue
+            delay = NETWORK_RECONNECT_DELAY
+            self.connects += 1
+            self.writer.writelines(encode(message) for message in self.hello)
+            self.connected = True
+            pinger = asyncio.create_task(self._ping())
+            try:
+                while line := await reader.readline():
+                    message = decode(line)
+                    if message is not None:
+                        self._receive(message)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                self.connected = False
+                pinger.cancel()
+                self.writer.close()
+                self.writer = None
+
+    async def _ping(self) -> None:
+        while True:
+            self._write(encode({"type": "ping", "time": time.perf_counter()}))
+            await asyncio.sleep(self.ping_interval)
+
+    def _receive(self, message: dict) -> None:
+        if message["type"] == "pong":
+            sample = time.perf_counter() - message.get("time", 0.0)
+            self.rtt_samples.append(sample)
+            self.rtt = sample if self.rtt is None else 0.875 * self.rtt + 0.125 * sample
+        else:
+            self.inbox.append(message)
+        if self.on_message is not None:
+            self.on_message(message)
@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import chess
+
+from scripts.network.protocol import encode, decode
+from scripts.network.server import GameServer
+from scripts.timing import summarize
+
+
+async def play_games(host: str, port: int, games: int, moves: int, round_trips: list, rng: random.Random) -> int:
+    """
+    One connection that plays random legal moves in its games. Every round sends one move
+    to each unfinished game and waits for all deltas, so the server always has work queued.
+    :return: Amount of applied moves
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    boards = {}
+    for _ in range(games):
+        writer.write(encode({"type": "new"}))
+    await writer.drain()
+    for _ in range(games):
+        state = decode(await reader.readline())
+        boards[state["game"]] = chess.Board(state["fen"])
+
+    applied = 0
+    for _ in range(moves):
+        sent_at = {}
+        for game_id, board in boards.items():
+            if board.is_game_over():
+                continue
+            move = rng.choice(list(board.legal_moves))
+            board.push(move)
+            sent_at[game_id] = time.perf_counter()
+            writer.write(encode({"type": "move", "game": game_id, "move": move.uci()}))
+        if not sent_at:
+            break
+        await writer.drain()
+
+        for _ in range(len(sent_at)):
+            reply = decode(await reader.readline())
+            if reply["type"] == "delta":
+                round_trips.append(time.perf_counter() - sent_at[reply["game"]])
+                applied += 1
+
+    writer.close()
+    await writer.wait_closed()
+    return applied
+
+
+async def run(args) -> dict:
+    server = None
+    host, port = args.host, args.port
+    if port == 0:
+        # No server given, host one in this process
+        server = GameServer(host, 0)
+        await server.start()
+        port = server.port
+
+    rng = random.Random(args.seed)
+    round_trips = []
+    games_per_connection = [args.games // args.connections + (i < args.games % args.connections)
+                            for i in range(args.connections)]
+
+    start = time.perf_counter()
+    applied = await asyncio.gather(*[
+        play_games(host, port, games, args.moves, round_trips, rng)
+        for games in games_per_connection if games > 0
+    ])
+    elapsed = time.perf_counter() - start
+
+    # Apply latency is measured inside the server
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(encode({"type": "stats"}))
+    await writer.drain()
+    server_stats = decode(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+
+    if server is not None:
+        await server.close()
+
+    total_moves = sum(applied)
+    return {
+        "games": args.games,
+        "connections": args.connections,
+        "moves": total_moves,
+        "seconds": elapsed,
+        "moves_per_second": total_moves / elapsed if elapsed else 0.0,
+        "round_trip_ms": summarize(round_trips, 1000),
+        "apply_ms": server_stats["apply_ms"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test for scripts.network.server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help="0 starts a server in this process")
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--moves', type=int, default=40, help="Moves per game")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['games']} games over {report['connections']} connections, {report['moves']} moves "
+          f"in {report['seconds']:.2f}s: {report['moves_per_second']:.0f} moves/s")
+    print(f"round trip ms: p50 {report['round_trip_ms']['p50']:.2f}  p99 {report['round_trip_ms']['p99']:.2f}")
+    print(f"apply ms:      p50 {report['apply_ms']['p50']:.3f}  p99 {report['apply_ms']['p99']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import time
+from collections import deque
+
+import chess
+
+from scripts.analysis import AnalysisResult
+from scripts.eval_cache import position_key
+from scripts.game.board import Board
+from scripts.game.session import GameSession
+from scripts.network.client import GameClient
+from scripts.network.protocol import checksum
+from scripts.notification import Notification
+from scripts.timing import summarize
+
+
+class NetworkPlay:
+    """
+    Two players on two App instances, through a GameServer.
+    Own moves are shown at once and sent as (ply, UCI move, checksum); the server's delta confirms them.
+    A rejected move is taken back, and if the positions still differ the board restarts from the
+    server's FEN and ply. The same resync brings the board up to date after a reconnect.
+    """
+
+    def __init__(self, board: Board, client: GameClient, color: chess.Color, game_id: int | None = None,
+                 share_evals: bool = False) -> None:
+        self.board = board
+        self.client = client
+        self.color = color
+        self.game_id = game_id  # None until the server created the game
+        self.share_evals = share_evals  # Send the local engine's evals to the spectators of the game
+        self.last_shared_eval = None
+
+        self.pending = deque()  # (ply, uci, sent at) of own moves the server has not confirmed yet
+        self.move_rtt_samples = deque(maxlen=100)  # Seconds from sending a move to its delta
+        self.rejects = 0
+        self.resyncs = 0
+
+        board.player_color = color
+        board.confirm_moves = True  # A game ending move is archived when the server's delta confirms it
+        board.move_listeners.append(self.on_local_move)
+        if game_id is None:
+            # The server starts from the position on the host's board
+            client.set_hello({"type": "new", "fen": board.get_board().fen(), "color": chess.COLOR_NAMES[color]})
+        else:
+            client.set_hello({"type": "join", "game": game_id, "color": chess.COLOR_NAMES[color]})
+        client.start()
+
+    def on_local_move(self, move: chess.Move) -> None:
+        """Board listener, the move is already on the board"""
+        session = self.board.session
+        self.pending.append((session.ply, move.uci(), time.perf_counter()))
+        # Without a connection the move stays pending and is sent again after the resync
+        if self.game_id is not None:
+            self.client.send(self.move_message(session.ply, move.uci(), checksum(session.position_key)))
+
+    def move_message(self, ply: int, uci: str, position_checksum: int) -> dict:
+        return {"type": "move", "game": self.game_id, "ply": ply, "move": uci, "checksum": position_checksum}
+
+    def update(self) -> bool:
+        """Applies the messages received since the last frame, True if the board changed"""
+        changed = False
+        for message in self.client.poll():
+            handler = getattr(self, f"handle_{message['type']}", None)
+            if handler is not None and handler(message):
+                changed = True
+        return changed
+
+    def matches(self, ply: int, position_checksum: int) -> bool:
+        """True if the local game went through the position at that ply"""
+        key = self.board.session.key_at(ply)
+        return key is not None and checksum(key) == position_checksum
+
+    def handle_state(self, message: dict) -> bool:
+        """Sent on every (re)join"""
+        self.game_id = message["game"]
+        self.client.set_hello({"type": "join", "game": self.game_id, "color": chess.COLOR_NAMES[self.color]})
+        session = self.board.session
+        if session.ply == message["ply"] and self.matches(message["ply"], message["checksum"]):
+            self.pending.clear()  # The connection was lost after the server applied them
+            self.board.archive_result()
+            return False
+        if self.pending and self.pending[0][0] == message["ply"] + 1 and \
+                self.matches(message["ply"], message["checksum"]):
+            for ply, uci, _ in self.pending:
+                # The checksums are those of the local positions, still known to the session
+                self.client.send(self.move_message(ply, uci, checksum(session.key_at(ply))))
+            return False
+        self.resync(message)
+        return True
+
+    def handle_delta(self, message: dict) -> bool:
+        ply, uci = message["ply"], message["move"]
+        if self.pending and self.pending[0][0] == ply and self.pending[0][1] == uci:
+            self.move_rtt_samples.append(time.perf_counter() - self.pending.popleft()[2])
+            if not self.pending:
+                self.board.archive_result()
+            return False
+        session = self.board.session
+        if ply == session.ply + 1 and not self.pending:
+            if self.board.apply_move(chess.Move.from_uci(uci)):
+                if checksum(session.position_key) != message["checksum"]:
+                    self.request_state()
+                return True  # Shown either way, a resync replaces it if the positions differ
+        elif self.matches(ply, message["checksum"]):
+            return False  # Already known, e.g. sent again after a reconnect
+        self.request_state()  # Moves were missed or the positions differ
+        return False
+
+    def handle_reject(self, message: dict) -> bool:
+        self.rejects += 1
+        while self.pending:
+            self.pending.pop()
+            self.board.undo_move()
+        session = self.board.session
+        if session.ply != message["ply"] or checksum(session.position_key) != message["checksum"]:
+            self.resync(message)
+        Notification(f"Move rejected: {message['reason']}", 2.0)
+        return True
+
+    def handle_error(self, message: dict) -> bool:
+        Notification(f"Server: {message['reason']}", 2.0)
+        return True
+
+    def request_state(self) -> None:
+        if self.game_id is not None:
+            self.client.send({"type": "join", "game": self.game_id, "color": chess.COLOR_NAMES[self.color]})
+
+    def resync(self, state: dict) -> None:
+        """Restarts the board from the server's position; earlier moves are not needed to go on"""
+        self.pending.clear()
+        self.resyncs += 1
+        self.board.set_session(GameSession.from_state(state))
+
+    def share_eval(self, result: AnalysisResult | None) -> None:
+        """Sends a new eval of the current position, the server coalesces them for the spectators"""
+        if not self.share_evals or result is None or result is self.last_shared_eval or result.best is None:
+            return
+        self.last_shared_eval = result
+        session = self.board.session
+        if position_key(result.board) != session.position_key or self.game_id is None:
+            return
+        best = result.best
+        self.client.send({"type": "eval", "game": self.game_id, "ply": session.ply, "score": best.score_str(),
+                          "depth": result.depth, "source": result.source, "pv": [move.uci() for move in best.pv[:4]]})
+
+    def get_rtt_ms(self) -> float | None:
+        return self.client.get_rtt_ms()
+
+    def get_stats(self) -> dict:
+        return {
+            "game": self.game_id,
+            "connected": self.client.connected,
+            "connects": self.client.connects,
+            "rtt_ms": summarize(list(self.client.rtt_samples), 1000),
+            "move_rtt_ms": summarize(list(self.move_rtt_samples), 1000),
+            "rejects": self.rejects,
+            "resyncs": self.resyncs,
+        }
+
+    def close(self) -> None:
+        self.board.move_listeners.remove(self.on_local_move)
+        self.board.player_color = None
+        self.board.confirm_moves = False
+        self.client.close()
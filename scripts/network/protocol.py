@@ -0,0 +1,24 @@
+import json
+
+# Messages are JSON objects, one per line. Every message has a "type":
+#   client -> server: new, join, leave, move, eval, watch, unwatch, focus, stats, ping
+#   server -> client: state, delta, reject, error, stats, pong, snapshot (spectators)
+# Moves travel as UCI strings with the ply they make and the checksum of the position after them,
+# a full position (FEN + ply) is only sent on join and to resync a client whose move was rejected.
+
+
+def checksum(position_key: int) -> int:
+    """Short checksum of a position from its Zobrist key"""
+    return position_key & 0xFFFFFFFF
+
+
+def encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(',', ':')).encode() + b'\n'
+
+
+def decode(line: bytes) -> dict | None:
+    try:
+        message = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return message if isinstance(message, dict) and isinstance(message.get("type"), str) else None
@@ -0,0 +1,407 @@
+import argparse
+import asyncio
+import itertools
+import time
+from collections import Counter, deque
+
+import chess
+
+import scripts.settings as s
+from scripts.analysis_service import AnalysisService, PRIORITY_FOCUSED, PRIORITY_LIVE, PRIORITY_BACKGROUND
+from scripts.eval_cache import position_key
+from scripts.game.session import GameSession
+from scripts.network.broadcast import BroadcastChannel
+from scripts.network.protocol import encode, decode, checksum
+from scripts.timing import summarize
+
+
+class GameServer:
+    """
+    Hosts many headless games in one asyncio process.
+    Clients create or join games, send moves and receive a delta for every move of the joined games.
+    A client that joins with a color takes that seat, and then only it can move that side.
+    Spectators watch a game through its BroadcastChannel: moves and the players' eval ticks,
+    encoded once for all of them, with a snapshot for newcomers and for spectators that fall behind.
+    With an AnalysisService the server evaluates its games itself: games a spectator focused on
+    (shows alone) first, then watched games, then the rest.
+    A game nobody plays or watches anymore is evicted: at once if it is over, otherwise after
+    NETWORK_ABANDONED_TIMEOUT seconds, so its players can still reconnect.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, analysis: AnalysisService | None = None) -> None:
+        self.host = host
+        self.port = port
+        self.server = None
+        self.loop = None
+        self.analysis = analysis
+        self.clients = {}  # Task of every connected client -> its StreamWriter
+
+        self.sessions = {}  # game id -> GameSession
+        self.subscribers = {}  # game id -> set of StreamWriter
+        self.seats = {}  # game id -> {color: StreamWriter}, games without seats can be moved by anybody
+        self.channels = {}  # game id -> BroadcastChannel
+        self.flush_scheduled = set()  # Game ids with a pending eval tick and a timer to send it
+        self.focused = {}  # StreamWriter -> id of the game that spectator focused on
+        self.focus_counts = Counter()  # game id -> spectators focused on it
+        self.unattended_since = {}  # game id -> loop time the last player or spectator left
+        self.stream_tasks = set()  # Writer tasks of the spectators, referenced until they end
+        self.game_ids = itertools.count(1)
+        self.games_evicted = 0
+
+        self.moves_applied = 0
+        self.apply_times = deque(maxlen=100_000)  # Seconds spent in GameSession.push
+
+    async def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]  # Resolves port 0
+
+    async def serve_forever(self) -> None:
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            for writer in self.clients.values():
+                writer.close()  # Their handlers see the end of the stream and clean up
+            if self.clients:
+                await asyncio.wait(list(self.clients), timeout=1.0)
+            await self.server.wait_closed()
+
+    def create_game(self, fen: str | None = None) -> int:
+        game_id = next(self.game_ids)
+        self.sessions[game_id] = GameSession(fen)
+        self.subscribers[game_id] = set()
+        self.seats[game_id] = {}
+        self.channels[game_id] = BroadcastChannel(lambda: self.snapshot_message(game_id))
+        return game_id
+
+    def state_message(self, game_id: int) -> dict:
+        session = self.sessions[game_id]
+        return {"type": "state", "game": game_id, **session.get_state(), "checksum": checksum(session.position_key)}
+
+    def snapshot_message(self, game_id: int) -> dict:
+        """State plus what spectators see next to the board"""
+        session = self.sessions[game_id]
+        return {**self.state_message(game_id), "white_graveyard": session.white_graveyard,
+                "black_graveyard": session.black_graveyard}
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        joined = set()
+        watching = {}  # game id -> Subscriber
+        self.clients[asyncio.current_task()] = writer
+        try:
+            while line := await reader.readline():
+                message = decode(line)
+                if message is None:
+                    writer.write(encode({"type": "error", "reason": "bad message"}))
+                else:
+                    self.handle_message(message, writer, joined, watching)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for game_id in joined:
+                self.subscribers[game_id].discard(writer)
+                self.leave_seat(game_id, writer)
+                self.check_attendance(game_id)
+            for game_id, subscriber in watching.items():
+                self.channels[game_id].unsubscribe(subscriber)
+                self.check_attendance(game_id)
+            self.set_focus(writer, None)
+            writer.close()
+            self.clients.pop(asyncio.current_task(), None)
+
+    def handle_message(self, message: dict, writer: asyncio.StreamWriter, joined: set, watching: dict) -> None:
+        message_type = message["type"]
+        game_id = message.get("game")
+        # Client input: anything else as game id would break the lookups below
+        if game_id is not None and (not isinstance(game_id, int) or isinstance(game_id, bool)):
+            writer.write(encode({"type": "error", "reason": "bad message"}))
+            return
+
+        if message_type == "stats":
+            writer.write(encode({"type": "stats", **self.get_stats()}))
+            return
+        if message_type == "ping":
+            writer.write(encode({**message, "type": "pong"}))  # Echoes the client's timestamp
+            return
+
+        if message_type == "new":
+            fen = message.get("fen")
+            if fen is not None and not isinstance(fen, str):
+                writer.write(encode({"type": "error", "reason": "bad message"}))
+                return
+            try:
+                game_id = self.create_game(fen)
+            except ValueError:
+                writer.write(encode({"type": "error", "reason": "bad fen"}))
+                return
+            message_type = "join"
+        if message_type == "focus" and game_id is None:
+            self.set_focus(writer, None)
+            return
+
+        if game_id not in self.sessions:
+            writer.write(encode({"type": "error", "game": game_id, "reason": "unknown game"}))
+            return
+        session = self.sessions[game_id]
+
+        if message_type == "join":
+            self.subscribers[game_id].add(writer)
+            joined.add(game_id)
+            self.unattended_since.pop(game_id, None)
+            if message.get("color") in chess.COLOR_NAMES and not self.take_seat(game_id, message["color"], writer):
+                writer.write(encode({"type": "error", "game": game_id, "reason": "seat taken"}))
+            writer.write(encode(self.state_message(game_id)))
+        elif message_type == "leave":
+            self.subscribers[game_id].discard(writer)
+            self.leave_seat(game_id, writer)
+            joined.discard(game_id)
+            self.check_attendance(game_id)
+        elif message_type == "watch":
+            if game_id not in watching:
+                ready = asyncio.Event()
+                watching[game_id] = self.channels[game_id].subscribe(ready.set)
+                self.unattended_since.pop(game_id, None)
+                task = asyncio.create_task(self.stream(game_id, watching, ready, writer))
+                self.stream_tasks.add(task)
+                task.add_done_callback(self.stream_tasks.discard)
+                self.request_analysis(game_id)  # Watched games go first
+        elif message_type == "unwatch":
+            if game_id in watching:
+                self.channels[game_id].unsubscribe(watching.pop(game_id))
+                self.check_attendance(game_id)
+        elif message_type == "focus":
+            self.set_focus(writer, game_id)
+        elif message_type == "eval":
+            # Ticks of a position that was already left would show a wrong score
+            if message.get("ply") != session.ply or writer not in self.seats[game_id].values():
+                return
+            # Only known fields are relayed, rebuilt from the player's values
+            score, depth, source, pv = (message.get("score"), message.get("depth"), message.get("source", "engine"),
+                                        message.get("pv", []))
+            if not (isinstance(score, str) and isinstance(depth, int) and isinstance(source, str) and
+                    isinstance(pv, list) and all(isinstance(uci, str) for uci in pv[:4])):
+                writer.write(encode({"type": "error", "game": game_id, "reason": "bad message"}))
+                return
+            self.publish_eval(game_id, self.eval_message(game_id, score[:16], depth, source[:16], pv[:4]))
+        elif message_type == "move":
+            self.apply_move(game_id, session, message, writer)
+        else:
+            writer.write(encode({"type": "error", "game": game_id, "reason": "unknown type"}))
+
+    def take_seat(self, game_id: int, color_name: str, writer: asyncio.StreamWriter) -> bool:
+        """A seat left by a disconnected client can be taken again, e.g. by the same player reconnecting"""
+        color = chess.COLOR_NAMES.index(color_name) == chess.WHITE
+        seats = self.seats[game_id]
+        if seats.get(color, writer) is not writer:
+            return False
+        seats[color] = writer
+        return True
+
+    def leave_seat(self, game_id: int, writer: asyncio.StreamWriter) -> None:
+        seats = self.seats[game_id]
+        for color in [color for color, seat in seats.items() if seat is writer]:
+            del seats[color]
+
+    def check_attendance(self, game_id: int) -> None:
+        """Evicts the game, or schedules its eviction, once nobody plays or watches it"""
+        if game_id not in self.sessions or self.subscribers[game_id] or self.seats[game_id] or \
+                len(self.channels[game_id]):
+            return
+        if self.sessions[game_id].is_over():
+            self.evict_game(game_id)
+        elif game_id not in self.unattended_since:
+            since = self.unattended_since[game_id] = self.loop.time()
+            self.loop.call_later(s.NETWORK_ABANDONED_TIMEOUT, self.evict_abandoned, game_id, since)
+
+    def evict_abandoned(self, game_id: int, since: float) -> None:
+        if self.unattended_since.get(game_id) == since:  # Nobody came back meanwhile
+            self.evict_game(game_id)
+
+    def evict_game(self, game_id: int) -> None:
+        for games in (self.sessions, self.subscribers, self.seats, self.channels, self.unattended_since):
+            games.pop(game_id, None)
+        self.flush_scheduled.discard(game_id)
+        if self.analysis is not None:
+            self.analysis.cancel(game_id)
+        self.games_evicted += 1
+
+    def set_focus(self, writer: asyncio.StreamWriter, game_id: int | None) -> None:
+        """The game a spectator shows alone, None when it goes back to all of its games"""
+        previous = self.focused.pop(writer, None)
+        if previous is not None:
+            self.focus_counts[previous] -= 1
+            if not self.focus_counts[previous]:
+                del self.focus_counts[previous]
+        if game_id is not None:
+            self.focused[writer] = game_id
+            self.focus_counts[game_id] += 1
+            self.request_analysis(game_id)
+
+    def reject(self, game_id: int, message: dict, writer: asyncio.StreamWriter, reason: str) -> None:
+        """Refuses a move; the server state comes along so the client can roll back or resync at once"""
+        state = self.state_message(game_id)
+        del state["type"]
+        writer.write(encode({"type": "reject", "move": message.get("move"), "reason": reason, **state}))
+
+    def apply_move(self, game_id: int, session: GameSession, message: dict, writer: asyncio.StreamWriter) -> None:
+        seats = self.seats[game_id]
+        if seats and seats.get(session.board.turn) is not writer:
+            self.reject(game_id, message, writer, "not your turn")
+            return
+        # Clients say which ply they are making, so a move meant for another position is never applied
+        if "ply" in message and message["ply"] != session.ply + 1:
+            self.reject(game_id, message, writer, "out of sync")
+            return
+
+        start = time.perf_counter()
+        move = None
+        if not session.is_over():
+            move = session.push_uci(str(message.get("move", "")))
+        if move is not None and "checksum" in message and message["checksum"] != checksum(session.position_key):
+            session.pop()
+            move = None
+            reason = "checksum mismatch"
+        else:
+            reason = "illegal move"
+        self.apply_times.append(time.perf_counter() - start)
+
+        if move is None:
+            self.reject(game_id, message, writer, reason)
+            return
+        self.moves_applied += 1
+
+        delta = encode({
+            "type": "delta",
+            "game": game_id,
+            "ply": session.ply,
+            "move": move.uci(),
+            "checksum": checksum(session.position_key),
+            "check": session.color_in_check is not None,
+            "result": session.result.name,
+            "winner": None if session.winner_color is None else chess.COLOR_NAMES[session.winner_color],
+        })
+        for subscriber in self.subscribers[game_id]:
+            self.send(subscriber, delta)
+        if writer not in self.subscribers[game_id]:
+            self.send(writer, delta)
+        self.channels[game_id].publish_move(delta)
+        self.request_analysis(game_id)
+        if session.is_over():
+            self.check_attendance(game_id)  # Ended by a client that neither joined nor watched it
+
+    @staticmethod
+    def send(writer: asyncio.StreamWriter, data: bytes) -> None:
+        """
+        Writes without waiting for the client. A client that stopped reading is disconnected once
+        NETWORK_WRITE_BUFFER_LIMIT bytes wait for it, instead of buffering its deltas without bound;
+        its handler cleans up when the stream ends.
+        """
+        if writer.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > s.NETWORK_WRITE_BUFFER_LIMIT:
+            writer.close()
+            return
+        writer.write(data)
+
+    def request_analysis(self, game_id: int) -> None:
+        if self.analysis is None:
+            return
+        session = self.sessions[game_id]
+        if session.is_over():
+            self.analysis.cancel(game_id)
+            return
+        if self.focus_counts[game_id]:
+            priority = PRIORITY_FOCUSED
+        else:
+            priority = PRIORITY_LIVE if len(self.channels[game_id]) else PRIORITY_BACKGROUND
+        self.analysis.request(game_id, session.board, priority,
+                              lambda board, result: self.loop.call_soon_threadsafe(self.on_analysis, game_id, result))
+
+    def on_analysis(self, game_id: int, result) -> None:
+        session = self.sessions.get(game_id)
+        if session is None or result.best is None or position_key(result.board) != session.position_key:
+            return  # The game moved on meanwhile, or was evicted
+        best = result.best
+        self.publish_eval(game_id, self.eval_message(game_id, best.score_str(), result.depth, result.source,
+                                                     [move.uci() for move in best.pv[:4]]))
+
+    def eval_message(self, game_id: int, score: str, depth: int, source: str, pv: list[str]) -> dict:
+        return {"type": "eval", "game": game_id, "ply": self.sessions[game_id].ply, "score": score, "depth": depth,
+                "source": source, "pv": pv}
+
+    def publish_eval(self, game_id: int, message: dict) -> None:
+        wait = self.channels[game_id].publish_eval(message)
+        if wait is not None and game_id not in self.flush_scheduled:
+            self.flush_scheduled.add(game_id)
+            asyncio.get_running_loop().call_later(wait, self.flush_eval, game_id)
+
+    def flush_eval(self, game_id: int) -> None:
+        if game_id not in self.flush_scheduled:
+            return  # Evicted meanwhile
+        self.flush_scheduled.discard(game_id)
+        wait = self.channels[game_id].flush()
+        if wait is not None:
+            self.flush_scheduled.add(game_id)
+            asyncio.get_running_loop().call_later(wait, self.flush_eval, game_id)
+
+    async def stream(self, game_id: int, watching: dict, ready: asyncio.Event, writer: asyncio.StreamWriter) -> None:
+        """
+        Writes the queue of a spectator; while drain() waits, the channel may skip it ahead.
+        A spectator the channel dropped for being too slow is told so, and may watch again.
+        """
+        subscriber = watching[game_id]
+        try:
+            while not subscriber.closed:
+                await ready.wait()
+                ready.clear()
+                writer.writelines(subscriber.pop_all())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        if watching.get(game_id) is subscriber:  # Not unwatched by the client
+            del watching[game_id]
+            self.send(writer, encode({"type": "error", "game": game_id, "reason": "dropped"}))
+            self.check_attendance(game_id)
+
+    def get_stats(self) -> dict:
+        stats = {
+            "games": len(self.sessions),
+            "games_evicted": self.games_evicted,
+            "spectators": sum(len(channel) for channel in self.channels.values()),
+            "moves_applied": self.moves_applied,
+            "apply_ms": summarize(self.apply_times, 1000),
+        }
+        if self.analysis is not None:
+            stats["analysis"] = self.analysis.stats()
+        return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless chess game server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--engines', type=int, default=0, help="Engine processes evaluating the games for spectators")
+    parser.add_argument('--engine', nargs='+', default=s.ENGINE_PATH, help="Engine command")
+    parser.add_argument('--depth', type=int, default=s.ANALYSIS_SERVICE_DEPTH)
+    args = parser.parse_args()
+
+    analysis = AnalysisService(args.engine, args.engines, args.depth) if args.engines > 0 else None
+    server = GameServer(args.host, args.port, analysis)
+    print(f"Serving games on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if analysis is not None:
+            analysis.close()
+
+
+if __name__ == "__main__":
+    main()
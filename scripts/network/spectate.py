@@ -0,0 +1,108 @@
+import time
+
+from scripts.game.session import GameSession
+from scripts.network.client import GameClient
+from scripts.network.protocol import checksum
+from scripts.settings import GRID_WATCH_RETRY
+
+
+class WatchedGame:
+    """Latest known state of one server game, replaced by every snapshot"""
+
+    __slots__ = ('game_id', 'session', 'score', 'depth', 'retry_at', 'retry_delay')
+
+    def __init__(self, game_id: int) -> None:
+        self.game_id = game_id
+        self.session = None  # GameSession, None until the first snapshot
+        self.score = None  # Score string of the latest eval of the current position
+        self.depth = 0
+        self.retry_at = None  # Time to watch again, set while the game does not exist on the server yet
+        self.retry_delay = GRID_WATCH_RETRY
+
+
+class SpectatorFeed:
+    """
+    Follows many games of a GameServer through their broadcast channels, over one connection.
+    Deltas are applied to the local sessions; a snapshot (first one, or after the server skipped
+    this spectator ahead) replaces the session. Games that do not exist yet, e.g. the later rounds
+    of a tournament, are watched again with backoff until the server has them.
+    """
+
+    def __init__(self, client: GameClient, game_ids) -> None:
+        self.client = client
+        self.games = {game_id: WatchedGame(game_id) for game_id in game_ids}
+        self.focused = None  # Id of the game shown alone, the server analyses it first
+        self.resyncs = 0
+        self.set_hello()
+        client.start()
+
+    def set_hello(self) -> None:
+        watches = [{"type": "watch", "game": game_id} for game_id in self.games]
+        focus = [{"type": "focus", "game": self.focused}] if self.focused is not None else []
+        self.client.set_hello(*watches, *focus)
+
+    def focus(self, game_id: int | None) -> None:
+        """Tells the server which game is shown alone, None when all of them are shown again"""
+        if game_id == self.focused:
+            return
+        self.focused = game_id
+        self.set_hello()  # Focused again after a reconnect
+        self.client.send({"type": "focus", "game": game_id})
+
+    def update(self) -> bool:
+        """Applies the messages received since the last frame, True if any game changed"""
+        changed = False
+        self.retry_watches()
+        for message in self.client.poll():
+            game = self.games.get(message.get("game"))
+            if game is None:
+                continue
+            handler = getattr(self, f"handle_{message['type']}", None)
+            if handler is not None and handler(game, message):
+                changed = True
+        return changed
+
+    def retry_watches(self) -> None:
+        now = time.perf_counter()
+        for game in self.games.values():
+            if game.retry_at is not None and game.retry_at <= now and self.client.send(
+                    {"type": "watch", "game": game.game_id}):
+                game.retry_at = None
+
+    def handle_error(self, game: WatchedGame, message: dict) -> bool:
+        # Games that do not exist yet, and games the server dropped this spectator from for reading too slowly
+        if message.get("reason") in ("unknown game", "dropped"):
+            game.retry_at = time.perf_counter() + game.retry_delay
+            game.retry_delay = min(game.retry_delay * 2, 8 * GRID_WATCH_RETRY)
+        return False
+
+    def handle_snapshot(self, game: WatchedGame, message: dict) -> bool:
+        game.retry_delay = GRID_WATCH_RETRY
+        game.session = GameSession.from_state(message)  # With the result of a game that ended before
+        evaluation = message.get("eval")
+        game.score, game.depth = (evaluation["score"], evaluation["depth"]) if evaluation else (None, 0)
+        return True
+
+    def handle_delta(self, game: WatchedGame, message: dict) -> bool:
+        session = game.session
+        if session is None:
+            return False
+        if message["ply"] != session.ply + 1 or session.push_uci(message["move"]) is None or \
+                checksum(session.position_key) != message["checksum"]:
+            # Missed a message: watching again sends a fresh snapshot
+            self.resyncs += 1
+            game.session = None
+            self.client.send({"type": "unwatch", "game": game.game_id})
+            self.client.send({"type": "watch", "game": game.game_id})
+            return True
+        game.score, game.depth = None, 0
+        return True
+
+    def handle_eval(self, game: WatchedGame, message: dict) -> bool:
+        if game.session is None or message.get("ply") != game.session.ply:
+            return False
+        game.score, game.depth = message["score"], message.get("depth", 0)
+        return True
+
+    def close(self) -> None:
+        self.client.close()
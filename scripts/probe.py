@@ -0,0 +1,148 @@
+import os
+import time
+from collections import deque
+
+import chess
+import chess.engine
+import chess.polyglot
+import chess.syzygy
+
+from scripts.settings import BOOK_PATH, SYZYGY_PATH
+from scripts.timing import summarize
+
+# Tablebase wins are reported like Stockfish does: this many centipawns minus the distance to zeroing
+TABLEBASE_WIN_CP = 20_000
+
+
+class ProbeResult:
+    """Answer of the book or the tablebases. Scores are from the point of view of the side to move."""
+
+    __slots__ = ('source', 'moves', 'score', 'exact')
+
+    def __init__(self, source: str, moves: list[chess.Move], score: chess.engine.PovScore, exact: bool) -> None:
+        self.source = source  # 'book' or 'tablebase'
+        self.moves = moves  # Best first
+        self.score = score
+        self.exact = exact
+
+
+class PositionProbe:
+    """
+    Looks positions up in local Polyglot books and Syzygy tables before anything is searched.
+    Missing directories simply disable the source, so the app works without them.
+    """
+
+    def __init__(self, book_path: str | None = BOOK_PATH, syzygy_path: str | None = SYZYGY_PATH) -> None:
+        self.books = []
+        for path in self._files(book_path, '.bin'):
+            self.books.append(chess.polyglot.open_reader(path))
+
+        self.tablebase = None
+        self.max_pieces = 0
+        if syzygy_path is not None and os.path.isdir(syzygy_path):
+            tablebase = chess.syzygy.Tablebase()
+            if tablebase.add_directory(syzygy_path, load_dtz=True):
+                self.tablebase = tablebase
+                self.max_pieces = max(len(name) - 1 for name in tablebase.wdl)  # 'KQvK' -> 3
+
+        self.book_hits = 0
+        self.tablebase_hits = 0
+        self.misses = 0
+        self.latency_samples = deque(maxlen=1000)  # Seconds per probe
+
+    @staticmethod
+    def _files(path: str | None, extension: str) -> list[str]:
+        """A single file, or every file with the extension in a directory"""
+        if path is None or not os.path.exists(path):
+            return []
+        if os.path.isfile(path):
+            return [path]
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(extension))
+
+    def is_enabled(self) -> bool:
+        return bool(self.books) or self.tablebase is not None
+
+    def probe(self, board: chess.Board) -> ProbeResult | None:
+        if not self.is_enabled():
+            return None
+        start = time.perf_counter()
+        result = self.probe_tablebase(board)
+        if result is not None:
+            self.tablebase_hits += 1
+        else:
+            result = self.probe_book(board)
+            if result is not None:
+                self.book_hits += 1
+            else:
+                self.misses += 1
+        self.latency_samples.append(time.perf_counter() - start)
+        return result
+
+    def probe_tablebase(self, board: chess.Board) -> ProbeResult | None:
+        if self.tablebase is None or chess.popcount(board.occupied) > self.max_pieces or board.castling_rights:
+            return None
+        wdl = self.tablebase.get_wdl(board)
+        if wdl is None:
+            return None
+        board = board.copy(stack=False)  # The caller's board may be read by another thread meanwhile
+
+        # Keep the best result: win as fast as possible, lose as slowly as possible (by DTZ)
+        best_move, best_key = None, None
+        for move in board.legal_moves:
+            board.push(move)
+            try:
+                child_wdl = self.tablebase.get_wdl(board)
+                child_dtz = self.tablebase.get_dtz(board)
+                is_mate = board.is_checkmate()
+            finally:
+                board.pop()
+            if child_wdl is None or child_dtz is None:
+                return None
+            if -child_wdl > 0:
+                key = (-child_wdl, is_mate, -abs(child_dtz))
+            else:
+                key = (-child_wdl, False, abs(child_dtz))
+            if best_key is None or key > best_key:
+                best_move, best_key = move, key
+
+        if wdl == 2:
+            dtz = self.tablebase.get_dtz(board) or 0
+            score = chess.engine.Cp(TABLEBASE_WIN_CP - abs(dtz))
+        elif wdl == -2:
+            dtz = self.tablebase.get_dtz(board) or 0
+            score = chess.engine.Cp(-(TABLEBASE_WIN_CP - abs(dtz)))
+        else:
+            score = chess.engine.Cp(0)  # Draws, including cursed wins (1) and blessed losses (-1)
+        moves = [best_move] if best_move is not None else []
+        return ProbeResult('tablebase', moves, chess.engine.PovScore(score, board.turn), True)
+
+    def probe_book(self, board: chess.Board) -> ProbeResult | None:
+        weights = {}
+        for book in self.books:
+            for entry in book.find_all(board):
+                weights[entry.move] = weights.get(entry.move, 0) + entry.weight
+        if not weights:
+            return None
+        moves = sorted(weights, key=weights.get, reverse=True)
+        # Books know good moves, not evaluations: theory is treated as balanced
+        return ProbeResult('book', moves, chess.engine.PovScore(chess.engine.Cp(0), board.turn), False)
+
+    def stats(self) -> dict:
+        probes = self.book_hits + self.tablebase_hits + self.misses
+        return {
+            "books": len(self.books),
+            "tablebase_pieces": self.max_pieces,
+            "book_hits": self.book_hits,
+            "tablebase_hits": self.tablebase_hits,
+            "misses": self.misses,
+            "hit_rate": (self.book_hits + self.tablebase_hits) / probes if probes else 0.0,
+            "latency_ms": summarize(list(self.latency_samples), 1000),
+        }
+
+    def close(self) -> None:
+        for book in self.books:
+            book.close()
+        self.books = []
+        if self.tablebase is not None:
+            self.tablebase.close()
+            self.tablebase = None
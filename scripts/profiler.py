@@ -0,0 +1,146 @@
+import cProfile
+import csv
+import io
+import json
+import os
+import pstats
+import time
+from array import array
+
+import pygame
+
+from scripts.UI.text import Text
+from scripts.timing import summarize
+
+
+# Class FrameProfiler - times blocks and subsystems of every frame into fixed-size ring buffers.
+# Recording is a few perf_counter calls per frame; statistics are computed only for the overlay and exports.
+class FrameProfiler:
+
+    def __init__(self, sections: list[str], capacity: int = 600) -> None:
+        self.sections = list(sections)
+        self.index = {name: i for i, name in enumerate(self.sections)}
+        self.capacity = capacity
+
+        self.samples = [array('d', bytes(8 * capacity)) for _ in self.sections]  # Seconds
+        self.frame_samples = array('d', bytes(8 * capacity))
+        self.frames = 0  # Amount of recorded frames, the ring position is frames % capacity
+
+        self._current = [0.0] * len(self.sections)
+        self._frame_start = 0.0
+
+        self.overlay_enabled = False
+        self.overlay_refresh = 30  # Frames between overlay statistics updates
+        self._overlay_lines = []
+
+        self.capture = None  # cProfile.Profile while capturing
+
+    def begin_frame(self) -> float:
+        self._current = [0.0] * len(self.sections)
+        self._frame_start = time.perf_counter()
+        return self._frame_start
+
+    def lap(self, section: str, start: float) -> float:
+        """Adds the time since start to the section and returns the current time for the next lap"""
+        now = time.perf_counter()
+        self._current[self.index[section]] += now - start
+        return now
+
+    def end_frame(self) -> None:
+        position = self.frames % self.capacity
+        for samples, value in zip(self.samples, self._current):
+            samples[position] = value
+        self.frame_samples[position] = time.perf_counter() - self._frame_start
+        self.frames += 1
+
+        if self.overlay_enabled and self.frames % self.overlay_refresh == 0:
+            self._update_overlay_lines()
+
+    def _recorded(self, samples: array) -> list[float]:
+        return samples.tolist()[:min(self.frames, self.capacity)]
+
+    def get_stats(self) -> dict:
+        """p50/p95/p99/max in milliseconds for the frame and every section"""
+        stats = {"frame": summarize(self._recorded(self.frame_samples), 1000)}
+        for name, samples in zip(self.sections, self.samples):
+            stats[name] = summarize(self._recorded(samples), 1000)
+        return stats
+
+    def get_spikes(self, factor: float = 2.0) -> int:
+        """Amount of recorded frames that took longer than factor * median frame"""
+        frame_times = self._recorded(self.frame_samples)
+        if not frame_times:
+            return 0
+        threshold = sorted(frame_times)[len(frame_times) // 2] * factor
+        return sum(1 for frame_time in frame_times if frame_time > threshold)
+
+    # -*-*- Overlay -*-*-
+    def toggle_overlay(self) -> None:
+        self.overlay_enabled = not self.overlay_enabled
+        if self.overlay_enabled:
+            self._update_overlay_lines()
+
+    def _update_overlay_lines(self) -> None:
+        stats = self.get_stats()
+        lines = [f"{'':18}{'p50':>7}{'p95':>7}{'p99':>7}"]
+        for name, values in stats.items():
+            lines.append(f"{name:18}{values['p50']:7.2f}{values['p95']:7.2f}{values['p99']:7.2f}")
+        lines.append(f"spikes (>2x p50): {self.get_spikes()} of {min(self.frames, self.capacity)}")
+        if self.capture is not None:
+            lines.append("cProfile capture running")
+        self._overlay_lines = lines
+
+    def draw_overlay(self, screen, position: tuple[int, int] = (5, 5)) -> pygame.Rect | None:
+        if not self.overlay_enabled:
+            return None
+        rect = pygame.Rect(*position, 360, 16 * len(self._overlay_lines) + 8)
+        pygame.draw.rect(screen, (20, 20, 20), rect)
+        for i, line in enumerate(self._overlay_lines):
+            Text(line, (230, 230, 230), 18, type_font=None).print(
+                screen, (rect.x + 5, rect.y + 4 + i * 16), False)
+        return rect
+
+    # -*-*- cProfile capture -*-*-
+    def toggle_capture(self, directory: str = 'profiles') -> str | None:
+        """Starts a cProfile capture, or stops it and writes the .prof file (returns its path)"""
+        if self.capture is None:
+            self.capture = cProfile.Profile()
+            self.capture.enable()
+            return None
+
+        self.capture.disable()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"capture_{time.strftime('%Y%m%d_%H%M%S')}.prof")
+        self.capture.dump_stats(path)
+
+        summary = io.StringIO()
+        pstats.Stats(self.capture, stream=summary).sort_stats('cumulative').print_stats(15)
+        print(summary.getvalue())
+        self.capture = None
+        return path
+
+    # -*-*- Export -*-*-
+    def export(self, path: str) -> None:
+        """Writes the recorded frames (milliseconds) to a .csv or .json file"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Oldest frame first
+        count = min(self.frames, self.capacity)
+        first = self.frames - count
+        rows = []
+        for frame in range(first, self.frames):
+            position = frame % self.capacity
+            rows.append([frame, self.frame_samples[position] * 1000] +
+                        [samples[position] * 1000 for samples in self.samples])
+        header = ["frame_number", "frame"] + self.sections
+
+        if path.endswith('.json'):
+            with open(path, 'w') as file:
+                json.dump({"stats": self.get_stats(), "columns": header, "frames": rows}, file)
+        else:
+            with open(path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(header)
+                writer.writerows(rows)
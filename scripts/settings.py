@@ -1,13 +1,64 @@
 SIZE = [1080, 720]
 NAME = "Coding Adventure"
-FPS = 0  # 0 - unlimited
+FPS = 0  # 0 - unlimited, used by 'continuous' scheduling
+SCHEDULING = 'idle'  # 'continuous' draws every frame, 'idle' sleeps until input, engine info or a timer
+ACTIVE_FPS = 60  # Frame cap in 'idle' scheduling while a piece is dragged or the view keeps changing
+IDLE_TIMEOUT = 1000  # Milliseconds, longest sleep in 'idle' scheduling
 COLORS = {
     "background": (75, 72, 71),
     "light_square": (238, 238, 210),
     "dark_square": (118, 150, 86),
     "check_highlight": (241, 151, 127),
+    "move_highlight": (186, 202, 68),
     "white_piece": (247, 247, 247),
     "black_piece": (44, 43, 41),
 }
+SPRITE_CACHE_DIR = 'cache/sprites'  # Rasterized sprite atlases, None disables the disk cache
 IMAGES = {'img/Pieces': ['r.svg', 'n.svg', 'b.svg', 'q.svg', 'k.svg', 'p.svg', 'R.svg', 'N.svg', 'B.svg', 'Q.svg', 'K.svg', 'P.svg']}
-ENGINE_PATH = 'engine/stockfish/stockfish-ubuntu-x86-64-avx2'
\ No newline at end of file
+ENGINE_PATH = 'engine/stockfish/stockfish-ubuntu-x86-64-avx2'
+ANALYSIS_TARGET_DEPTH = 25  # Evaluations at least this deep are final for the UI
+ANALYSIS_MAX_DEPTH = 244
+# Search of one position stops at whichever limit comes first, None disables a limit
+ANALYSIS_BUDGET_DEPTH = 30
+ANALYSIS_BUDGET_TIME = 20.0  # Seconds
+ANALYSIS_BUDGET_NODES = None
+ANALYSIS_MORE_DEPTH = 5  # Added to the budget of the current position by F7
+ANALYSIS_MORE_TIME = 10.0
+ANALYSIS_BACKGROUND = 'pause'  # 'pause' or 'continue' the search while the window is unfocused or minimized
+ANALYSIS_SERVICE_ENGINES = 2  # Engine processes shared by every board of an AnalysisService
+ANALYSIS_SERVICE_DEPTH = 18  # Depth of the searches of the shared service
+EVAL_CACHE_PATH = 'cache/evals.jsonl'
+EVAL_CACHE_SIZE = 100_000  # Positions kept in memory
+BOOK_PATH = 'books'  # Polyglot .bin file or directory of them, probed before the engine
+SYZYGY_PATH = 'syzygy'  # Directory of Syzygy .rtbw/.rtbz tables
+ANALYSIS_MULTI_PV = 3  # Best lines shown in the statistics panel
+ANALYSIS_WORKERS = 1  # Independent engine processes, more than one splits the root moves between them
+ENGINE_OPTIONS = {"Threads": 1, "Hash": 64}
+PROFILER_CAPACITY = 600  # Frames kept by the frame profiler
+PROFILE_DIR = 'profiles'  # cProfile captures and frame time exports
+
+# Game archive
+ARCHIVE_DIR = 'archive'  # None disables recording
+ARCHIVE_KEYFRAME_INTERVAL = 32  # Plies between position snapshots, only used for a new archive
+
+# Network play, see main.py --host/--join
+NETWORK_PORT = 8765
+NETWORK_PING_INTERVAL = 1.0  # Seconds between round trip measurements
+NETWORK_RECONNECT_DELAY = 0.25  # Seconds before the first reconnect, doubled up to 8 times that
+NETWORK_WRITE_BUFFER_LIMIT = 256 * 1024  # Bytes waiting for a player that stopped reading before it is dropped
+NETWORK_ABANDONED_TIMEOUT = 60.0  # Seconds an unfinished game nobody plays or watches is kept, e.g. for a reconnect
+BROADCAST_EVAL_RATE = 4.0  # Eval updates per second sent to spectators, newer ticks replace pending ones
+BROADCAST_QUEUE_LIMIT = 64  # Messages a spectator may fall behind before BROADCAST_SLOW_POLICY applies
+BROADCAST_SLOW_POLICY = 'skip'  # 'skip' ahead to the latest snapshot or 'drop' the spectator
+
+# Grid of watched games, see main.py --watch
+GRID_RENDERS_PER_FRAME = 16  # Changed boards rendered per frame, the others follow in the next frames
+GRID_WATCH_RETRY = 1.0  # Seconds before a game that does not exist yet is watched again, doubled up to 8 times that
+
+# Variation tree explorer, F9 - tree/board
+TREE_PV_PLIES = 12  # Moves of every engine line added to the tree
+TREE_ZOOM_STEP = 1.2  # Change of the camera distance per mouse wheel step
+TREE_PAN_SPEED = 0.8  # Screen widths per second with the arrow keys
+TREE_DETAIL_SPACING = 12  # Pixels between plies below which nodes are drawn as single pixels without edges
+TREE_LABEL_SPACING = 48  # Pixels between plies from which moves are labelled
+TREE_LAYOUT_INTERVAL = 0.5  # Seconds between layouts of a growing tree while it is shown
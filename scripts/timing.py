@@ -0,0 +1,44 @@
+import time
+
+
+def percentile(samples, p: float) -> float:
+    """Nearest-rank percentile (p in 0..100) of the samples, 0.0 if there are none"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples, scale: float = 1.0) -> dict:
+    """p50/p95/p99/max of the samples, multiplied by scale (e.g. 1000 for seconds -> ms)"""
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50) * scale,
+        "p95": percentile(samples, 95) * scale,
+        "p99": percentile(samples, 99) * scale,
+        "max": (max(samples) if samples else 0.0) * scale,
+    }
+
+
+class StartupReport:
+    """Durations of the startup steps, each mark() closes the step that started at the previous mark"""
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.steps = []  # (name, seconds)
+
+    def mark(self, name: str) -> None:
+        now = time.perf_counter()
+        self.steps.append((name, now - self.last))
+        self.last = now
+
+    def total(self) -> float:
+        return self.last - self.start
+
+    def format(self) -> str:
+        lines = [f"Startup {self.total() * 1000:.1f} ms"]
+        for name, seconds in self.steps:
+            lines.append(f"  {name:20} {seconds * 1000:8.1f} ms")
+        return "\n".join(lines)
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+
+import chess
+
+from scripts.analysis import AnalysisBudget, EngineManager
+from scripts.eval_cache import CachedEval, EvalCache, position_key
+
+FAKE_ENGINE = [sys.executable, os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'fake_uci_engine.py'), '5']
+
+
+def wait_idle(engine: EngineManager, timeout: float = 10.0) -> None:
+    deadline = time.perf_counter() + timeout
+    time.sleep(0.05)
+    while engine.is_searching():
+        assert time.perf_counter() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_budget_follows_the_submitted_position():
+    engine = EngineManager(FAKE_ENGINE, workers=1, budget=AnalysisBudget(depth=None, time=None, nodes=10_000))
+    try:
+        board = chess.Board()
+        engine.submit(board)
+        wait_idle(engine)
+        _, nodes = engine.position_spent
+        assert nodes >= 10_000
+
+        engine.request_more(depth=0, time=0.0, nodes=20_000)
+        wait_idle(engine)
+        assert engine.position_budget.nodes == 30_000
+        assert engine.position_spent[1] >= 30_000
+
+        # More time for the old position arrives after the new one was submitted, and is dropped
+        board.push_uci('e2e4')
+        engine.request_more(depth=0, time=0.0, nodes=1_000_000)
+        engine.submit(board)
+        wait_idle(engine)
+        assert engine.budget_board == board
+        assert engine.position_budget.nodes == 10_000
+        assert 10_000 <= engine.position_spent[1] < 30_000
+    finally:
+        engine.quit()
+
+
+def test_cached_eval_of_target_depth_is_not_searched_again():
+    cache = EvalCache(None)
+    board = chess.Board()
+    cache.put(position_key(board), CachedEval(cp=20, mate=None, depth=27, pv=['e2e4']))
+    engine = EngineManager(FAKE_ENGINE, cache=cache, workers=1, target_depth=25,
+                           budget=AnalysisBudget(depth=30, time=None, nodes=None))
+    try:
+        engine.submit(board)
+        wait_idle(engine)
+        assert engine.current_result.source == 'cache' and engine.current_depth == 27
+        assert engine.task is None
+
+        # Asking for more searches past the cached depth
+        engine.request_more(depth=5, time=0.0, nodes=0)
+        deadline = time.perf_counter() + 10.0
+        while engine.current_depth < 35:
+            assert time.perf_counter() < deadline, "timed out"
+            time.sleep(0.01)
+        assert engine.current_result.source == 'engine'
+    finally:
+        engine.quit()
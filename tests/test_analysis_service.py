@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+
+import chess
+
+from scripts.analysis_service import AnalysisService, PRIORITY_LIVE
+
+FAKE_ENGINE = [sys.executable, os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'fake_uci_engine.py'), '5']
+
+
+def wait_for(condition, timeout: float = 10.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_only_new_owners_coalesce():
+    service = AnalysisService(FAKE_ENGINE, engines=1, depth=40)
+    results = []
+    try:
+        board = chess.Board()
+        for owner in ('a', 'a', 'b', 'b'):
+            service.request(owner, board, PRIORITY_LIVE, lambda board, result: results.append(result))
+        wait_for(lambda: len(results) == 2)
+        stats = service.stats()
+        assert stats["requests"] == 4
+        assert stats["coalesced"] == 1
+        assert stats["searches"] == 1
+    finally:
+        service.close()
+
+
+def test_engine_start_failure_is_reported_at_once(tmp_path, capsys):
+    service = AnalysisService([str(tmp_path / 'missing-engine')], engines=1)
+    try:
+        wait_for(service.workers.done)
+        time.sleep(0.05)  # The callback runs right after the future is done
+        assert "Engine Error" in capsys.readouterr().out
+    finally:
+        service.close()
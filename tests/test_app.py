@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import chess
+import pygame
+import pytest
+
+import scripts.settings as s
+from scripts.app import App
+from scripts.game.move_tree import SOURCE_ENGINE
+from scripts.game.session import GameSession
+
+FAKE_ENGINE = [sys.executable, os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'fake_uci_engine.py')]
+PIECE_SVG = '<svg xmlns="http://www.w3.org/2000/svg" width="45" height="45"><circle cx="22" cy="22" r="18"/></svg>'
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """App in an empty directory, with placeholder pieces and the fake engine"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('img/Pieces')
+    for name in s.IMAGES['img/Pieces']:
+        with open(f'img/Pieces/{name}', 'w') as file:
+            file.write(PIECE_SVG)
+    monkeypatch.setattr(s, 'ENGINE_PATH', FAKE_ENGINE)
+    monkeypatch.setattr(s, 'SPRITE_CACHE_DIR', None)
+    monkeypatch.setattr(s, 'SCHEDULING', 'continuous')
+    app = App()
+    yield app
+    app.engine.quit()
+    pygame.quit()
+
+
+def run_until(app: App, condition, timeout: float = 10.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        app.update()
+
+
+def test_graph_ply_after_opening_a_tree_node(app):
+    app.board.set_session(GameSession())
+    for uci in ('e2e4', 'e7e5', 'g1f3'):
+        assert app.board.make_move(chess.Move.from_uci(uci))
+        app.update()
+    line = [chess.Move.from_uci(uci) for uci in ('e2e4', 'e7e5', 'b1c3', 'g8f6')]
+    node = app.tree.add_line(line, SOURCE_ENGINE)
+
+    app.toggle_tree()
+    app.open_tree_node(node)
+    run_until(app, lambda: len(app.statistics.history) == len(line) + 1)
+    assert app.board.session.ply == len(app.archive.get_moves(app.board.archive_game)) == len(line)
+
+    graph = app.statistics.eval_graph
+    position = (graph.rect.x + round(graph.x_of(2)), graph.rect.centery)
+    pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=position))
+    app.update()
+    assert app.replaying and app.replay.ply == 2
+    assert app.replay.board.get_board().fen() == app.tree.board_at(app.tree.find_line(line[:2])).fen()
+    assert app.statistics.selected_ply == 2
@@ -0,0 +1,55 @@
+import os
+
+import chess
+
+from scripts.game.archive import GameArchive, KEYFRAME, MOVE
+from scripts.game.session import EndResultState
+
+MOVES = [chess.Move.from_uci(uci) for uci in ('e2e4', 'e7e5', 'g1f3', 'b8c6', 'f1b5', 'a7a6', 'b5a4', 'g8f6')]
+
+
+def play(archive: GameArchive, moves) -> chess.Board:
+    board = chess.Board()
+    for move in moves:
+        board.push(move)
+        archive.append_move(move, board)
+    return board
+
+
+def test_moves_are_written_as_they_are_played(tmp_path):
+    archive = GameArchive(str(tmp_path), keyframe_interval=4)
+    archive.begin_game(chess.Board())
+    play(archive, MOVES[:5])
+    archive.pop_move()
+    # Data of the live game is on disk before the game ends, only the index record is missing
+    assert os.path.getsize(tmp_path / 'moves.bin') == 5 * MOVE.size
+    assert os.path.getsize(tmp_path / 'keyframes.bin') == 2 * KEYFRAME.size
+    assert len(GameArchive(str(tmp_path))) == 0
+
+    board = play(archive, MOVES[4:])
+    assert archive.end_game(EndResultState.ONGOING) == 0
+    assert archive.get_moves(0) == MOVES
+    assert archive.board_at(0, len(MOVES)) == board
+    archive.close()
+
+
+def test_games_follow_each_other(tmp_path):
+    archive = GameArchive(str(tmp_path), keyframe_interval=4)
+    archive.begin_game(chess.Board())
+    play(archive, MOVES)
+    archive.end_game(EndResultState.CHECKMATE, chess.WHITE)
+    assert archive.get_moves(0) == MOVES  # Maps the files
+    archive.begin_game(chess.Board())
+    play(archive, MOVES[:6])
+    archive.end_game()
+    assert archive.board_at(1, 6) == archive.board_at(0, 6)
+    archive.begin_game(chess.Board())
+    play(archive, MOVES[:3])
+    archive.close()
+
+    archive = GameArchive(str(tmp_path))
+    assert len(archive) == 3
+    assert archive.get_result(0) == (EndResultState.CHECKMATE, chess.WHITE)
+    assert archive.get_moves(1) == MOVES[:6]
+    assert archive.get_moves(2) == MOVES[:3]
+    archive.close()
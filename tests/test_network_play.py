@@ -0,0 +1,160 @@
+import os
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import chess
+import pygame
+import pytest
+
+from scripts.game.archive import GameArchive
+from scripts.game.board import Board
+from scripts.game.session import EndResultState, GameSession
+from scripts.network.client import GameClient
+from scripts.network.play import NetworkPlay
+from scripts.settings import COLORS
+from scripts.UI.sprites import SpriteAtlas
+
+
+@pytest.fixture(scope='module')
+def sprites():
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    atlas = SpriteAtlas(None)
+    surfaces = {}
+    for name in 'prnbqkPRNBQK':
+        surfaces[name] = pygame.Surface((45, 45), pygame.SRCALPHA)
+        pygame.draw.circle(surfaces[name], COLORS['white_piece' if name.isupper() else 'black_piece'], (22, 22), 18)
+    atlas.add_surfaces('Pieces', surfaces)
+    yield atlas
+    pygame.quit()
+
+
+MATE_IN_ONE = '6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1'
+
+
+def make_board(sprites, fen: str = chess.STARTING_FEN) -> Board:
+    board = Board(320, (0, 0), sprites)
+    board.set_session(GameSession(fen))
+    return board
+
+
+def pump(plays, condition, timeout: float = 5.0) -> None:
+    """Runs the frames' network updates until the condition holds"""
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        for play in plays:
+            play.update()
+        time.sleep(0.005)
+
+
+def start_host(board: Board) -> NetworkPlay:
+    client = GameClient('127.0.0.1', 0)
+    client.host_server('127.0.0.1', 0)
+    play = NetworkPlay(board, client, chess.WHITE)
+    pump([play], lambda: play.game_id is not None)
+    return play
+
+
+@pytest.fixture
+def host(sprites):
+    play = start_host(make_board(sprites))
+    yield play
+    play.close()
+
+
+def join(sprites, host: NetworkPlay) -> NetworkPlay:
+    play = NetworkPlay(make_board(sprites), GameClient('127.0.0.1', host.client.port), chess.BLACK, host.game_id)
+    pump([play], lambda: play.client.connects > 0 and play.client.connected)
+    return play
+
+
+def test_delta(sprites, host):
+    guest = join(sprites, host)
+    assert host.board.make_move(chess.Move.from_uci('e2e4'))
+    pump([host, guest], lambda: guest.board.session.ply == 1 and not host.pending)
+    assert guest.board.make_move(chess.Move.from_uci('e7e5'))
+    pump([host, guest], lambda: host.board.session.ply == 2 and not guest.pending)
+    assert host.board.get_board().fen() == guest.board.get_board().fen()
+    assert host.rejects == guest.rejects == 0
+    guest.close()
+
+
+def test_reject_rolls_back_and_resyncs(sprites, host):
+    server_fen = host.board.get_board().fen()
+    # The host's board drifts away from the server, so its next move does not match the server's checksum
+    host.board.set_session(GameSession('4k3/8/8/8/8/8/4P3/4K3 w - - 0 1'))
+    assert host.board.make_move(chess.Move.from_uci('e2e4'))
+    pump([host], lambda: host.rejects == 1)
+    assert not host.pending
+    assert host.resyncs == 1
+    assert host.board.get_board().fen() == server_fen
+
+
+def test_resync_when_joining_a_game_in_progress(sprites, host):
+    guest = join(sprites, host)
+    for play, uci in ((host, 'e2e4'), (guest, 'e7e5')):
+        assert play.board.make_move(chess.Move.from_uci(uci))
+        pump([host, guest], lambda: host.board.session.ply == guest.board.session.ply and not play.pending)
+    guest.close()
+    assert host.board.make_move(chess.Move.from_uci('g1f3'))
+    pump([host], lambda: not host.pending)
+
+    # A new board of the black player starts from the server's position
+    guest = join(sprites, host)
+    pump([guest], lambda: guest.resyncs == 1)
+    assert guest.board.session.ply == 3
+    assert guest.board.get_board().fen() == host.board.get_board().fen()
+    assert guest.board.make_move(chess.Move.from_uci('b8c6'))
+    pump([host, guest], lambda: host.board.session.ply == 4 and not guest.pending)
+    guest.close()
+
+
+def test_game_ending_move_is_archived_once_confirmed(sprites, tmp_path):
+    archive = GameArchive(str(tmp_path))
+    board = make_board(sprites, MATE_IN_ONE)
+    board.set_archive(archive)
+    host = start_host(board)
+    try:
+        # Rejected: the board drifted to a position the server does not have
+        board.set_session(GameSession(MATE_IN_ONE.replace('R5K1', 'R4K2')))
+        drifted = board.archive_game
+        assert board.make_move(chess.Move.from_uci('a1a8'))
+        assert board.session.is_over() and archive.is_live(drifted)
+        pump([host], lambda: host.rejects == 1)
+        assert archive.is_live(drifted) and archive.get_plies(drifted) == 0
+
+        # Confirmed: the server's delta ends the archived game
+        game = board.archive_game
+        assert board.make_move(chess.Move.from_uci('a1a8'))
+        assert archive.is_live(game)
+        pump([host], lambda: not host.pending)
+        assert not archive.is_live(game)
+        assert archive.get_moves(game) == [chess.Move.from_uci('a1a8')]
+    finally:
+        host.close()
+        archive.close()
+
+
+def test_resync_into_a_finished_game(sprites):
+    host = start_host(make_board(sprites, MATE_IN_ONE))
+    try:
+        assert host.board.make_move(chess.Move.from_uci('a1a8'))
+        pump([host], lambda: not host.pending)
+
+        guest = join(sprites, host)
+        pump([guest], lambda: guest.resyncs == 1)
+        assert guest.board.result == EndResultState.CHECKMATE
+        assert guest.board.winner_color == chess.WHITE
+        assert not guest.board.make_move(chess.Move.from_uci('g8h8'))
+        guest.close()
+    finally:
+        host.close()
+
+
+def test_session_from_state_takes_the_senders_result():
+    assert GameSession('R5k1/5ppp/8/8/8/8/8/6K1 b - - 1 1').result == EndResultState.CHECKMATE
+    session = GameSession.from_state({"fen": chess.STARTING_FEN, "ply": 8, "result": "THREEFOLD_REPETITION",
+                                      "winner": None})
+    assert session.is_over() and session.winner_color is None and session.ply == 8
@@ -0,0 +1,168 @@
+import asyncio
+
+import scripts.settings as s
+from scripts.analysis_service import PRIORITY_FOCUSED, PRIORITY_LIVE
+from scripts.network.protocol import encode, decode
+from scripts.network.server import GameServer
+
+MATE_IN_ONE = '6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1'
+
+
+async def connect(server: GameServer, *messages: dict):
+    reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+    for message in messages:
+        writer.write(encode(message))
+    await writer.drain()
+    return reader, writer
+
+
+async def receive(reader: asyncio.StreamReader) -> dict:
+    return decode(await asyncio.wait_for(reader.readline(), 2.0))
+
+
+def test_player_evals_are_rebuilt_for_spectators():
+    async def main():
+        server = GameServer('127.0.0.1', 0)
+        await server.start()
+        player, player_writer = await connect(server, {"type": "new", "color": "white"})
+        game_id = (await receive(player))["game"]
+        spectator, spectator_writer = await connect(server, {"type": "watch", "game": game_id})
+        assert (await receive(spectator))["type"] == "snapshot"
+
+        player_writer.write(encode({"type": "eval", "game": game_id, "ply": 0, "score": "0.3", "depth": 2.5}))
+        assert (await receive(player))["reason"] == "bad message"
+        player_writer.write(encode({"type": "eval", "game": game_id, "ply": 0, "score": "0.3", "depth": 12,
+                                    "source": "engine", "pv": ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5"],
+                                    "html": "<script>"}))
+        await player_writer.drain()
+        assert await receive(spectator) == {"type": "eval", "game": game_id, "ply": 0, "score": "0.3", "depth": 12,
+                                            "source": "engine", "pv": ["e2e4", "e7e5", "g1f3", "b8c6"]}
+        player_writer.close()
+        spectator_writer.close()
+        await server.close()
+
+    asyncio.run(main())
+
+
+def test_dropped_spectator_is_told_and_can_watch_again():
+    async def main():
+        server = GameServer('127.0.0.1', 0)
+        await server.start()
+        game_id = server.create_game()
+        channel = server.channels[game_id]
+        channel.slow_policy, channel.queue_limit = 'drop', 4
+        spectator, spectator_writer = await connect(server, {"type": "watch", "game": game_id})
+        assert (await receive(spectator))["type"] == "snapshot"
+
+        # More updates than the queue holds before the spectator's writer task runs
+        for _ in range(8):
+            channel.publish_move(encode({"type": "delta", "game": game_id}))
+        messages = [await receive(spectator) for _ in range(5)]
+        assert messages[-1] == {"type": "error", "game": game_id, "reason": "dropped"}
+        assert len(channel) == 0
+
+        spectator_writer.write(encode({"type": "watch", "game": game_id}))
+        assert (await receive(spectator))["type"] == "snapshot"
+        assert len(channel) == 1
+        spectator_writer.close()
+        await server.close()
+
+    asyncio.run(main())
+
+
+class RecordingAnalysis:
+    """Stands in for an AnalysisService, remembers the priority of every request"""
+
+    def __init__(self) -> None:
+        self.priorities = {}
+
+    def request(self, owner, board, priority, callback=None) -> None:
+        self.priorities[owner] = priority
+
+    def cancel(self, owner) -> None:
+        self.priorities.pop(owner, None)
+
+    def stats(self) -> dict:
+        return {}
+
+
+def test_focused_games_are_analysed_first():
+    async def main():
+        analysis = RecordingAnalysis()
+        server = GameServer('127.0.0.1', 0, analysis)
+        await server.start()
+        first, second = server.create_game(), server.create_game()
+        spectator, spectator_writer = await connect(server, {"type": "watch", "game": first},
+                                                    {"type": "watch", "game": second},
+                                                    {"type": "focus", "game": second})
+        for _ in range(2):
+            assert (await receive(spectator))["type"] == "snapshot"
+        assert analysis.priorities == {first: PRIORITY_LIVE, second: PRIORITY_FOCUSED}
+
+        spectator_writer.write(encode({"type": "focus", "game": None}))
+        spectator_writer.write(encode({"type": "stats"}))
+        await receive(spectator)
+        assert not server.focus_counts
+        server.request_analysis(second)
+        assert analysis.priorities[second] == PRIORITY_LIVE
+        spectator_writer.close()
+        await server.close()
+
+    asyncio.run(main())
+
+
+def test_games_nobody_plays_or_watches_are_evicted(monkeypatch):
+    monkeypatch.setattr(s, 'NETWORK_ABANDONED_TIMEOUT', 0.2)
+
+    async def main():
+        server = GameServer('127.0.0.1', 0)
+        await server.start()
+        player, player_writer = await connect(server, {"type": "new", "fen": MATE_IN_ONE})
+        finished = (await receive(player))["game"]
+        player_writer.write(encode({"type": "move", "game": finished, "move": "a1a8"}))
+        player_writer.write(encode({"type": "new"}))
+        assert (await receive(player))["result"] == "CHECKMATE"
+        abandoned = (await receive(player))["game"]
+        spectator, spectator_writer = await connect(server, {"type": "watch", "game": abandoned})
+        assert (await receive(spectator))["type"] == "snapshot"
+        assert len(server.stream_tasks) == 1
+
+        player_writer.close()
+        await asyncio.sleep(0.1)
+        assert finished not in server.sessions  # Over, gone as soon as its player left
+        assert abandoned in server.sessions  # Still watched
+
+        spectator_writer.write(encode({"type": "unwatch", "game": abandoned}))
+        await asyncio.sleep(0.1)
+        assert not server.stream_tasks
+        assert abandoned in server.sessions  # Kept a while for a reconnect
+        await asyncio.sleep(0.2)
+        assert not server.sessions
+        assert server.get_stats()["games_evicted"] == 2
+
+        spectator_writer.write(encode({"type": "join", "game": abandoned}))
+        assert (await receive(spectator))["reason"] == "unknown game"
+        spectator_writer.close()
+        await server.close()
+
+    asyncio.run(main())
+
+
+def test_returning_player_keeps_an_unfinished_game(monkeypatch):
+    monkeypatch.setattr(s, 'NETWORK_ABANDONED_TIMEOUT', 0.2)
+
+    async def main():
+        server = GameServer('127.0.0.1', 0)
+        await server.start()
+        player, player_writer = await connect(server, {"type": "new", "color": "white"})
+        game_id = (await receive(player))["game"]
+        player_writer.close()
+        await asyncio.sleep(0.1)
+        player, player_writer = await connect(server, {"type": "join", "game": game_id, "color": "white"})
+        assert (await receive(player))["type"] == "state"
+        await asyncio.sleep(0.2)
+        assert game_id in server.sessions
+        player_writer.close()
+        await server.close()
+
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+import os
+
+import chess
+import chess.engine
+
+from scripts.probe import PositionProbe, TABLEBASE_WIN_CP
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def make_probe() -> PositionProbe:
+    return PositionProbe(os.path.join(FIXTURES, 'book.bin'), os.path.join(FIXTURES, 'syzygy'))
+
+
+def test_book_hit_and_miss():
+    probe = make_probe()
+    result = probe.probe(chess.Board())
+    assert result.source == 'book'
+    assert [move.uci() for move in result.moves] == ['e2e4', 'd2d4']  # By weight
+    assert probe.probe(chess.Board('rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1')) is None
+    assert probe.stats()["book_hits"] == 1 and probe.stats()["misses"] == 1
+    probe.close()
+
+
+def test_tablebase_hit_and_miss():
+    probe = make_probe()
+    assert probe.max_pieces == 3
+    board = chess.Board('8/8/8/8/8/2k5/8/KQ6 w - - 0 1')
+    fen = board.fen()
+    result = probe.probe(board)
+    assert result.source == 'tablebase' and result.exact
+    assert result.moves[0] in board.legal_moves
+    assert TABLEBASE_WIN_CP - 100 < result.score.white().score() < TABLEBASE_WIN_CP
+    assert board.fen() == fen and not board.move_stack  # The board passed in is not touched
+
+    # Too many pieces for the KQvK table
+    assert probe.probe_tablebase(chess.Board('8/8/8/8/8/2k5/8/KQR5 w - - 0 1')) is None
+    probe.close()
+
+
+class CursedTablebase:
+    """Every position is a cursed win for the side to move, a blessed loss after any move"""
+
+    def get_wdl(self, board):
+        return 1 if board.turn == chess.WHITE else -1
+
+    def get_dtz(self, board):
+        return 120 if board.turn == chess.WHITE else -119
+
+
+def test_cursed_win_is_a_draw():
+    probe = PositionProbe(None, None)
+    probe.tablebase = CursedTablebase()
+    probe.max_pieces = 3
+    result = probe.probe_tablebase(chess.Board('8/8/8/8/8/2k5/8/KQ6 w - - 0 1'))
+    assert result.score.relative == chess.engine.Cp(0)
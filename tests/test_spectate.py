@@ -0,0 +1,36 @@
+import threading
+import time
+
+from scripts.game.session import EndResultState
+from scripts.network.client import GameClient
+from scripts.network.spectate import SpectatorFeed
+
+REPETITION = ['g1f3', 'g8f6', 'f3g1', 'f6g8'] * 2
+
+
+def test_snapshot_of_a_finished_game_keeps_its_result():
+    client = GameClient('127.0.0.1', 0)
+    server = client.host_server('127.0.0.1', 0)
+    created = threading.Event()
+
+    def play_game():
+        session = server.sessions[server.create_game()]
+        for uci in REPETITION:
+            session.push_uci(uci)
+        created.set()
+    client.loop.call_soon_threadsafe(play_game)
+    assert created.wait(2.0)
+
+    feed = SpectatorFeed(client, [1])
+    try:
+        deadline = time.perf_counter() + 5.0
+        while feed.games[1].session is None:
+            assert time.perf_counter() < deadline, "timed out"
+            feed.update()
+            time.sleep(0.01)
+        # The position alone is the start position, only the snapshot knows the repetition
+        session = feed.games[1].session
+        assert session.result == EndResultState.THREEFOLD_REPETITION
+        assert session.ply == len(REPETITION)
+    finally:
+        feed.close()
@@ -0,0 +1,28 @@
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+import pytest
+
+from scripts.camera import Camera
+from scripts.game.tree_explorer import TreeExplorer, MIN_DISTANCE, MAX_DISTANCE
+
+
+@pytest.fixture
+def explorer(monkeypatch):
+    pygame.init()
+    monkeypatch.setattr(pygame.mouse, 'get_pos', lambda: (300, 200))
+    yield TreeExplorer(400, pygame.Vector2(0, 0), Camera(x=-1, y=-8, distance=16, resolution=(400, 400)))
+    pygame.quit()
+
+
+@pytest.mark.parametrize('wheel, limit', [(50, MIN_DISTANCE), (-80, MAX_DISTANCE)])
+def test_wheel_zoom_stops_at_the_limits_without_moving_the_anchor(explorer, wheel, limit):
+    camera = explorer.camera
+    anchor = camera.get_global_point(300, 200)
+    for _ in range(3):
+        explorer.handle_event(pygame.event.Event(pygame.MOUSEWHEEL, x=0, y=wheel))
+        explorer.update(1 / 60)
+        assert camera.distance == pytest.approx(limit)
+        assert camera.get_global_point(300, 200) == pytest.approx(anchor)